@@ -1,55 +1,49 @@
 #!/usr/bin/env python3
+import contextlib
 import datetime
-import io
+import gzip
+import hashlib
 import json
+import logging
+import math
 import os
 import re
 import secrets
+import threading
+import time
 import uuid
-from typing import Dict, List
+from typing import Dict, List, Optional
 from dataclasses import dataclass
 from pathlib import Path
 
 import boto3
+import botocore.exceptions
 import dtale.global_state
 import pandas as pd
+import redis
 import yaml
 from dtale.app import build_app
-from dtale.views import startup
-from flask import abort, flash, render_template, redirect, request, url_for, send_from_directory
+from flask import (Blueprint, Response, abort, current_app, flash, jsonify, render_template, redirect, request, url_for,
+                   send_from_directory, stream_with_context)
 from flask_login import UserMixin, LoginManager, login_user, login_required, logout_user, current_user
 from flask_wtf import FlaskForm
+from otokuna.analysis import make_results_dataframe, make_top_deals
+from otokuna.dumping import normalize_search_url
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
 from wtforms import StringField, PasswordField, BooleanField
 from wtforms.validators import InputRequired
 
+from catalog import JobCatalog, Submission
+from framestore import FrameStore
+from prefetch import Prefetcher
+from query import QueryError, ResultsQuery
+from instances import DtaleInstances
+from jobstatus import TERMINAL_STATUSES, JobStatusTracker
+from s3cache import S3ObjectCache
 from state import AppRedis
 
 
-@dataclass
-class JobInfo:
-    job_id: str
-    user_id: str
-    timestamp: float
-    search_url: str
-    search_conditions: str
-    raw_data_key: str
-    scraped_data_key: str
-    prediction_data_key: str
-
-    _JST = datetime.timezone(datetime.timedelta(seconds=32400), 'JST')
-
-    @classmethod
-    def json_loads(cls, bytes_or_str):
-        return cls(**json.loads(bytes_or_str))
-
-    @property
-    def datetime_jst_formatted(self):
-        d = datetime.datetime.fromtimestamp(self.timestamp, tz=self._JST)
-        return d.strftime("%Y-%m-%d %H:%M:%S")
-
-
 @dataclass
 class Config:
     """Parameters from configuration file"""
@@ -66,6 +60,34 @@ class Config:
     predictions_key_prefix: str
     prediction_key_template: str
     prediction_key_pattern: str
+    results_key_template: str = "{}/results.pickle"  # relative to predictions_key_prefix
+    top_deals_key_template: str = "{}/top_deals.json"  # relative to predictions_key_prefix
+    # Local disk cache of the S3 objects
+    s3_cache_dir: str = "/tmp/otokuna_s3_cache"
+    s3_cache_max_bytes: int = 2 * 1024 ** 3
+    # Store of the joined dataframes
+    frames_max_bytes: int = 4 * 1024 ** 3
+    frames_eviction_policy: str = "lru"  # or "lfu"
+    # Dtale instances
+    dtale_instances_ttl: int = 6 * 3600  # seconds
+    dtale_instances_max: int = 20
+    # Listing of the daily predictions
+    daily_listing_ttl: int = 60  # seconds
+    # Catalog of the jobs of the custom requests
+    job_catalog_file: str = "/tmp/otokuna_job_catalog.db"
+    job_catalog_sync_ttl: int = 3600  # seconds (the jobs submitted by the app are added as they finish)
+    jobs_per_page: int = 20
+    # Reuse of the jobs of identical searches
+    job_reuse_max_age: int = 3600  # seconds, 0 disables the reuse
+    # Status of the jobs submitted by the app
+    sfn_endpoint_url: Optional[str] = None  # e.g. of a Step Functions Local stand-in
+    job_status_ttl: int = 5  # seconds
+    job_status_max_age: int = 24 * 3600  # seconds, the submissions older than this are not tracked
+    job_events_interval: float = 2  # seconds between the checks of a job events stream
+    job_events_max_duration: int = 60  # seconds, after which the browser reconnects
+    # Background prefetch of the latest daily prediction
+    prefetch_interval: int = 300  # seconds
+    prefetch_webhook_token: Optional[str] = None  # the webhook is disabled if not set
 
     @classmethod
     def load_from_yaml(cls, filename=None):
@@ -75,30 +97,136 @@ class Config:
         return cls(**config_dict)
 
 
-CONFIG = Config.load_from_yaml()
 BASE_PATH = Path(__file__).parent
 TEMPLATES_PATH = BASE_PATH / "templates"
-BUCKET = boto3.resource("s3").Bucket(CONFIG.bucket_name)
 ISO_DATETIMES_KEY = "iso_datetimes"
-DATAFRAMES_KEY = "dataframes"
-JOB_INFO_KEYS_KEY = "job_info_keys"
-JOB_INFO_KEY = "job_info"
-
-app = build_app(reaper_on=False, additional_templates=TEMPLATES_PATH)
-
-# Set up redis data stores
-# There are two instances of redis:
-# The first is internal to Dtale and the second is an extra instance
-# we provision to handle additional app state. We don't reuse the Dtale
-# internal instance because it has modifications specific to Dtale
-# internals which make it difficult for general usage.
-os.makedirs(CONFIG.dtale_state_dir, exist_ok=True)
-dtale.global_state.use_redis_store(CONFIG.dtale_state_dir)
-REDIS_DB = AppRedis(CONFIG.app_db_file)
-
-app.secret_key = CONFIG.secret_key
+DATAFRAMES_KEY = "frames"  # metadata of the frames in FRAME_STORE
+DTALE_INSTANCES_KEY = "dtale_instances"
+DAILY_LISTING_KEY = "daily_listing"
+TOP_DEALS_KEY = "top_deals"  # top deals tables by date or job_id
+
+logger = logging.getLogger(__name__)
+views = Blueprint("views", __name__)
 login_manager = LoginManager()
-login_manager.init_app(app)
+
+# Set up by create_app
+CONFIG: Optional[Config] = None
+REDIS_DB: Optional[AppRedis] = None
+FRAME_STORE: Optional[FrameStore] = None
+DTALE_INSTANCES: Optional[DtaleInstances] = None
+JOB_CATALOG: Optional[JobCatalog] = None
+JOB_STATUS: Optional[JobStatusTracker] = None
+S3_CACHE: Optional[S3ObjectCache] = None
+PREFETCHER: Optional[Prefetcher] = None
+USERS_BY_ID: Dict[str, "User"] = {}
+USERS_BY_ALTERNATIVE_ID: Dict[str, "User"] = {}
+
+
+def per_process(factory):
+    """Make a function that calls `factory` on its first call in each process
+    and returns the same object afterwards.
+
+    The boto3 sessions, clients and resources must not be shared across forks
+    (e.g. the gunicorn workers forked from the preloaded app), so they are
+    created lazily in the process that uses them.
+    """
+    lock = threading.Lock()
+    instances = {}  # pid -> object
+
+    def get():
+        pid = os.getpid()
+        if pid not in instances:
+            with lock:
+                if pid not in instances:
+                    instances.clear()  # e.g. the one inherited from the parent
+                    instances[pid] = factory()
+        return instances[pid]
+
+    return get
+
+
+s3_bucket = per_process(lambda: boto3.session.Session().resource("s3").Bucket(CONFIG.bucket_name))
+sfn_client = per_process(lambda: boto3.session.Session().client("stepfunctions", region_name=CONFIG.sfn_region_name,
+                                                                  endpoint_url=CONFIG.sfn_endpoint_url))
+
+
+@contextlib.contextmanager
+def log_duration(step):
+    start = time.perf_counter()
+    yield
+    logger.info("%s took %.3fs", step, time.perf_counter() - start)
+
+
+def start_redis(start, attempts=3):
+    """Call `start` (that starts a redislite server), retrying if the
+    connection is refused: the socket file may appear before the server
+    accepts connections, and redislite only retries while it is loading.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return start()
+        except redis.exceptions.ConnectionError:
+            if attempt == attempts:
+                raise
+            logger.warning("Could not connect to the redis server (attempt %d/%d)", attempt, attempts)
+            time.sleep(0.1)
+
+
+def create_app(config: Optional[Config] = None):
+    """Create the app (Dtale and the views of this app) and set up its state.
+
+    Nothing is set up at import time, so e.g. gunicorn can load the app with
+    `gunicorn "app:create_app()"`. The AWS clients are created lazily (see
+    per_process), so the app can be preloaded before forking the workers.
+    """
+    global CONFIG, REDIS_DB, FRAME_STORE, DTALE_INSTANCES, JOB_CATALOG, JOB_STATUS, S3_CACHE, PREFETCHER, \
+        USERS_BY_ID, USERS_BY_ALTERNATIVE_ID
+    # Under gunicorn, log to its error log
+    gunicorn_logger = logging.getLogger("gunicorn.error")
+    if gunicorn_logger.handlers and not logging.getLogger().handlers:
+        logging.getLogger().handlers = gunicorn_logger.handlers
+        logging.getLogger().setLevel(gunicorn_logger.level)
+
+    start = time.perf_counter()
+    with log_duration("Loading the config"):
+        CONFIG = config or Config.load_from_yaml()
+
+    with log_duration("Building the Dtale app"):
+        app = build_app(reaper_on=False, additional_templates=TEMPLATES_PATH)
+
+    # Set up redis data stores
+    # There are two instances of redis:
+    # The first is internal to Dtale and the second is an extra instance
+    # we provision to handle additional app state. We don't reuse the Dtale
+    # internal instance because it has modifications specific to Dtale
+    # internals which make it difficult for general usage.
+    with log_duration("Starting the redis servers"):
+        os.makedirs(CONFIG.dtale_state_dir, exist_ok=True)
+        start_redis(lambda: dtale.global_state.use_redis_store(CONFIG.dtale_state_dir))
+        REDIS_DB = start_redis(lambda: AppRedis(CONFIG.app_db_file))
+
+    with log_duration("Setting up the app state"):
+        # The joined dataframes are shared by the workers as memory-mapped files
+        FRAME_STORE = FrameStore(os.path.join(CONFIG.dtale_state_dir, "frames"), REDIS_DB, key=DATAFRAMES_KEY,
+                                 max_bytes=CONFIG.frames_max_bytes, policy=CONFIG.frames_eviction_policy)
+        # Dtale instances are reused across visits (and workers) and reaped when idle
+        DTALE_INSTANCES = DtaleInstances(REDIS_DB, key=DTALE_INSTANCES_KEY,
+                                         ttl=CONFIG.dtale_instances_ttl, max_instances=CONFIG.dtale_instances_max)
+        JOB_CATALOG = JobCatalog(CONFIG.job_catalog_file, sync_ttl=CONFIG.job_catalog_sync_ttl)
+        JOB_STATUS = JobStatusTracker(sfn_client, JOB_CATALOG, REDIS_DB, ttl=CONFIG.job_status_ttl)
+        S3_CACHE = S3ObjectCache(CONFIG.s3_cache_dir, CONFIG.s3_cache_max_bytes, REDIS_DB)
+        # Started in each worker by the post_worker_init hook of gunicorn.conf.py
+        PREFETCHER = Prefetcher(prefetch_latest_daily, REDIS_DB, interval=CONFIG.prefetch_interval)
+        USERS_BY_ID, USERS_BY_ALTERNATIVE_ID = generate_users(CONFIG)
+
+    app.secret_key = CONFIG.secret_key
+    login_manager.init_app(app)
+    # Dtale overrides its root route only for the routes added with app.route,
+    # so we remove it before registering ours
+    app._override_routes("/")
+    app.register_blueprint(views)
+    logger.info("Created the app in %.3fs", time.perf_counter() - start)
+    return app
 
 
 class CustomRequestForm(FlaskForm):
@@ -141,29 +269,25 @@ def generate_users(config: Config):
     return users_by_id, users_by_alternative_id
 
 
-USERS_BY_ID, USERS_BY_ALTERNATIVE_ID = generate_users(CONFIG)
-
-
 def download_dataframe(key):
-    with io.BytesIO() as stream:
-        BUCKET.download_fileobj(Key=key, Fileobj=stream)
-        stream.seek(0)
-        df = pd.read_pickle(stream)
+    with S3_CACHE.open(s3_bucket(), key) as file:
+        df = pd.read_pickle(file)
     return df
 
 
-def join_dataframes(scraped_df, prediction_df):
-    # Add score column
-    prediction_df = prediction_df.assign(otokuna_score=lambda df_: df_.y_pred / df_.y)
-    # Join data
-    df = prediction_df.join(scraped_df)
-    df.sort_values(by="otokuna_score", ascending=False, inplace=True)
-    # Rename columns to more readable names
-    df.rename(
-        inplace=True,
-        columns={"y": "monthly_cost", "y_pred": "monthly_cost_predicted"}
-    )
-    return df
+def download_json(key):
+    with S3_CACHE.open(s3_bucket(), key) as file:
+        return json.load(file)
+
+
+def download_if_exists(download, key):
+    """Call download(key), returning None if the object does not exist."""
+    try:
+        return download(key)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
 
 
 # TODO: Retire this method once that daily jobs are
@@ -171,31 +295,113 @@ def join_dataframes(scraped_df, prediction_df):
 def load_data_daily(date):
     if not REDIS_DB.hexists(ISO_DATETIMES_KEY, date):
         abort(404)
-    if REDIS_DB.hexists(DATAFRAMES_KEY, date):
-        return REDIS_DB.hget(DATAFRAMES_KEY, date)
-    # Get scraped data
+    df = FRAME_STORE.get(date)
+    if df is not None:
+        return df
     iso_datetime = REDIS_DB.hget(ISO_DATETIMES_KEY, date)
-    key = os.path.join(CONFIG.scraped_data_key_prefix, CONFIG.scraped_data_key_template).format(iso_datetime)
-    scraped_df = download_dataframe(key)
-    # Get prediction data
-    key = os.path.join(CONFIG.predictions_key_prefix, CONFIG.prediction_key_template).format(iso_datetime)
-    prediction_df = download_dataframe(key.format(iso_datetime))
-    df = join_dataframes(scraped_df, prediction_df)
-    REDIS_DB.hset(DATAFRAMES_KEY, date, df)
+    # Get results data
+    key = os.path.join(CONFIG.predictions_key_prefix, CONFIG.results_key_template).format(iso_datetime)
+    df = download_if_exists(download_dataframe, key)
+    if df is None:  # the runs that predate the results dataframe
+        # Get scraped data
+        key = os.path.join(CONFIG.scraped_data_key_prefix, CONFIG.scraped_data_key_template).format(iso_datetime)
+        scraped_df = download_dataframe(key)
+        # Get prediction data
+        key = os.path.join(CONFIG.predictions_key_prefix, CONFIG.prediction_key_template).format(iso_datetime)
+        prediction_df = download_dataframe(key.format(iso_datetime))
+        df = make_results_dataframe(scraped_df, prediction_df)
+    FRAME_STORE.put(date, df)
     return df
 
 
 def load_data(job_id):
-    if REDIS_DB.hexists(DATAFRAMES_KEY, job_id):
-        return REDIS_DB.hget(DATAFRAMES_KEY, job_id)
-    job_info = REDIS_DB.hget(JOB_INFO_KEY, job_id)
-    scraped_df = download_dataframe(job_info.scraped_data_key)
-    prediction_df = download_dataframe(job_info.prediction_data_key)
-    df = join_dataframes(scraped_df, prediction_df)
-    REDIS_DB.hset(DATAFRAMES_KEY, job_id, df)
+    df = FRAME_STORE.get(job_id)
+    if df is not None:
+        return df
+    job_info = JOB_CATALOG.get(job_id)
+    if job_info.results_data_key is not None:
+        df = download_dataframe(job_info.results_data_key)
+    else:  # the jobs that predate the results dataframe
+        scraped_df = download_dataframe(job_info.scraped_data_key)
+        prediction_df = download_dataframe(job_info.prediction_data_key)
+        df = make_results_dataframe(scraped_df, prediction_df)
+    FRAME_STORE.put(job_id, df)
     return df
 
 
+def load_top_deals(name):
+    """Load the top deals tables of a daily prediction (by date) or a job.
+
+    These are made by the pipeline next to the results, but they are made
+    here from the results for the predictions that predate them. Either way
+    they are cached in redis until the prediction changes.
+    """
+    if REDIS_DB.hexists(ISO_DATETIMES_KEY, name):
+        version = REDIS_DB.hget(ISO_DATETIMES_KEY, name)
+        key = os.path.join(CONFIG.predictions_key_prefix, CONFIG.top_deals_key_template).format(version)
+        load = load_data_daily
+    else:
+        job_info = JOB_CATALOG.get(name)
+        if job_info is None:
+            abort(404)
+        version = job_info.prediction_data_key
+        key = job_info.top_deals_data_key
+        load = load_data
+    cached = REDIS_DB.hget(TOP_DEALS_KEY, name)
+    if cached is not None and cached["version"] == version:
+        return cached["top_deals"]
+    top_deals = download_if_exists(download_json, key) if key is not None else None
+    if top_deals is None:
+        top_deals = make_top_deals(load(name))
+    REDIS_DB.hset(TOP_DEALS_KEY, name, {"version": version, "top_deals": top_deals})
+    return top_deals
+
+
+def refresh_prediction_dates(force=False):
+    """Add the dates of the new daily predictions to ISO_DATETIMES_KEY.
+
+    Only the keys after the last matched prediction key are listed, since S3
+    lists the keys in lexicographical order and the iso datetimes of the newer
+    predictions sort after the older ones. The other keys (e.g. the other files
+    of a prediction) are not remembered, since a prediction may be written
+    after the files of its folder that sort after it. The listing is skipped if
+    it was refreshed less than daily_listing_ttl seconds ago, unless forced.
+    """
+    listing = REDIS_DB.hget(DAILY_LISTING_KEY, "state") or {"last_key": None, "refreshed_at": 0}
+    if not force and time.time() - listing["refreshed_at"] < CONFIG.daily_listing_ttl:
+        return
+    refreshed_at = time.time()
+
+    pattern = os.path.join(CONFIG.predictions_key_prefix, CONFIG.prediction_key_pattern)
+    last_key = listing["last_key"]
+    kwargs = {"StartAfter": last_key} if last_key else {}
+    bucket = s3_bucket()
+    paginator = bucket.meta.client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket.name, Prefix=CONFIG.predictions_key_prefix, **kwargs):
+        for obj in page.get("Contents", []):
+            match = re.match(pattern, obj["Key"])
+            if match is None:  # e.g. other files of the prediction
+                continue
+            last_key = obj["Key"]
+            iso = match.group(1)
+            # NOTE: we assume there is exactly one datetime for each date.
+            # If two or more datetimes for the same date the latest will be kept.
+            REDIS_DB.hset(ISO_DATETIMES_KEY, iso2date(iso), iso)
+    REDIS_DB.hset(DAILY_LISTING_KEY, "state", {"last_key": last_key, "refreshed_at": refreshed_at})
+
+
+def prefetch_latest_daily():
+    """Build the frame of the latest daily prediction ahead of its first visit."""
+    refresh_prediction_dates(force=True)
+    dates = [key.decode() for key in REDIS_DB.hkeys(ISO_DATETIMES_KEY)]
+    if not dates:
+        return
+    latest_date = max(dates)
+    FRAME_STORE.set_pinned([latest_date])
+    if latest_date not in FRAME_STORE:
+        load_data_daily(latest_date)
+
+
 def iso2date(iso: str) -> str:
     # e.g. 2021-02-11T12:00:15+00:00 -> 2021-02-11
     return datetime.datetime.fromisoformat(iso).strftime("%Y-%m-%d")
@@ -226,137 +432,284 @@ def public_endpoint(function):
     return function
 
 
-@app.route("/login", methods=("GET", "POST"))
+@views.route("/login", methods=("GET", "POST"))
 @public_endpoint
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for("index"))
+        return redirect(url_for("views.index"))
 
     form = LoginForm()
     if form.validate_on_submit():
         user = load_user_by_id(form.user_id.data)
         if not user or not check_password_hash(user.password_hash, form.password.data):
             flash("Please check your login details and try again.")
-            return redirect(url_for("login"))
+            return redirect(url_for("views.login"))
 
         login_user(user, remember=form.remember_me.data)
-        return redirect(url_for("index"))
+        return redirect(url_for("views.index"))
 
     return render_template("login.html", form=form)
 
 
-@app.route("/logout")
+@views.route("/logout")
 @login_required
 def logout():
     logout_user()
     flash("You just logged out.")
-    return redirect(url_for("login"))
+    return redirect(url_for("views.login"))
 
 
 @login_manager.unauthorized_handler
 def unauthorized_handler():
-    return redirect(url_for("login"))
+    return redirect(url_for("views.login"))
 
 
-@app.before_request
+@views.before_app_request
 def check_valid_login():
     # From https://stackoverflow.com/a/52572337
     if (
         request.endpoint is None  # e.g. from "Refresh list" button
         or request.endpoint.startswith('static/')
         or current_user.is_authenticated
-        or getattr(app.view_functions[request.endpoint], "is_public", False)
+        or getattr(current_app.view_functions[request.endpoint], "is_public", False)
     ):
         return  # Access granted
     return render_template("login.html", form=LoginForm())
 
 
-@app.route("/")
+@views.route("/")
 @login_required
 def index():
     return render_template("index.html")
 
 
-@app.route("/daily", methods=("GET", "POST"))
+@views.route("/daily", methods=("GET", "POST"))
 @login_required
 def index_daily():
-    prediction_objects = BUCKET.objects.iterator(Prefix=CONFIG.predictions_key_prefix)
-    pattern = os.path.join(CONFIG.predictions_key_prefix, CONFIG.prediction_key_pattern)
-    prediction_iso_datetimes = sorted(re.match(pattern, obj.key).group(1)
-                                      for obj in prediction_objects)
-    prediction_dates = []
-    for iso in prediction_iso_datetimes:
-        date = iso2date(iso)
-        # NOTE: we assume there is exactly one datetime for each date.
-        # If two or more datetimes for the same date the latest will be kept.
-        REDIS_DB.hset(ISO_DATETIMES_KEY, date, iso)
-        prediction_dates.append(date)
+    # The POST comes from the "Refresh dates" button
+    refresh_prediction_dates(force=request.method == "POST")
+    prediction_dates = sorted(key.decode() for key in REDIS_DB.hkeys(ISO_DATETIMES_KEY))
+    # The latest result is the most visited, so it is never evicted
+    FRAME_STORE.set_pinned(prediction_dates[-1:])
     return render_template("index_daily.html", prediction_dates=prediction_dates)
 
 
 # TODO: Retire this method once that daily jobs are
 #   handled the same way as user requested jobs
-@app.route("/daily/prediction/<date>")
+@views.route("/daily/prediction/<date>")
 def load_daily_prediction(date):
-    df = load_data_daily(date)
-    data_id = uuid.uuid4().int
-    _ = startup(data_id=data_id,
-                data=df,
-                name=date,
-                ignore_duplicate=True,
-                allow_cell_edits=False,
-                inplace=True)
+    if not REDIS_DB.hexists(ISO_DATETIMES_KEY, date):
+        abort(404)
+    data_id = DTALE_INSTANCES.get_or_start(date2dataid(date),
+                                           version=REDIS_DB.hget(ISO_DATETIMES_KEY, date),
+                                           load_data=lambda: load_data_daily(date),
+                                           name=date)
     return redirect(url_for("dtale.view_iframe", data_id=data_id))
 
 
-@app.route("/custom_request", methods=("GET", "POST"))
+@views.route("/top_deals/<name>")
+def show_top_deals(name):
+    """The top deals of a daily prediction (by date, or "latest") or a job, by ward and by number of rooms."""
+    refresh_prediction_dates()
+    if name == "latest":
+        dates = [key.decode() for key in REDIS_DB.hkeys(ISO_DATETIMES_KEY)]
+        if not dates:
+            abort(404)
+        name = max(dates)
+    top_deals = load_top_deals(name)
+    columns = top_deals["columns"]
+    groups = {column: {key: [dict(zip(columns, row)) for row in rows] for key, rows in groups_.items()}
+              for column, groups_ in top_deals["groups"].items()}
+    job_info = JOB_CATALOG.get(name)
+    title = job_info.search_conditions if job_info is not None else name
+    return render_template("top_deals.html", name=name, title=title, n=top_deals["n"], groups=groups)
+
+
+@views.route("/custom_request", methods=("GET", "POST"))
 @login_required
 def index_custom_request():
-    # TODO: the job info should be in a DB an the app should query that DB
-    for obj in BUCKET.objects.iterator(Prefix="jobs"):
-        if not obj.key.endswith("job_info.json") or REDIS_DB.sismember(JOB_INFO_KEYS_KEY, obj.key):
-            continue
-        job_info = JobInfo.json_loads(obj.get()["Body"].read())
-        REDIS_DB.sadd(JOB_INFO_KEYS_KEY, obj.key)
-        REDIS_DB.hset(JOB_INFO_KEY, job_info.job_id, job_info)
-    jobs = sorted(REDIS_DB.hvals(JOB_INFO_KEY), key=lambda job: (job.timestamp, job.user_id))
-    return render_template("index_custom_request.html", jobs=jobs, form=CustomRequestForm())
-
-
-@app.route("/prediction/<job_id>")
+    # The POST comes from the "Refresh table" button
+    JOB_CATALOG.sync(s3_bucket(), prefix="jobs", force=request.method == "POST")
+    user_id = request.args.get("user_id") or None
+    page = max(request.args.get("page", 1, type=int), 1)
+    pending, failed = JOB_STATUS.poll(s3_bucket(), since=time.time() - CONFIG.job_status_max_age)
+    jobs, n_jobs = JOB_CATALOG.query(user_id=user_id, page=page, per_page=CONFIG.jobs_per_page)
+    n_pages = max(math.ceil(n_jobs / CONFIG.jobs_per_page), 1)
+    return render_template("index_custom_request.html", jobs=jobs, form=CustomRequestForm(),
+                           page=page, n_pages=n_pages, user_id=user_id, user_ids=JOB_CATALOG.user_ids(),
+                           pending=[(submission, status) for submission, status in pending if status != "SUCCEEDED"],
+                           failed=failed)
+
+
+@views.route("/custom_request/events")
+def custom_request_events():
+    """Server-Sent Events stream of the status of the pending jobs.
+
+    Sends a "status" event with the statuses of the pending jobs (by job_id)
+    whenever they change (the failed jobs are dropped from them), and a "done"
+    event when no job is running anymore.
+    The stream ends after job_events_max_duration seconds and the browser
+    reconnects by itself (EventSource).
+    """
+    def events():
+        yield f"retry: {int(CONFIG.job_events_interval * 1000)}\n\n"
+        deadline = time.monotonic() + CONFIG.job_events_max_duration
+        last_statuses = None
+        while time.monotonic() < deadline:
+            pending, _ = JOB_STATUS.poll(s3_bucket(), since=time.time() - CONFIG.job_status_max_age)
+            statuses = {submission.job_id: status for submission, status in pending}
+            if statuses != last_statuses:
+                yield f"event: status\ndata: {json.dumps(statuses)}\n\n"
+                last_statuses = statuses
+            if all(status in TERMINAL_STATUSES for status in statuses.values()):
+                yield "event: done\ndata: {}\n\n"
+                return
+            time.sleep(CONFIG.job_events_interval)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})  # no buffering in nginx
+
+
+@views.route("/prediction/<job_id>")
 def load_prediction(job_id):
-    job_info = REDIS_DB.hget(JOB_INFO_KEY, job_id)
-    data_id = uuid.UUID(job_id).int
-    _ = startup(data_id=data_id,
-                data=load_data(job_id),
-                name=job_info.search_conditions,
-                ignore_duplicate=True,
-                allow_cell_edits=False,
-                inplace=True)
+    job_info = JOB_CATALOG.get(job_id)
+    if job_info is None:
+        abort(404)
+    data_id = DTALE_INSTANCES.get_or_start(uuid.UUID(job_id).int,
+                                           version=job_info.prediction_data_key,
+                                           load_data=lambda: load_data(job_id),
+                                           name=job_info.search_conditions)
     return redirect(url_for("dtale.view_iframe", data_id=data_id))
 
 
-@app.route("/custom_request/submit", methods=("POST",))
+def find_reusable_job(search_url):
+    """Find a job of an identical search started within job_reuse_max_age seconds.
+
+    Returns the newest finished job, or, if there is none, the newest
+    submission whose execution is still running (and that we can attach to),
+    or None if the search has to be submitted.
+    """
+    since = time.time() - CONFIG.job_reuse_max_age
+    JOB_CATALOG.sync(s3_bucket(), prefix="jobs")
+    job_info = JOB_CATALOG.latest_job(search_url, since)
+    if job_info is not None:
+        return job_info
+    submissions = JOB_CATALOG.pending_submissions(search_url, since)
+    statuses = JOB_STATUS.statuses(submissions)
+    for submission in submissions:
+        if statuses[submission.job_id] == "RUNNING":
+            return submission
+        if statuses[submission.job_id] == "SUCCEEDED":  # but not in the catalog yet
+            job_info = JOB_CATALOG.sync_job(s3_bucket(), submission.job_id)
+            if job_info is not None:
+                return job_info
+    return None
+
+
+@views.route("/custom_request/submit", methods=("POST",))
 def submit_custom_request():
     form = CustomRequestForm()
     assert form.validate_on_submit()
-    input_data = {
-        "user_id": current_user.id,
-        "search_url": form.search_url.data
-    }
-    boto3.client("stepfunctions", region_name=CONFIG.sfn_region_name).start_execution(
-        stateMachineArn=CONFIG.sfn_arn,
-        input=json.dumps(input_data),
-    )
-    return render_template("request_submitted.html")
+    search_url = normalize_search_url(form.search_url.data)
+    # Serialize the submissions of the same search, so identical
+    # searches submitted at the same time start a single job
+    search_hash = hashlib.sha256(search_url.encode()).hexdigest()
+    with REDIS_DB.lock(f"submit_lock:{search_hash}", timeout=60):
+        job = find_reusable_job(search_url) if CONFIG.job_reuse_max_age > 0 else None
+        if job is None:
+            job_id = str(uuid.uuid4())
+            input_data = {
+                "job_id": job_id,
+                "user_id": current_user.id,
+                "search_url": search_url
+            }
+            response = sfn_client().start_execution(
+                stateMachineArn=CONFIG.sfn_arn,
+                name=job_id,
+                input=json.dumps(input_data),
+            )
+            JOB_CATALOG.add_submission(Submission(job_id, current_user.id, search_url,
+                                                  response["executionArn"], time.time()))
+    return render_template("request_submitted.html", job=job)
+
+
+@views.route("/hooks/prefetch", methods=("POST",))
+@public_endpoint
+def prefetch_webhook():
+    # e.g. curl -X POST -H "X-Otokuna-Token: <token>" http://localhost/hooks/prefetch
+    token = request.headers.get("X-Otokuna-Token", "")
+    if CONFIG.prefetch_webhook_token is None:
+        abort(404)
+    if not secrets.compare_digest(token, CONFIG.prefetch_webhook_token):
+        abort(403)
+    PREFETCHER.trigger()
+    return "", 202
+
+
+@views.route("/api/results/<name>")
+def api_results(name):
+    """Filtered, sorted and paginated results of a daily prediction (by date) or a job.
+
+    e.g. /api/results/2021-02-11?ward=港区&rent_max=150000&score_min=1.1&sort=-otokuna_score&page=2
+    See ResultsQuery for the arguments.
+    """
+    try:
+        query = ResultsQuery.from_args(request.args)
+    except QueryError as e:
+        return jsonify(error=str(e)), 400
+    if REDIS_DB.hexists(ISO_DATETIMES_KEY, name):
+        load = load_data_daily
+    elif JOB_CATALOG.get(name) is not None:
+        load = load_data
+    else:
+        abort(404)
+
+    # The frames are immutable (replaced under a new file), so the file
+    # and the query identify the response without evaluating the query
+    metadata = FRAME_STORE.metadata(name)
+    if metadata is None:
+        load(name)
+        metadata = FRAME_STORE.metadata(name)
+    etag = hashlib.sha256(f"{metadata['filename']}|{query.cache_key()}".encode()).hexdigest()
+    # The gzip and identity representations differ byte-wise, so each gets its
+    # own strong ETag (otherwise a cache could serve one for the other)
+    use_gzip = "gzip" in request.accept_encodings
+    if use_gzip:
+        etag += "-gzip"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        table = FRAME_STORE.get_table(name)
+        if table is None:  # evicted in the meantime
+            load(name)
+            table = FRAME_STORE.get_table(name)
+        try:
+            result = query.run(table)
+        except QueryError as e:
+            return jsonify(error=str(e)), 400
+        body = json.dumps({"name": name, **result}, ensure_ascii=False, default=str).encode()
+        response = Response(body, mimetype="application/json")
+        if use_gzip:
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "private, no-cache"  # revalidate with the ETag
+    return response
+
+
+@views.route("/admin/metrics")
+@login_required
+def admin_metrics():
+    return jsonify(s3_cache=S3_CACHE.metrics(), frames=FRAME_STORE.metrics())
 
 
 # dtale already takes the default static path for its assets,
 # so we define a new one for the this app's vendored assets.
-@app.route('/static/vendor/<path:filename>')
+@views.route('/static/vendor/<path:filename>')
 def static_vendor(filename):
     return send_from_directory((BASE_PATH / "static" / "vendor").resolve(), secure_filename(filename))
 
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8080, processes=4, threaded=False)
+    create_app().run(host="0.0.0.0", port=8080, processes=4, threaded=False)
@@ -0,0 +1,100 @@
+"""Measures the time from starting gunicorn until the web app serves its first response.
+
+The app needs a config file but no AWS access (the clients are created lazily).
+Every run starts cold, with the state (redis, frames, caches) in a new temporary
+folder. e.g. (from the app folder):
+
+    ~$ OTOKUNA_CONFIG_FILE=config/config.yml python benchmarks/time_to_first_response.py --workers 1 4 --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import yaml
+
+APP_DIR = Path(__file__).parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_cold_config(config_file, state_dir):
+    """Copy of the config with all the state in state_dir."""
+    with open(config_file) as file:
+        config = yaml.safe_load(file)
+    config.update(
+        dtale_state_dir=os.path.join(state_dir, "dtale"),
+        app_db_file=os.path.join(state_dir, "app.db"),
+        s3_cache_dir=os.path.join(state_dir, "s3_cache"),
+        job_catalog_file=os.path.join(state_dir, "job_catalog.db"),
+    )
+    filename = os.path.join(state_dir, "config.yml")
+    with open(filename, "w") as file:
+        yaml.safe_dump(config, file)
+    return filename
+
+
+def time_to_first_response(app, config_file, workers, preload, timeout):
+    state_dir = tempfile.TemporaryDirectory()
+    env = {**os.environ, "OTOKUNA_CONFIG_FILE": make_cold_config(config_file, state_dir.name)}
+    port = free_port()
+    command = [sys.executable, "-m", "gunicorn", "--chdir", str(APP_DIR), "--bind", f"127.0.0.1:{port}",
+               "--workers", str(workers), *(["--preload"] if preload else []), app]
+    url = f"http://127.0.0.1:{port}/login"  # a public endpoint
+    log = tempfile.TemporaryFile()
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=env)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=timeout):
+                    return time.perf_counter() - start
+            except urllib.error.HTTPError:  # a response nevertheless
+                return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                if process.poll() is not None:
+                    log.seek(0)
+                    raise RuntimeError(f"gunicorn exited with code {process.returncode}:\n{log.read().decode()}")
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"No response after {timeout}s")
+                time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+        log.close()
+        state_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config-file", default=os.getenv("OTOKUNA_CONFIG_FILE"),
+                        help="(default: OTOKUNA_CONFIG_FILE)")
+    parser.add_argument("--app", default="app:create_app()", help="gunicorn app (default: %(default)s)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--no-preload", action="store_true")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds")
+    args = parser.parse_args()
+    if args.config_file is None:
+        parser.error("No config file")
+
+    for workers in args.workers:
+        times = [time_to_first_response(args.app, args.config_file, workers, not args.no_preload, args.timeout)
+                 for _ in range(args.runs)]
+        print(f"workers={workers}: median={statistics.median(times):.3f}s "
+              f"min={min(times):.3f}s max={max(times):.3f}s (runs={args.runs})")
+
+
+if __name__ == "__main__":
+    main()
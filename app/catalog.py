@@ -0,0 +1,251 @@
+import contextlib
+import dataclasses
+import datetime
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from otokuna.dumping import normalize_search_url
+
+
+@dataclass
+class JobInfo:
+    job_id: str
+    user_id: str
+    timestamp: float
+    search_url: str
+    search_conditions: str
+    raw_data_key: str
+    scraped_data_key: str
+    prediction_data_key: str
+    results_data_key: Optional[str] = None  # missing in the jobs that predate it
+    top_deals_data_key: Optional[str] = None  # missing in the jobs that predate it
+
+    _JST = datetime.timezone(datetime.timedelta(seconds=32400), 'JST')
+
+    @classmethod
+    def json_loads(cls, bytes_or_str):
+        # Ignore the fields unknown to this version of the app
+        # (e.g. fields added by a newer version of the pipeline)
+        field_names = {field.name for field in dataclasses.fields(cls)}
+        return cls(**{k: v for k, v in json.loads(bytes_or_str).items() if k in field_names})
+
+    @property
+    def datetime_jst_formatted(self):
+        d = datetime.datetime.fromtimestamp(self.timestamp, tz=self._JST)
+        return d.strftime("%Y-%m-%d %H:%M:%S")
+
+
+@dataclass
+class Submission:
+    """A job submitted by the app (which may not have finished yet)."""
+    job_id: str
+    user_id: str
+    search_url: str
+    execution_arn: str
+    submitted_at: float
+
+    @property
+    def datetime_jst_formatted(self):
+        d = datetime.datetime.fromtimestamp(self.submitted_at, tz=JobInfo._JST)
+        return d.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# The catalog is a cache of the bucket, so it is just rebuilt
+# (and synced again) when the version of the schema changes.
+_SCHEMA_VERSION = 2
+_SCHEMA = """
+DROP TABLE IF EXISTS jobs;
+DROP TABLE IF EXISTS sync;
+DROP TABLE IF EXISTS submissions;
+CREATE TABLE jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    search_key TEXT NOT NULL,
+    info_key TEXT NOT NULL UNIQUE,
+    info TEXT NOT NULL
+);
+CREATE INDEX jobs_timestamp ON jobs (timestamp);
+CREATE INDEX jobs_user_id_timestamp ON jobs (user_id, timestamp);
+CREATE INDEX jobs_search_key_timestamp ON jobs (search_key, timestamp);
+CREATE TABLE sync (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    synced_at REAL NOT NULL
+);
+CREATE TABLE submissions (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    search_url TEXT NOT NULL,
+    search_key TEXT NOT NULL,
+    execution_arn TEXT NOT NULL,
+    submitted_at REAL NOT NULL
+);
+CREATE INDEX submissions_search_key_submitted_at ON submissions (search_key, submitted_at);
+"""
+
+
+class JobCatalog:
+    """Catalog of the jobs of the custom requests in a SQLite database.
+
+    The catalog is synced incrementally from the job_info.json files in the
+    bucket: only the folders of the jobs are listed, the files of the jobs
+    that are not in the catalog yet are fetched (in parallel), and the sync
+    is skipped if it was done (or started by another thread or worker) less
+    than `sync_ttl` seconds ago. The jobs are queried newest first, with pagination and an
+    optional filter by user.
+
+    The catalog also records the jobs submitted by the app, and both are
+    indexed by the normalized search url, so the app can find the recent
+    jobs of an identical search (finished or not) and reuse them.
+
+    A connection is opened per operation, so the catalog can be shared by
+    threads and forked workers.
+    """
+    def __init__(self, filename, sync_ttl=0, max_workers=8):
+        self.filename = filename
+        self.sync_ttl = sync_ttl
+        self.max_workers = max_workers
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            version, = connection.execute("PRAGMA user_version").fetchone()
+            if version != _SCHEMA_VERSION:
+                connection.executescript(_SCHEMA)
+                connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.filename, timeout=30)
+        try:
+            with connection:  # commits or rolls back
+                yield connection
+        finally:
+            connection.close()
+
+    def sync(self, bucket, prefix="jobs", force=False):
+        """Add the new jobs of a boto3 Bucket resource. Returns the number of jobs added."""
+        with self._connect() as connection:
+            # Claim the sync (the write lock serializes the threads and the workers),
+            # so the concurrent callers skip it instead of fetching the same jobs
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT synced_at FROM sync").fetchone()
+            if not force and row is not None and time.time() - row[0] < self.sync_ttl:
+                return 0
+            synced_at = time.time()
+            connection.execute("INSERT OR REPLACE INTO sync (id, synced_at) VALUES (0, ?)", (synced_at,))
+            known_ids = {job_id for job_id, in connection.execute("SELECT job_id FROM jobs")}
+        try:
+            jobs = self._fetch_new_jobs(bucket, prefix, known_ids)
+        except BaseException:
+            with self._connect() as connection:  # release the claim, so the next caller retries
+                if row is None:
+                    connection.execute("DELETE FROM sync WHERE synced_at = ?", (synced_at,))
+                else:
+                    connection.execute("UPDATE sync SET synced_at = ? WHERE synced_at = ?", (row[0], synced_at))
+            raise
+
+        with self._connect() as connection:
+            self._insert(connection, jobs)
+        return len(jobs)
+
+    def _fetch_new_jobs(self, bucket, prefix, known_ids) -> List[Tuple[str, JobInfo]]:
+        # The job ids are random, so (unlike the dated keys of the daily predictions)
+        # the new jobs cannot be listed with StartAfter. Instead only the folders of
+        # the jobs are listed (not all their files), and only the job_info.json of
+        # the unknown ones is fetched (in parallel). The unfinished jobs have none yet.
+        client = bucket.meta.client  # the clients (unlike the resources) are thread-safe
+        paginator = client.get_paginator("list_objects_v2")
+        new_keys = [f"{common_prefix['Prefix']}job_info.json"
+                    for page in paginator.paginate(Bucket=bucket.name, Prefix=f"{prefix}/", Delimiter="/")
+                    for common_prefix in page.get("CommonPrefixes", [])
+                    if common_prefix["Prefix"][len(prefix) + 1:-1] not in known_ids]
+
+        def fetch(key):
+            try:
+                body = client.get_object(Bucket=bucket.name, Key=key)["Body"].read()
+            except client.exceptions.NoSuchKey:
+                return None
+            return key, JobInfo.json_loads(body)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return [job for job in executor.map(fetch, new_keys) if job is not None]
+
+    def sync_job(self, bucket, job_id, prefix="jobs") -> Optional[JobInfo]:
+        """Add a single (e.g. just finished) job of a boto3 Bucket resource, without
+        listing the bucket. Returns the job, or None if its job_info.json does not exist.
+        """
+        key = f"{prefix}/{job_id}/job_info.json"
+        try:
+            body = bucket.meta.client.get_object(Bucket=bucket.name, Key=key)["Body"].read()
+        except bucket.meta.client.exceptions.NoSuchKey:
+            return None
+        job = JobInfo.json_loads(body)
+        with self._connect() as connection:
+            self._insert(connection, [(key, job)])
+        return job
+
+    @staticmethod
+    def _insert(connection, jobs):
+        connection.executemany(
+            "INSERT OR REPLACE INTO jobs (job_id, user_id, timestamp, search_key, info_key, info) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(job.job_id, job.user_id, job.timestamp, normalize_search_url(job.search_url), key,
+              json.dumps(dataclasses.asdict(job)))
+             for key, job in jobs]
+        )
+
+    def get(self, job_id) -> Optional[JobInfo]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT info FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return JobInfo.json_loads(row[0]) if row is not None else None
+
+    def query(self, user_id=None, page=1, per_page=20) -> Tuple[List[JobInfo], int]:
+        """Get a page (starting from 1) of jobs, newest first, and the total number of jobs."""
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id else ("", ())
+        with self._connect() as connection:
+            total, = connection.execute(f"SELECT COUNT(*) FROM jobs {where}", params).fetchone()
+            rows = connection.execute(
+                f"SELECT info FROM jobs {where} ORDER BY timestamp DESC, user_id LIMIT ? OFFSET ?",
+                (*params, per_page, (page - 1) * per_page)
+            ).fetchall()
+        return [JobInfo.json_loads(info) for info, in rows], total
+
+    def user_ids(self) -> List[str]:
+        with self._connect() as connection:
+            return [user_id for user_id, in connection.execute("SELECT DISTINCT user_id FROM jobs ORDER BY user_id")]
+
+    def add_submission(self, submission: Submission):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO submissions "
+                "(job_id, user_id, search_url, search_key, execution_arn, submitted_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (submission.job_id, submission.user_id, submission.search_url,
+                 normalize_search_url(submission.search_url), submission.execution_arn, submission.submitted_at)
+            )
+
+    def latest_job(self, search_url, since) -> Optional[JobInfo]:
+        """Get the newest job of the search (any equivalent url) started after `since` (a timestamp)."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT info FROM jobs WHERE search_key = ? AND timestamp >= ? ORDER BY timestamp DESC LIMIT 1",
+                (normalize_search_url(search_url), since)
+            ).fetchone()
+        return JobInfo.json_loads(row[0]) if row is not None else None
+
+    def pending_submissions(self, search_url=None, since=0) -> List[Submission]:
+        """Get the submissions (of the search, any equivalent url, if given) made after
+        `since` (a timestamp) whose job is not in the catalog yet, newest first.
+        """
+        where, params = ("AND s.search_key = ?", (normalize_search_url(search_url),)) if search_url else ("", ())
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT s.job_id, s.user_id, s.search_url, s.execution_arn, s.submitted_at "
+                "FROM submissions s LEFT JOIN jobs j ON s.job_id = j.job_id "
+                f"WHERE s.submitted_at >= ? AND j.job_id IS NULL {where} "
+                "ORDER BY s.submitted_at DESC",
+                (since, *params)
+            ).fetchall()
+        return [Submission(*row) for row in rows]
@@ -8,8 +8,22 @@ def number_of_workers():
 
 
 workers = number_of_workers()  # or an integer
+# Threads per worker (i.e. gthread workers), so the long-lived requests (e.g. the
+# job events streams of the custom request page) do not block the workers.
+# The app state is shared by the workers anyway (in redis, SQLite and files),
+# so it is already safe for concurrent requests: the AWS clients are created
+# per process under a lock, the redis clients are thread-safe, and the job
+# catalog opens a connection per operation and claims its syncs.
+threads = 4
 preload_app = True
 bind = "unix:/tmp/otokuna-web-server.sock"
 umask = 0o007
 accesslog = "/var/log/otokuna-web-server/gunicorn_access.log"
 errorlog = "/var/log/otokuna-web-server/gunicorn_error.log"
+
+
+def post_worker_init(worker):
+    # Start the background prefetch of the latest daily prediction.
+    # Every worker runs one, but only one at a time prefetches (see prefetch.Prefetcher).
+    import app
+    app.PREFETCHER.start()
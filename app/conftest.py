@@ -0,0 +1,28 @@
+# This conftest.py lives at the root of the app folder so pytest adds the
+# folder to sys.path and the tests can import the app modules (e.g. state).
+import pytest
+import redis
+
+from state import AppRedis
+
+
+@pytest.fixture(scope="session")
+def redis_server(tmp_path_factory):
+    # A single server for all the tests since starting a redislite server is
+    # slow. It is retried because redislite may try to connect to the server
+    # before it listens on its socket.
+    for attempt in range(3):
+        try:
+            db = AppRedis(str(tmp_path_factory.mktemp("redis") / "app_state.db"))
+            break
+        except redis.ConnectionError:
+            if attempt == 2:
+                raise
+    yield db
+    db.shutdown()
+
+
+@pytest.fixture
+def redis_db(redis_server):
+    redis_server.flushdb()
+    yield redis_server
@@ -0,0 +1,229 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+_TUPLE_COLUMNS_METADATA_KEY = b"otokuna_tuple_columns"
+_TEMP_PREFIX = ".write-"
+
+
+class FrameStore:
+    """Store of DataFrames shared by all the app workers.
+
+    The frames are written as Arrow IPC files and read back by memory-mapping
+    them read-only, so the workers share the pages of the files through the
+    OS page cache instead of each holding a deserialized copy of a pickle.
+    Redis only holds the metadata of the frames (filename, size, etc).
+
+    Each write goes to a new file that is atomically renamed, so a frame that
+    is replaced (or deleted) can still be read by the workers that already
+    mapped the old file.
+
+    The total size of the files is bounded by max_bytes (unbounded if None).
+    When a frame is put beyond the budget, the least recently used ("lru")
+    or least frequently used ("lfu") frames are evicted, except for the
+    pinned ones. The hits, misses and evictions are counted in redis.
+    """
+    POLICIES = ("lru", "lfu")
+
+    def __init__(self, directory, redis, key="frames", max_bytes=None, policy="lru"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Invalid policy: {policy} (must be one of {self.POLICIES})")
+        self.directory = Path(directory)
+        self.redis = redis
+        self.key = key
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def _clock_key(self):  # logical clock shared by the workers to order the accesses
+        return f"{self.key}:clock"
+
+    @property
+    def _last_access_key(self):  # sorted set of name -> clock
+        return f"{self.key}:last_access"
+
+    @property
+    def _n_accesses_key(self):  # hash of name -> count
+        return f"{self.key}:n_accesses"
+
+    @property
+    def _pinned_key(self):  # set of names
+        return f"{self.key}:pinned"
+
+    @property
+    def _metrics_key(self):  # hash of counter -> count
+        return f"{self.key}:metrics"
+
+    def _record_access(self, name):
+        self.redis.zadd(self._last_access_key, {name: self.redis.incr(self._clock_key)})
+        self.redis.hincrby(self._n_accesses_key, name, 1)
+
+    def __contains__(self, name):
+        return self.redis.hexists(self.key, name)
+
+    def names(self):
+        return [name.decode() for name in self.redis.hkeys(self.key)]
+
+    def metadata(self, name):
+        return self.redis.hget(self.key, name)
+
+    def set_pinned(self, names):
+        """Set the frames that are never evicted (e.g. the latest daily result)."""
+        with self.redis.pipeline() as pipe:
+            pipe.delete(self._pinned_key)
+            if names:
+                pipe.sadd(self._pinned_key, *names)
+            pipe.execute()
+
+    def pinned(self):
+        return {name.decode() for name in self.redis.smembers(self._pinned_key)}
+
+    def put(self, name, df: pd.DataFrame):
+        # Arrow does not support tuples, so they are stored as lists and
+        # converted back on reading (e.g. building_transportation)
+        tuple_columns = [column for column in df.columns
+                         if df[column].dtype == object and isinstance(_first_valid(df[column]), tuple)]
+        df = df.assign(**{column: df[column].map(_tuple2list) for column in tuple_columns})
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        table = table.replace_schema_metadata({
+            **table.schema.metadata,
+            _TUPLE_COLUMNS_METADATA_KEY: json.dumps(tuple_columns).encode(),
+        })
+
+        digest = hashlib.sha256(name.encode()).hexdigest()
+        path = self.directory / f"{digest}-{uuid.uuid4().hex}.arrow"
+        fd, temp_filename = tempfile.mkstemp(prefix=_TEMP_PREFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as file, pa.ipc.new_file(file, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(temp_filename, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_filename)
+            raise
+
+        old_metadata = self.metadata(name)
+        self.redis.hset(self.key, name, {
+            "filename": path.name,
+            "nbytes": path.stat().st_size,
+            "n_rows": len(df),
+            "created_at": time.time(),
+        })
+        if old_metadata is not None:
+            self._remove_file(old_metadata["filename"])
+        self._record_access(name)
+        self.evict(keep=name)
+
+    def get(self, name):
+        """Get a frame, or None if the frame is not in the store."""
+        table = self.get_table(name)
+        if table is None:
+            return None
+        # split_blocks avoids consolidating the numeric columns into new
+        # blocks, so they can stay zero-copy views of the mapped file
+        df = table.to_pandas(split_blocks=True)
+        tuple_columns = json.loads(table.schema.metadata.get(_TUPLE_COLUMNS_METADATA_KEY, b"[]"))
+        for column in tuple_columns:
+            df[column] = df[column].map(_array2tuple)
+        return df
+
+    def get_table(self, name):
+        """Get a frame as a (memory-mapped) Arrow table, or None if the frame is not
+        in the store. The index of the frame is a column of the table.
+        """
+        metadata = self.metadata(name)
+        try:
+            if metadata is None:
+                raise FileNotFoundError
+            source = pa.memory_map(str(self.directory / metadata["filename"]), "r")
+        except FileNotFoundError:  # or deleted by another worker in the meantime
+            self.redis.hincrby(self._metrics_key, "misses", 1)
+            return None
+        self.redis.hincrby(self._metrics_key, "hits", 1)
+        self._record_access(name)
+        return pa.ipc.open_file(source).read_all()
+
+    def delete(self, name):
+        metadata = self.metadata(name)
+        if metadata is None:
+            return
+        with self.redis.pipeline() as pipe:
+            pipe.hdel(self.key, name)
+            pipe.zrem(self._last_access_key, name)
+            pipe.hdel(self._n_accesses_key, name)
+            pipe.execute()
+        self._remove_file(metadata["filename"])
+
+    def size_bytes(self):
+        return sum(metadata["nbytes"] for metadata in self.redis.hvals(self.key))
+
+    def _eviction_order(self, names):
+        last_access = {name.decode(): clock
+                       for name, clock in self.redis.zrange(self._last_access_key, 0, -1, withscores=True)}
+        if self.policy == "lru":
+            return sorted(names, key=lambda name: last_access.get(name, 0))
+        n_accesses = {name.decode(): int(count)
+                      for name, count in self.redis.hgetall(self._n_accesses_key).items()}
+        return sorted(names, key=lambda name: (n_accesses.get(name, 0), last_access.get(name, 0)))
+
+    def evict(self, keep=None):
+        """Evict frames until the store fits in the budget.
+
+        The pinned frames and the frame given by `keep` are never evicted.
+        """
+        if self.max_bytes is None:
+            return
+        sizes = {}
+        for name in self.names():
+            metadata = self.metadata(name)
+            if metadata is not None:  # unless deleted by another worker
+                sizes[name] = metadata["nbytes"]
+        total_bytes = sum(sizes.values())
+        candidates = set(sizes) - self.pinned() - {keep}
+        for name in self._eviction_order(candidates):
+            if total_bytes <= self.max_bytes:
+                break
+            self.delete(name)
+            self.redis.hincrby(self._metrics_key, "evictions", 1)
+            total_bytes -= sizes[name]
+
+    def metrics(self):
+        """Hit/miss/eviction counters (aggregated across workers) and current usage."""
+        counters = {"hits": 0, "misses": 0, "evictions": 0}
+        counters.update({name.decode(): int(value)
+                         for name, value in self.redis.hgetall(self._metrics_key).items()})
+        requests = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": counters["hits"] / requests if requests else None,
+            "n_frames": self.redis.hlen(self.key),
+            "size_bytes": self.size_bytes(),
+            "max_bytes": self.max_bytes,
+            "policy": self.policy,
+        }
+
+    def _remove_file(self, filename):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.directory / filename)
+
+
+def _first_valid(series):
+    index = series.first_valid_index()
+    return series[index] if index is not None else None
+
+
+def _tuple2list(value):
+    return list(value) if isinstance(value, tuple) else value
+
+
+def _array2tuple(value):
+    return tuple(value) if value is not None else value
@@ -0,0 +1,65 @@
+import time
+
+import dtale.global_state
+from dtale.views import startup
+
+
+class DtaleInstances:
+    """Registry of the Dtale instances started by the app.
+
+    Each dataset gets a stable data_id (e.g. derived from its date or job id)
+    and the registry remembers the version of the data it was started with,
+    so repeat visits reuse the running instance and skip the startup unless
+    the data changed. The registry lives in redis so it is shared by all the
+    app workers, just like the Dtale global state.
+
+    Dtale is built with its own reaper off, so `reap` drops the instances
+    that were not visited for longer than `ttl` seconds, and the least
+    recently visited ones beyond `max_instances`. Note that only the visits
+    through the app (not the requests of the Dtale views) count as accesses.
+    """
+    def __init__(self, redis, key="dtale_instances", ttl=None, max_instances=None):
+        self.redis = redis
+        self.key = key
+        self.ttl = ttl
+        self.max_instances = max_instances
+
+    def __len__(self):
+        return self.redis.hlen(self.key)
+
+    def get_or_start(self, data_id, version, load_data, name):
+        """Start a Dtale instance for the data unless one with the same version
+        is already running. `load_data` is only called if the instance is started.
+        """
+        entry = self.redis.hget(self.key, data_id)
+        if entry is None or entry["version"] != version or data_id not in dtale.global_state.DATA:
+            dtale.global_state.cleanup(data_id)
+            startup(data_id=data_id,
+                    data=load_data(),
+                    name=name,
+                    ignore_duplicate=True,
+                    allow_cell_edits=False,
+                    inplace=True)
+        self.redis.hset(self.key, data_id, {"version": version, "last_access": time.time()})
+        self.reap(keep=data_id)
+        return data_id
+
+    def reap(self, keep=None):
+        """Drop the idle instances and those beyond the count limit.
+        The instance given by `keep` (e.g. the one just visited) is never dropped.
+        """
+        now = time.time()
+        entries = sorted(((int(data_id), entry) for data_id, entry in self.redis.hitems(self.key).items()),
+                         key=lambda item: item[1]["last_access"], reverse=True)
+        n_kept = 0
+        for data_id, entry in entries:
+            idle = self.ttl is not None and now - entry["last_access"] > self.ttl
+            too_many = self.max_instances is not None and n_kept >= self.max_instances
+            if data_id != keep and (idle or too_many):
+                self.drop(data_id)
+            else:
+                n_kept += 1
+
+    def drop(self, data_id):
+        dtale.global_state.cleanup(data_id)
+        self.redis.hdel(self.key, data_id)
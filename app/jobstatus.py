@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from catalog import JobCatalog, Submission
+
+# https://docs.aws.amazon.com/step-functions/latest/apireference/API_DescribeExecution.html
+TERMINAL_STATUSES = ("SUCCEEDED", "FAILED", "TIMED_OUT", "ABORTED")
+FAILED_STATUSES = ("FAILED", "TIMED_OUT", "ABORTED")
+
+
+class JobStatusTracker:
+    """Tracks the jobs submitted by the app through the status of their executions.
+
+    The statuses are checked with describe_execution calls (made in parallel,
+    since there is no batch API) and cached in redis for `ttl` seconds, so
+    the app workers and the clients polling at the same time share the calls.
+    The terminal statuses never change, so they are not checked again.
+
+    When an execution succeeds, only the job_info.json of its job is fetched
+    and added to the catalog, instead of listing all the jobs in the bucket.
+    """
+    def __init__(self, sfn_client, catalog: JobCatalog, redis, key="job_statuses", ttl=5, max_workers=8):
+        self.sfn_client = sfn_client  # a function that returns the client (e.g. per process)
+        self.catalog = catalog
+        self.redis = redis
+        self.key = key
+        self.ttl = ttl
+        self.max_workers = max_workers
+
+    def statuses(self, submissions: List[Submission]) -> Dict[str, str]:
+        """Get the status (e.g. RUNNING or SUCCEEDED) of the executions of the submissions by job_id."""
+        now = time.time()
+        cached = self.redis.hitems(self.key)
+        to_check = [submission for submission in submissions
+                    if submission.job_id not in cached
+                    or (cached[submission.job_id]["status"] not in TERMINAL_STATUSES
+                        and now - cached[submission.job_id]["checked_at"] > self.ttl)]
+        if to_check:
+            client = self.sfn_client()
+
+            def describe(submission):
+                return client.describe_execution(executionArn=submission.execution_arn)["status"]
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                statuses = list(executor.map(describe, to_check))
+            for submission, status in zip(to_check, statuses):
+                cached[submission.job_id] = {"status": status, "checked_at": now}
+                self.redis.hset(self.key, submission.job_id, cached[submission.job_id])
+        return {submission.job_id: cached[submission.job_id]["status"] for submission in submissions}
+
+    def poll(self, bucket, since) -> Tuple[List[Tuple[Submission, str]], List[Tuple[Submission, str]]]:
+        """Check the pending submissions made after `since` (a timestamp), adding the
+        jobs that succeeded to the catalog. Returns the submissions that are still
+        pending and those that failed (FAILED, TIMED_OUT or ABORTED), with their status.
+
+        The cached statuses of the other submissions (the jobs in the catalog and
+        the submissions made before `since`) are dropped, so they do not pile up.
+        """
+        submissions = self.catalog.pending_submissions(since=since)
+        statuses = self.statuses(submissions)
+        stale = set(self.redis.hitems(self.key)) - set(statuses)
+        if stale:
+            self.redis.hdel(self.key, *stale)
+        pending, failed = [], []
+        for submission in submissions:
+            status = statuses[submission.job_id]
+            if status == "SUCCEEDED" and self.catalog.sync_job(bucket, submission.job_id) is not None:
+                self.redis.hdel(self.key, submission.job_id)
+            elif status in FAILED_STATUSES:
+                failed.append((submission, status))
+            else:
+                pending.append((submission, status))
+        return pending, failed
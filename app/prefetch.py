@@ -0,0 +1,65 @@
+import contextlib
+import logging
+import threading
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Runs a prefetch function periodically in a background thread.
+
+    Every app worker runs its own prefetcher, but they coordinate through
+    redis: a lock so only one of them prefetches at a time, and the time of
+    the last prefetch so a round is skipped if any worker prefetched less
+    than `interval` seconds ago. A prefetch can also be triggered right away
+    (e.g. from a webhook called when the pipeline finishes) instead of
+    waiting for the next round.
+    """
+    def __init__(self, prefetch, redis_db, interval, lock_name="prefetch_lock", lock_timeout=600,
+                 prefetched_at_key="prefetched_at"):
+        self.prefetch = prefetch
+        self.redis = redis_db
+        self.interval = interval
+        self.lock_name = lock_name
+        self.lock_timeout = lock_timeout
+        self.prefetched_at_key = prefetched_at_key
+        self._event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        self._event.set()
+
+    def run_once(self, force=False) -> bool:
+        """Prefetch unless another worker is prefetching or (unless forced) any
+        worker prefetched within the interval. Returns whether it prefetched.
+        """
+        lock = self.redis.lock(self.lock_name, timeout=self.lock_timeout)
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            prefetched_at = self.redis.get(self.prefetched_at_key)
+            if not force and prefetched_at is not None and time.time() - float(prefetched_at) < self.interval:
+                return False
+            self.prefetch()
+            self.redis.set(self.prefetched_at_key, time.time())
+        except Exception:
+            logger.exception("Prefetch failed")
+        finally:
+            with contextlib.suppress(redis.exceptions.LockError):  # e.g. it timed out
+                lock.release()
+        return True
+
+    def _run(self):
+        triggered = False
+        while True:
+            self.run_once(force=triggered)
+            triggered = self._event.wait(self.interval)
+            self._event.clear()
@@ -0,0 +1,121 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DEFAULT_SORT = [("otokuna_score", "descending")]
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# query parameter -> column (e.g. rent_min=50000&rent_max=150000)
+RANGE_PARAMS = {
+    "rent": "rent",
+    "monthly_cost": "monthly_cost",
+    "area": "area",
+    "score": "otokuna_score",
+}
+# query parameter -> column (e.g. ward=港区&ward=渋谷区)
+VALUES_PARAMS = {
+    "ward": "ward",
+    "layout": "layout",
+}
+
+
+class QueryError(ValueError):
+    pass
+
+
+@dataclass
+class ResultsQuery:
+    """Query (filters, sort and pagination) over a results table.
+
+    The query is evaluated with Arrow compute kernels directly on the
+    (memory-mapped) columns of the table, and only the rows of the requested
+    page are converted to Python objects.
+    """
+    values: Dict[str, List[str]] = field(default_factory=dict)  # column -> values
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = field(default_factory=dict)  # column -> min, max
+    sort: List[Tuple[str, str]] = field(default_factory=lambda: list(DEFAULT_SORT))  # column, order
+    page: int = 1
+    page_size: int = DEFAULT_PAGE_SIZE
+
+    @classmethod
+    def from_args(cls, args):
+        """Make a query from the (werkzeug MultiDict) arguments of a request, e.g.:
+        ward=港区&ward=渋谷区&rent_max=150000&score_min=1.1&sort=-otokuna_score,rent&page=2&page_size=50
+        """
+        query = cls()
+        for param, column in VALUES_PARAMS.items():
+            values = args.getlist(param)
+            if values:
+                query.values[column] = sorted(values)
+        for param, column in RANGE_PARAMS.items():
+            bounds = tuple(_parse_number(args, f"{param}_{bound}", float) for bound in ("min", "max"))
+            if bounds != (None, None):
+                query.ranges[column] = bounds
+        if args.get("sort"):
+            query.sort = [(key.lstrip("-"), "descending" if key.startswith("-") else "ascending")
+                          for key in args["sort"].split(",") if key.strip("-")]
+        for name in ("page", "page_size"):
+            value = _parse_number(args, name, int)
+            if value is not None:
+                setattr(query, name, value)
+        if query.page < 1 or not 1 <= query.page_size <= MAX_PAGE_SIZE:
+            raise QueryError(f"page must be >= 1 and page_size within [1, {MAX_PAGE_SIZE}]")
+        return query
+
+    def cache_key(self) -> str:
+        return json.dumps(asdict(self), sort_keys=True, ensure_ascii=False)
+
+    def run(self, table: pa.Table) -> dict:
+        unknown_columns = ({*self.values, *self.ranges, *(column for column, _ in self.sort)}
+                           - set(table.column_names))
+        if unknown_columns:
+            raise QueryError(f"Unknown columns: {sorted(unknown_columns)}")
+
+        masks = []
+        for column, values in self.values.items():
+            array = _decoded(table[column])
+            masks.append(pc.is_in(array, value_set=pa.array(values, type=array.type)))
+        for column, (min_, max_) in self.ranges.items():
+            # the comparison kernels need both sides of the same type
+            array = pc.cast(table[column], pa.float64())
+            if min_ is not None:
+                masks.append(pc.greater_equal(array, pa.scalar(min_)))
+            if max_ is not None:
+                masks.append(pc.less_equal(array, pa.scalar(max_)))
+        if masks:
+            mask = masks[0]
+            for mask_ in masks[1:]:
+                mask = pc.and_(mask, mask_)
+            table = table.filter(mask)  # rows with nulls in the mask are dropped
+
+        sort_table = pa.table([_decoded(table[column]) for column, _ in self.sort],
+                              names=[column for column, _ in self.sort])
+        indices = pc.sort_indices(sort_table, sort_keys=self.sort)  # nulls last
+        page_table = table.take(indices.slice((self.page - 1) * self.page_size, self.page_size))
+        columns = page_table.to_pydict()
+        return {
+            "total": table.num_rows,
+            "page": self.page,
+            "page_size": self.page_size,
+            "rows": [dict(zip(columns, row)) for row in zip(*columns.values())],
+        }
+
+
+def _decoded(array):
+    # The kernels do not support dictionary (category) arrays
+    if pa.types.is_dictionary(array.type):
+        return pc.cast(array, array.type.value_type)
+    return array
+
+
+def _parse_number(args, name, type_):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return type_(value)
+    except ValueError:
+        raise QueryError(f"Invalid {name}: {value}")
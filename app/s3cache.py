@@ -0,0 +1,121 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+METRICS_KEY = "s3_cache_metrics"
+_TEMP_PREFIX = ".fill-"
+
+
+class S3ObjectCache:
+    """Local disk cache of S3 objects shared by all the app workers.
+
+    Objects are cached under a filename derived from their bucket, key and
+    ETag, so a cached copy is never served after the object changed in S3.
+    The cache is bounded by a byte budget and the least recently used objects
+    (by file modification time, which is updated on every hit) are evicted
+    first. Objects are downloaded to a temporary file and atomically renamed,
+    so concurrent fills of the same object from different workers are safe.
+
+    The hit/miss counters are kept in a redis hash so they are aggregated
+    across workers.
+    """
+    def __init__(self, cache_dir, max_bytes, redis=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.redis = redis
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, bucket_name, key, etag):
+        digest = hashlib.sha256(f"{bucket_name}/{key}/{etag}".encode()).hexdigest()
+        return self.cache_dir / digest
+
+    def _count(self, **amounts):
+        if self.redis is None:
+            return
+        for name, amount in amounts.items():
+            self.redis.hincrby(METRICS_KEY, name, amount)
+
+    @contextlib.contextmanager
+    def open(self, bucket, key):
+        """Open (for reading) a cached copy of an object of a boto3 Bucket resource."""
+        obj = bucket.Object(key)
+        etag = obj.e_tag  # makes a HEAD request
+        path = self._path(bucket.name, key, etag)
+        try:
+            # Open right away so the file can still be read if another
+            # worker evicts it in the meantime
+            file = open(path, "rb")
+        except FileNotFoundError:
+            self._fill(obj, etag, path)
+            file = open(path, "rb")
+            self._touch(path)
+            self._count(misses=1, bytes_downloaded=obj.content_length)
+            self._evict(keep=path)
+        else:
+            self._touch(path)
+            self._count(hits=1, bytes_saved=obj.content_length)
+        with file:
+            yield file
+
+    @staticmethod
+    def _touch(path):
+        # Set the access time explicitly (the modification time set by the
+        # filesystem may be too coarse to order accesses in quick succession)
+        now = time.time_ns()
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path, ns=(now, now))
+
+    def _fill(self, obj, etag, path):
+        fd, temp_filename = tempfile.mkstemp(prefix=_TEMP_PREFIX, dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                # IfMatch guarantees the body matches the ETag of the filename
+                shutil.copyfileobj(obj.get(IfMatch=etag)["Body"], file)
+            os.replace(temp_filename, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_filename)
+            raise
+
+    def _entries(self):
+        """Cached files and their stats, least recently used first."""
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.name.startswith(_TEMP_PREFIX):
+                continue
+            with contextlib.suppress(FileNotFoundError):  # evicted by another worker
+                entries.append((path, path.stat()))
+        return sorted(entries, key=lambda entry: entry[1].st_mtime_ns)
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total_bytes = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+                self._count(evictions=1)
+            total_bytes -= stat.st_size
+
+    def metrics(self):
+        """Cache counters (aggregated across workers) and current usage."""
+        counters = {"hits": 0, "misses": 0, "evictions": 0, "bytes_saved": 0, "bytes_downloaded": 0}
+        if self.redis is not None:
+            counters.update({name.decode(): int(value)
+                             for name, value in self.redis.hgetall(METRICS_KEY).items()})
+        requests = counters["hits"] + counters["misses"]
+        entries = self._entries()
+        return {
+            **counters,
+            "hit_rate": counters["hits"] / requests if requests else None,
+            "n_objects": len(entries),
+            "size_bytes": sum(stat.st_size for _, stat in entries),
+            "max_bytes": self.max_bytes,
+        }
@@ -17,3 +17,7 @@ class AppRedis(Redis):
     def hvals(self, name):
         values = super().hvals(name)
         return [pickle.loads(v) for v in values] if values else []
+
+    def hitems(self, name):
+        """hgetall with the keys decoded and the values unpickled"""
+        return {k.decode(): pickle.loads(v) for k, v in self.hgetall(name).items()}
@@ -0,0 +1,150 @@
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from catalog import JobCatalog, JobInfo, Submission
+
+
+def make_job_info(i, user_id):
+    return {
+        "job_id": f"job{i}",
+        "user_id": user_id,
+        "timestamp": 1612710000.0 + i,
+        "search_url": "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030",
+        "search_conditions": "東京都／千代田区",
+        "raw_data_key": f"jobs/job{i}/raw.zip",
+        "scraped_data_key": f"jobs/job{i}/scraped.pickle",
+        "prediction_data_key": f"jobs/job{i}/prediction.pickle",
+    }
+
+
+@pytest.fixture
+def bucket():
+    with mock_s3():
+        s3 = boto3.resource("s3", region_name="us-east-1")
+        bucket = s3.create_bucket(Bucket="somebucket")
+        for i in range(5):
+            bucket.put_object(Key=f"jobs/job{i}/job_info.json",
+                              Body=json.dumps(make_job_info(i, "alice" if i % 2 else "bob")))
+            bucket.put_object(Key=f"jobs/job{i}/prediction.pickle", Body=b"")
+        yield bucket
+
+
+def test_job_info_json_loads_ignores_unknown_fields():
+    info = {**make_job_info(0, "bob"), "some_new_field": 123}
+    assert JobInfo.json_loads(json.dumps(info)) == JobInfo(**make_job_info(0, "bob"))
+
+
+def test_sync_and_query(bucket, tmp_path):
+    catalog = JobCatalog(str(tmp_path / "catalog.db"), sync_ttl=3600)
+    assert catalog.sync(bucket) == 5
+    assert catalog.get("job3") == JobInfo(**make_job_info(3, "alice"))
+    assert catalog.get("nonexistent") is None
+
+    jobs, total = catalog.query(page=1, per_page=2)
+    assert total == 5
+    assert [job.job_id for job in jobs] == ["job4", "job3"]
+    jobs, _ = catalog.query(page=3, per_page=2)
+    assert [job.job_id for job in jobs] == ["job0"]
+
+    jobs, total = catalog.query(user_id="alice")
+    assert total == 2
+    assert [job.job_id for job in jobs] == ["job3", "job1"]
+    assert catalog.user_ids() == ["alice", "bob"]
+
+
+def test_incremental_sync(bucket, tmp_path):
+    catalog = JobCatalog(str(tmp_path / "catalog.db"), sync_ttl=3600)
+    catalog.sync(bucket)
+    bucket.put_object(Key="jobs/job5/job_info.json", Body=json.dumps(make_job_info(5, "bob")))
+
+    # skipped within the TTL unless forced
+    assert catalog.sync(bucket) == 0
+    assert catalog.sync(bucket, force=True) == 1
+    assert catalog.query()[1] == 6
+
+
+def test_sync_fetches_only_new_finished_jobs(bucket, tmp_path, monkeypatch):
+    catalog = JobCatalog(str(tmp_path / "catalog.db"))
+    catalog.sync(bucket)
+    bucket.put_object(Key="jobs/job5/job_info.json", Body=json.dumps(make_job_info(5, "bob")))
+    bucket.put_object(Key="jobs/job6/property_data.zip", Body=b"")  # unfinished
+
+    client = bucket.meta.client
+    fetched_keys = []
+    get_object = client.get_object
+
+    def counting_get_object(**kwargs):
+        fetched_keys.append(kwargs["Key"])
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(client, "get_object", counting_get_object)
+    assert catalog.sync(bucket) == 1
+    assert sorted(fetched_keys) == ["jobs/job5/job_info.json", "jobs/job6/job_info.json"]
+    assert catalog.get("job6") is None
+
+
+def test_concurrent_syncs(bucket, tmp_path):
+    # e.g. the threads of a worker, or several workers, with their own catalog
+    catalogs = [JobCatalog(str(tmp_path / "catalog.db"), sync_ttl=3600) for _ in range(2)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        n_added = list(executor.map(lambda i: catalogs[i % 2].sync(bucket), range(8)))
+    assert sum(n_added) == 5
+    assert catalogs[0].query()[1] == 5
+
+
+def test_sync_failure_releases_the_claim(bucket, tmp_path, monkeypatch):
+    catalog = JobCatalog(str(tmp_path / "catalog.db"), sync_ttl=3600)
+
+    def fail(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(catalog, "_fetch_new_jobs", fail)
+    with pytest.raises(RuntimeError):
+        catalog.sync(bucket)
+    monkeypatch.undo()
+    assert catalog.sync(bucket) == 5
+
+
+def test_rebuilt_on_schema_change(bucket, tmp_path):
+    filename = str(tmp_path / "catalog.db")
+    with sqlite3.connect(filename) as connection:  # e.g. from an older version
+        connection.execute("CREATE TABLE jobs (job_id TEXT PRIMARY KEY, info TEXT NOT NULL)")
+        connection.execute("INSERT INTO jobs VALUES ('job0', '{}')")
+    catalog = JobCatalog(filename)
+    assert catalog.query()[1] == 0
+    assert catalog.sync(bucket) == 5
+
+
+def test_latest_job_and_pending_submissions(bucket, tmp_path):
+    catalog = JobCatalog(str(tmp_path / "catalog.db"))
+    catalog.sync(bucket)
+    # an equivalent search url (reordered, with page and results per page)
+    search_url = "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?pc=50&ar=030&page=2"
+    other_search_url = "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030&sc=13101"
+
+    assert catalog.latest_job(search_url, since=0).job_id == "job4"
+    assert catalog.latest_job(search_url, since=1612710003.0).job_id == "job4"
+    assert catalog.latest_job(search_url, since=1612710004.5) is None
+    assert catalog.latest_job(other_search_url, since=0) is None
+
+    submissions = [
+        Submission("job4", "bob", search_url, "arn:4", 1612710004.0),  # finished
+        Submission("job5", "alice", search_url, "arn:5", 1612710005.0),
+        Submission("job6", "bob", search_url, "arn:6", 1612710006.0),
+        Submission("job7", "bob", other_search_url, "arn:7", 1612710007.0),
+    ]
+    for submission in submissions:
+        catalog.add_submission(submission)
+    assert catalog.pending_submissions(search_url, since=0) == [submissions[2], submissions[1]]
+    assert catalog.pending_submissions(search_url, since=1612710005.5) == [submissions[2]]
+
+    bucket.put_object(Key="jobs/job6/job_info.json",
+                      Body=json.dumps(make_job_info(6, "bob")))
+    catalog.sync(bucket, force=True)
+    assert catalog.pending_submissions(search_url, since=0) == [submissions[1]]
+    assert catalog.latest_job(search_url, since=0).job_id == "job6"
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from framestore import FrameStore
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "rent": [77300, 120000, 95000],
+            "area": [20.35, 40.1, np.nan],
+            "new_arrival": [True, False, True],
+            "ward": ["豊島区", "港区", None],
+            "building_transportation": [("a 歩1分", "b 歩2分"), ("c 歩3分",), ()],
+        },
+        index=pd.Index(["100", "101", "102"], name="jnc_id"),
+    )
+
+
+@pytest.fixture
+def store(tmp_path, redis_db):
+    return FrameStore(tmp_path / "frames", redis_db)
+
+
+def test_put_get(store, df):
+    assert store.get("2021-02-11") is None
+    store.put("2021-02-11", df)
+
+    assert "2021-02-11" in store
+    assert store.names() == ["2021-02-11"]
+    assert store.metadata("2021-02-11")["n_rows"] == 3
+    pd.testing.assert_frame_equal(store.get("2021-02-11"), df)
+
+
+def test_shared_across_instances(store, df, tmp_path, redis_db):
+    store.put("foo", df)
+    other_store = FrameStore(tmp_path / "frames", redis_db)
+    pd.testing.assert_frame_equal(other_store.get("foo"), df)
+
+
+def test_replace_and_delete(store, df):
+    store.put("foo", df)
+    df_old = store.get("foo")  # keeps the old file mapped
+    store.put("foo", df.iloc[:1])
+
+    assert len(store.get("foo")) == 1
+    pd.testing.assert_frame_equal(df_old, df)
+    assert len(list(store.directory.iterdir())) == 1
+
+    store.delete("foo")
+    assert "foo" not in store
+    assert store.get("foo") is None
+    assert not list(store.directory.iterdir())
+
+
+def test_invalid_policy(tmp_path, redis_db):
+    with pytest.raises(ValueError):
+        FrameStore(tmp_path, redis_db, policy="fifo")
+
+
+def replay_month_of_daily_visits(store, df):
+    """Replays a month of visits to the daily results.
+
+    Every day a new result is published (and pinned as the latest), the user
+    visits it twice, and then visits the result of the day before. A favorite
+    old result is visited four times on the first day and then every 5 days.
+    Returns the days in which each result was a hit.
+    """
+    hits = {"yesterday": [], "favorite": []}
+
+    def visit(name):
+        if store.get(name) is not None:
+            return True
+        store.put(name, df)
+        assert store.size_bytes() <= store.max_bytes
+        return False
+
+    for _ in range(4):
+        visit("favorite")
+    for day in range(30):
+        today = f"2021-02-{day + 1:02d}"
+        store.set_pinned([today])
+        visit(today)
+        visit(today)
+        assert today in store
+        if day > 0 and visit(f"2021-02-{day:02d}"):
+            hits["yesterday"].append(day)
+        if day % 5 == 0 and visit("favorite"):
+            hits["favorite"].append(day)
+    return hits
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_eviction_replay(policy, df, tmp_path, redis_db):
+    sizing_store = FrameStore(tmp_path / "sizing", redis_db, key="sizing")
+    sizing_store.put("x", df)
+    nbytes = sizing_store.size_bytes()
+    # room for three frames
+    store = FrameStore(tmp_path / "frames", redis_db, max_bytes=int(3.5 * nbytes), policy=policy)
+
+    hits = replay_month_of_daily_visits(store, df)
+
+    metrics = store.metrics()
+    n_visits = 4 + 30 * 2 + 29 + 6
+    assert metrics["hits"] + metrics["misses"] == n_visits
+    assert metrics["n_frames"] == 3
+    assert metrics["evictions"] == metrics["misses"] - metrics["n_frames"]
+    assert len(list(store.directory.iterdir())) == 3
+    if policy == "lru":
+        # the favorite is evicted between visits, and reloading it pushes out
+        # yesterday's result the following day (except on the first day,
+        # when the store was not full yet)
+        assert hits["favorite"] == [0]
+        assert hits["yesterday"] == [day for day in range(1, 30) if day % 5 != 1 or day == 1]
+    else:
+        # the favorite is always kept, at the expense of yesterday's result
+        assert len(hits["yesterday"]) < 29
+        assert hits["favorite"] == [0, 5, 10, 15, 20, 25]
@@ -0,0 +1,56 @@
+import time
+
+import dtale.global_state
+import pandas as pd
+import pytest
+
+from instances import DtaleInstances
+
+
+@pytest.fixture
+def instances(redis_db):
+    yield DtaleInstances(redis_db, ttl=3600, max_instances=2)
+    dtale.global_state.cleanup()
+
+
+@pytest.fixture
+def loads():
+    loads = []
+
+    def load_data(value):
+        def load():
+            loads.append(value)
+            return pd.DataFrame({"a": [value]})
+        return load
+
+    return load_data, loads
+
+
+def test_reuse(instances, loads):
+    load_data, loads = loads
+    for _ in range(2):
+        assert instances.get_or_start(1, "v1", load_data(1), name="foo") == 1
+    assert loads == [1]
+
+    # A new version of the data restarts the instance
+    instances.get_or_start(1, "v2", load_data(2), name="foo")
+    assert loads == [1, 2]
+    assert dtale.global_state.get_data(1)["a"].tolist() == [2]
+
+
+def test_reap(instances, loads, monkeypatch):
+    load_data, loads = loads
+    for data_id in (1, 2, 3):
+        instances.get_or_start(data_id, "v1", load_data(data_id), name=str(data_id))
+    # The least recently visited is dropped beyond the limit
+    assert len(instances) == 2
+    assert dtale.global_state.get_data(1) is None
+    instances.get_or_start(1, "v1", load_data(1), name="1")
+    assert loads == [1, 2, 3, 1]
+
+    # Idle instances are dropped after the TTL
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 7200)
+    instances.reap()
+    assert len(instances) == 0
+    assert not dtale.global_state.get_data()
@@ -0,0 +1,124 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from catalog import JobCatalog, Submission
+from jobstatus import JobStatusTracker
+
+SEARCH_URL = "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030"
+
+
+class LocalStepFunctions:
+    """Stand-in for the Step Functions client, with the statuses of the executions set by hand."""
+    def __init__(self):
+        self.statuses = {}
+        self.n_calls = 0
+
+    def describe_execution(self, executionArn):
+        self.n_calls += 1
+        return {"executionArn": executionArn, "status": self.statuses[executionArn]}
+
+
+@pytest.fixture
+def bucket():
+    with mock_s3():
+        s3 = boto3.resource("s3", region_name="us-east-1")
+        yield s3.create_bucket(Bucket="somebucket")
+
+
+@pytest.fixture
+def sfn():
+    return LocalStepFunctions()
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = JobCatalog(str(tmp_path / "catalog.db"))
+    for i in range(3):
+        catalog.add_submission(Submission(f"job{i}", "bob", SEARCH_URL, f"arn:{i}", 1612710000.0 + i))
+    return catalog
+
+
+def finish_job(bucket, job_id):
+    info = {
+        "job_id": job_id,
+        "user_id": "bob",
+        "timestamp": 1612710000.0,
+        "search_url": SEARCH_URL,
+        "search_conditions": "東京都／千代田区",
+        "raw_data_key": f"jobs/{job_id}/raw.zip",
+        "scraped_data_key": f"jobs/{job_id}/scraped.pickle",
+        "prediction_data_key": f"jobs/{job_id}/prediction.pickle",
+    }
+    bucket.put_object(Key=f"jobs/{job_id}/job_info.json", Body=json.dumps(info))
+
+
+def test_statuses_cached(sfn, catalog, redis_db, monkeypatch):
+    tracker = JobStatusTracker(lambda: sfn, catalog, redis_db, ttl=5)
+    sfn.statuses = {"arn:0": "RUNNING", "arn:1": "RUNNING", "arn:2": "FAILED"}
+    submissions = catalog.pending_submissions()
+    now = 1612720000.0
+    monkeypatch.setattr("jobstatus.time.time", lambda: now)
+
+    assert tracker.statuses(submissions) == {"job0": "RUNNING", "job1": "RUNNING", "job2": "FAILED"}
+    assert sfn.n_calls == 3
+
+    # within the TTL
+    sfn.statuses["arn:0"] = "SUCCEEDED"
+    now += 4
+    assert tracker.statuses(submissions)["job0"] == "RUNNING"
+    assert sfn.n_calls == 3
+
+    # after the TTL, only the running ones are checked
+    now += 2
+    assert tracker.statuses(submissions) == {"job0": "SUCCEEDED", "job1": "RUNNING", "job2": "FAILED"}
+    assert sfn.n_calls == 5
+
+
+def test_poll(sfn, catalog, bucket, redis_db):
+    tracker = JobStatusTracker(lambda: sfn, catalog, redis_db, ttl=0)
+    sfn.statuses = {"arn:0": "RUNNING", "arn:1": "RUNNING", "arn:2": "FAILED"}
+    pending, failed = tracker.poll(bucket, since=0)
+    assert [(submission.job_id, status) for submission, status in pending] == [("job1", "RUNNING"), ("job0", "RUNNING")]
+    assert [(submission.job_id, status) for submission, status in failed] == [("job2", "FAILED")]
+
+    sfn.statuses["arn:1"] = "SUCCEEDED"
+    finish_job(bucket, "job1")
+    pending, failed = tracker.poll(bucket, since=0)
+    assert [(submission.job_id, status) for submission, status in pending] == [("job0", "RUNNING")]
+    assert [(submission.job_id, status) for submission, status in failed] == [("job2", "FAILED")]
+    assert catalog.get("job1").job_id == "job1"
+    assert "job1" not in redis_db.hitems(tracker.key)
+    assert [submission.job_id for submission in catalog.pending_submissions()] == ["job2", "job0"]
+
+    # succeeded but its job_info.json is not there (yet), so still pending
+    sfn.statuses["arn:0"] = "SUCCEEDED"
+    pending, _ = tracker.poll(bucket, since=0)
+    assert [(submission.job_id, status) for submission, status in pending] == [("job0", "SUCCEEDED")]
+    assert catalog.get("job0") is None
+
+
+def test_poll_prunes_statuses(sfn, catalog, bucket, redis_db):
+    tracker = JobStatusTracker(lambda: sfn, catalog, redis_db, ttl=0)
+    sfn.statuses = {"arn:0": "ABORTED", "arn:1": "TIMED_OUT", "arn:2": "FAILED"}
+    _, failed = tracker.poll(bucket, since=0)
+    assert [status for _, status in failed] == ["FAILED", "TIMED_OUT", "ABORTED"]
+    assert set(redis_db.hitems(tracker.key)) == {"job0", "job1", "job2"}
+    assert sfn.n_calls == 3
+
+    # the terminal statuses are not checked again
+    tracker.poll(bucket, since=0)
+    assert sfn.n_calls == 3
+
+    # the submissions made before `since` are not tracked anymore
+    tracker.poll(bucket, since=1612710001.0)
+    assert set(redis_db.hitems(tracker.key)) == {"job1", "job2"}
+
+
+def test_sync_job(catalog, bucket):
+    assert catalog.sync_job(bucket, "job0") is None
+    finish_job(bucket, "job0")
+    assert catalog.sync_job(bucket, "job0").job_id == "job0"
+    assert catalog.get("job0").job_id == "job0"
@@ -0,0 +1,66 @@
+import boto3
+import pytest
+from moto import mock_s3
+
+import app
+from app import DAILY_LISTING_KEY, ISO_DATETIMES_KEY, Config, refresh_prediction_dates
+
+PREFIX = "predictions/daily"
+
+
+@pytest.fixture
+def bucket(redis_db, monkeypatch):
+    config = Config(secret_key="", users=[], dtale_state_dir="", app_db_file="", bucket_name="somebucket",
+                    sfn_region_name="", sfn_arn="", scraped_data_key_prefix="", scraped_data_key_template="",
+                    predictions_key_prefix=PREFIX, prediction_key_template="{}/prediction.pickle",
+                    prediction_key_pattern="(.*)/prediction.pickle")
+    monkeypatch.setattr(app, "CONFIG", config)
+    monkeypatch.setattr(app, "REDIS_DB", redis_db)
+    with mock_s3():
+        s3 = boto3.resource("s3", region_name="us-east-1")
+        bucket = s3.create_bucket(Bucket="somebucket")
+        monkeypatch.setattr(app, "s3_bucket", lambda: bucket)
+        yield bucket
+
+
+def dates(redis_db):
+    return sorted(key.decode() for key in redis_db.hkeys(ISO_DATETIMES_KEY))
+
+
+def test_refresh_prediction_dates(bucket, redis_db):
+    bucket.put_object(Key=f"{PREFIX}/2021-02-10T12:00:00+09:00/prediction.pickle", Body=b"")
+    # The other files of a prediction may be written before it and sort after it
+    bucket.put_object(Key=f"{PREFIX}/2021-02-11T12:00:00+09:00/profiles/predict.prof", Body=b"")
+    refresh_prediction_dates(force=True)
+    assert dates(redis_db) == ["2021-02-10"]
+    assert redis_db.hget(DAILY_LISTING_KEY, "state")["last_key"] == \
+        f"{PREFIX}/2021-02-10T12:00:00+09:00/prediction.pickle"
+
+    bucket.put_object(Key=f"{PREFIX}/2021-02-11T12:00:00+09:00/prediction.pickle", Body=b"")
+    refresh_prediction_dates()  # within daily_listing_ttl
+    assert dates(redis_db) == ["2021-02-10"]
+    state = redis_db.hget(DAILY_LISTING_KEY, "state")
+    redis_db.hset(DAILY_LISTING_KEY, "state", {**state, "refreshed_at": 0})  # expire it
+    refresh_prediction_dates()
+    assert dates(redis_db) == ["2021-02-10", "2021-02-11"]
+
+
+def test_forced_refresh(bucket, redis_db, monkeypatch):
+    bucket.put_object(Key=f"{PREFIX}/2021-02-10T12:00:00+09:00/prediction.pickle", Body=b"")
+    refresh_prediction_dates(force=True)
+    bucket.put_object(Key=f"{PREFIX}/2021-02-11T12:00:00+09:00/prediction.pickle", Body=b"")
+
+    # within daily_listing_ttl, and only the keys after the last prediction are listed
+    paginator = bucket.meta.client.get_paginator("list_objects_v2")
+    paginate = paginator.paginate
+    listed_after = []
+
+    def paginate_after(**kwargs):
+        listed_after.append(kwargs.get("StartAfter"))
+        return paginate(**kwargs)
+
+    monkeypatch.setattr(paginator, "paginate", paginate_after)
+    monkeypatch.setattr(bucket.meta.client, "get_paginator", lambda name: paginator)
+    refresh_prediction_dates(force=True)
+    assert dates(redis_db) == ["2021-02-10", "2021-02-11"]
+    assert listed_after == [f"{PREFIX}/2021-02-10T12:00:00+09:00/prediction.pickle"]
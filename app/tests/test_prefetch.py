@@ -0,0 +1,49 @@
+import threading
+
+from prefetch import Prefetcher
+
+
+def test_run_once_is_exclusive(redis_db):
+    calls = []
+    other = Prefetcher(lambda: calls.append("other"), redis_db, interval=60)
+
+    def prefetch():
+        # another worker tries to prefetch meanwhile
+        assert not other.run_once()
+        calls.append("prefetcher")
+
+    prefetcher = Prefetcher(prefetch, redis_db, interval=60)
+    assert prefetcher.run_once()
+    assert other.run_once(force=True)
+    assert calls == ["prefetcher", "other"]
+
+
+def test_run_once_skipped_within_interval(redis_db, monkeypatch):
+    now = 1612710000.0
+    monkeypatch.setattr("prefetch.time.time", lambda: now)
+    calls = []
+    prefetchers = [Prefetcher(lambda i=i: calls.append(i), redis_db, interval=60) for i in range(3)]
+
+    assert [prefetcher.run_once() for prefetcher in prefetchers] == [True, False, False]
+    now += 61
+    assert [prefetcher.run_once() for prefetcher in prefetchers] == [True, False, False]
+    assert prefetchers[1].run_once(force=True)  # e.g. triggered by the webhook
+    assert calls == [0, 0, 1]
+
+
+def test_failed_prefetch_releases_lock(redis_db):
+    def prefetch():
+        raise RuntimeError("S3 is down")
+
+    assert Prefetcher(prefetch, redis_db, interval=60).run_once()
+    assert Prefetcher(lambda: None, redis_db, interval=60).run_once()
+
+
+def test_trigger(redis_db):
+    prefetched = threading.Semaphore(0)
+    prefetcher = Prefetcher(prefetched.release, redis_db, interval=3600)
+    prefetcher.start()
+    assert prefetched.acquire(timeout=5)  # first round on start
+
+    prefetcher.trigger()
+    assert prefetched.acquire(timeout=5)
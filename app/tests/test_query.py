@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from query import QueryError, ResultsQuery
+
+
+@pytest.fixture
+def table():
+    df = pd.DataFrame(
+        {
+            "otokuna_score": [1.3, 1.2, 1.1, 1.0, 0.9, np.nan],
+            "monthly_cost": [100000, 160000, 90000, 140000, 80000, 70000],
+            "rent": [95000, 150000, 85000, 130000, 75000, 65000],
+            "area": [20.0, 40.0, 18.5, 30.0, 15.0, 25.0],
+            "ward": pd.Categorical(["港区", "港区", "渋谷区", "渋谷区", "新宿区", "港区"]),
+            "layout": ["1K", "2LDK", "1K", "1LDK", "1R", "1K"],
+        },
+        index=pd.Index(list("abcdef"), name="jnc_id"),
+    )
+    return pa.Table.from_pandas(df, preserve_index=True)
+
+
+def run(table, **args):
+    return ResultsQuery.from_args(MultiDict(args)).run(table)
+
+
+def jnc_ids(result):
+    return [row["jnc_id"] for row in result["rows"]]
+
+
+def test_default_query(table):
+    result = run(table)
+    assert result["total"] == 6
+    assert jnc_ids(result) == list("abcdef")  # best deals first, missing scores last
+    assert result["rows"][0] == {"otokuna_score": 1.3, "monthly_cost": 100000, "rent": 95000, "area": 20.0,
+                                 "ward": "港区", "layout": "1K", "jnc_id": "a"}
+
+
+def test_filters(table):
+    result = run(table, ward=["港区", "渋谷区"], rent_max="140000", score_min="1.05")
+    assert result["total"] == 2
+    assert jnc_ids(result) == ["a", "c"]
+    assert jnc_ids(run(table, layout="1K", area_min="19")) == ["a", "f"]
+
+
+def test_sort_and_pagination(table):
+    result = run(table, sort="ward,-rent", page="2", page_size="2")
+    assert result["total"] == 6
+    assert [row["ward"] for row in result["rows"]] == ["渋谷区", "港区"]  # by code point
+    assert jnc_ids(result) == ["c", "b"]
+
+
+@pytest.mark.parametrize("args", [
+    {"rent_min": "cheap"},
+    {"page": "0"},
+    {"page_size": "100000"},
+    {"sort": "nonexistent"},
+])
+def test_invalid_query(table, args):
+    with pytest.raises(QueryError):
+        run(table, **args)
+
+
+def test_cache_key():
+    args = MultiDict([("ward", "渋谷区"), ("ward", "港区"), ("rent_max", "1.5e5")])
+    other_args = MultiDict([("rent_max", "150000"), ("ward", "港区"), ("ward", "渋谷区")])
+    assert ResultsQuery.from_args(args).cache_key() == ResultsQuery.from_args(other_args).cache_key()
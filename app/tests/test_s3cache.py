@@ -0,0 +1,61 @@
+import boto3
+import pytest
+from moto import mock_s3
+
+from s3cache import S3ObjectCache
+
+
+@pytest.fixture
+def bucket():
+    with mock_s3():
+        s3 = boto3.resource("s3", region_name="us-east-1")
+        bucket = s3.create_bucket(Bucket="somebucket")
+        yield bucket
+
+
+def read(cache, bucket, key):
+    with cache.open(bucket, key) as file:
+        return file.read()
+
+
+def test_hit_and_miss(bucket, tmp_path, redis_db):
+    bucket.put_object(Key="foo", Body=b"foo" * 10)
+    cache = S3ObjectCache(tmp_path / "cache", max_bytes=1000, redis=redis_db)
+
+    assert read(cache, bucket, "foo") == b"foo" * 10
+    assert read(cache, bucket, "foo") == b"foo" * 10
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"]) == (1, 1)
+    assert (metrics["bytes_saved"], metrics["bytes_downloaded"]) == (30, 30)
+    assert metrics["hit_rate"] == 0.5
+    assert (metrics["n_objects"], metrics["size_bytes"]) == (1, 30)
+
+    # Another instance (e.g. in another worker) shares the files and counters
+    other_cache = S3ObjectCache(tmp_path / "cache", max_bytes=1000, redis=redis_db)
+    assert read(other_cache, bucket, "foo") == b"foo" * 10
+    assert other_cache.metrics()["hits"] == 2
+
+
+def test_changed_object_is_refetched(bucket, tmp_path):
+    cache = S3ObjectCache(tmp_path / "cache", max_bytes=1000)
+    bucket.put_object(Key="foo", Body=b"old")
+    assert read(cache, bucket, "foo") == b"old"
+    bucket.put_object(Key="foo", Body=b"new")
+    assert read(cache, bucket, "foo") == b"new"
+
+
+def test_lru_eviction(bucket, tmp_path, redis_db):
+    cache = S3ObjectCache(tmp_path / "cache", max_bytes=250, redis=redis_db)
+    for key in ("a", "b"):
+        bucket.put_object(Key=key, Body=bytes(100))
+        read(cache, bucket, key)
+    read(cache, bucket, "a")  # "b" is now the least recently used
+
+    bucket.put_object(Key="c", Body=bytes(100))
+    read(cache, bucket, "c")
+    metrics = cache.metrics()
+    assert (metrics["n_objects"], metrics["evictions"]) == (2, 1)
+    read(cache, bucket, "a")
+    assert cache.metrics()["hits"] == 2
+    read(cache, bucket, "b")
+    assert cache.metrics()["misses"] == 4
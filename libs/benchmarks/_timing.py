@@ -0,0 +1,31 @@
+"""
+Timing helpers shared by the benchmark scripts (not part of the otokuna package).
+"""
+import re
+import subprocess
+import sys
+import time
+
+
+def timeit(func, repeat):
+    """Best time (in seconds) of `repeat` calls of func."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure_import_time(module, python=sys.executable, cwd=None) -> float:
+    """Import time (in milliseconds) of the given module in a fresh interpreter
+    (run from cwd, e.g. to import the modules of a folder).
+    """
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+    # lines are like: "import time:  self [us] | cumulative | imported package"
+    for line in reversed(result.stderr.splitlines()):
+        match = re.match(rf"import time:\s+\d+ \|\s+(\d+) \| {module}$", line)
+        if match:
+            return int(match.group(1)) / 1000
+    raise RuntimeError(f"Could not find the import time of {module}")
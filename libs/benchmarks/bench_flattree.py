@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark the NumPy-only inference of the quantile trees (otokuna.flattree)
+against the sklearn one (otokuna.tree).
+
+It reports:
+  * The import time of each module, in a fresh interpreter with
+    `python -X importtime` (i.e. the cold-start overhead in a Lambda).
+  * The predict_quantile time per 10k rows of each implementation, for a
+    tree fitted on random data with the given min_samples_leaf (checking
+    that both give identical predictions).
+
+Example (from the libs folder):
+./benchmarks/bench_flattree.py --n-rows 10000 100000 --out-filename bench_flattree.json
+"""
+import argparse
+import io
+import json
+import statistics
+
+import numpy as np
+
+from otokuna.flattree import FlatQuantileTree
+from otokuna.tree import DecisionTreeRegressorWithQuantiles
+
+from _timing import measure_import_time, timeit
+
+MODULES = ("otokuna.flattree", "otokuna.tree")
+
+
+def main(args):
+    results = {"import_ms": {}, "predict": []}
+    for module in MODULES:
+        times = [measure_import_time(module) for _ in range(args.repeat)]
+        results["import_ms"][module] = statistics.median(times)
+        print(f"import {module:<20} median: {results['import_ms'][module]:8.1f} ms")
+
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(args.n_train, args.n_features))
+    y = X @ rng.uniform(size=args.n_features) + rng.normal(scale=0.1, size=args.n_train)
+    model = DecisionTreeRegressorWithQuantiles(min_samples_leaf=args.min_samples_leaf, random_state=123,
+                                               quantiles=[0.1, 0.5, 0.9])
+    model.fit(X, y)
+    with io.BytesIO() as stream:
+        model.export_npz(stream)
+        npz_bytes = stream.getbuffer().nbytes
+        stream.seek(0)
+        tree = FlatQuantileTree.load(stream)
+    results.update(n_nodes=int(model.tree_.node_count), depth=int(model.get_depth()), npz_bytes=npz_bytes)
+    print(f"tree nodes: {results['n_nodes']}  depth: {results['depth']}  npz: {npz_bytes / 1024:.1f} KiB")
+
+    for n_rows in args.n_rows:
+        X_test = rng.uniform(size=(n_rows, args.n_features))
+        np.testing.assert_equal(tree.predict_quantile(X_test), model.predict_quantile(X_test))
+        per_10k = 10000 / n_rows * 1000
+        result = {
+            "n_rows": n_rows,
+            "sklearn_ms_per_10k": timeit(lambda: model.predict_quantile(X_test), args.repeat) * per_10k,
+            "flat_ms_per_10k": timeit(lambda: tree.predict_quantile(X_test), args.repeat) * per_10k,
+        }
+        results["predict"].append(result)
+        print(f"n_rows: {n_rows:>8}  sklearn: {result['sklearn_ms_per_10k']:8.2f} ms/10k  "
+              f"flat: {result['flat_ms_per_10k']:8.2f} ms/10k")
+
+    if args.out_filename:
+        with open(args.out_filename, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-rows", nargs="+", type=int, default=[10000, 100000])
+    parser.add_argument("--n-train", type=int, default=100000)
+    parser.add_argument("--n-features", type=int, default=10)
+    parser.add_argument("--min-samples-leaf", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="Times of each measurement")
+    parser.add_argument("--out-filename", help="JSON file where to write the results")
+    main(parser.parse_args())
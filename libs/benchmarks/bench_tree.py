@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark the fit and predict_quantile times of DecisionTreeRegressorWithQuantiles.
+
+The times are measured on random data for an increasing number of samples,
+with fully grown trees (min_samples_leaf=1 by default, i.e. about as many
+leaves as samples), which is the worst case for the quantiles computation.
+The time of the tree fit (DecisionTreeRegressor.fit) is reported apart, so
+the overhead of the quantiles is the difference. Optionally, the time of the
+former per-leaf masking approach is also reported for comparison (it is
+quadratic, so it is skipped above --masked-max-samples).
+
+Example (from the libs folder):
+./benchmarks/bench_tree.py --n-samples 1000 10000 100000 --out-filename bench_tree.json
+"""
+import argparse
+import json
+
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+
+from otokuna.tree import DecisionTreeRegressorWithQuantiles
+
+from _timing import timeit
+
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def make_data(n_samples, n_features, seed=0):
+    rng = np.random.RandomState(seed)
+    X = rng.uniform(size=(n_samples, n_features)).astype(np.float32)
+    y = X @ rng.uniform(size=n_features) + rng.normal(scale=0.1, size=n_samples)
+    return X, y
+
+
+def fit_quantiles_masked(model, X, y):
+    """The quantiles per leaf computed with one mask per leaf (the former implementation)."""
+    leaf_idx_pred = model.apply(X)
+    leaf_idxs, *_ = np.where(model.tree_.children_left == -1)
+    return {leaf: list(np.quantile(y[leaf_idx_pred == leaf], QUANTILES)) for leaf in leaf_idxs}
+
+
+def main(args):
+    results = []
+    for n_samples in args.n_samples:
+        X, y = make_data(n_samples, args.n_features)
+        params = dict(min_samples_leaf=args.min_samples_leaf, random_state=123)
+        model = DecisionTreeRegressorWithQuantiles(quantiles=QUANTILES, **params)
+
+        result = {
+            "n_samples": n_samples,
+            "tree_fit_s": timeit(lambda: DecisionTreeRegressor(**params).fit(X, y), args.repeat),
+            "fit_s": timeit(lambda: model.fit(X, y), args.repeat),
+            "predict_quantile_s": timeit(lambda: model.predict_quantile(X), args.repeat),
+            "n_leaves": int(model.get_n_leaves()),
+        }
+        if n_samples <= args.masked_max_samples:
+            result["masked_quantiles_s"] = timeit(lambda: fit_quantiles_masked(model, X, y), args.repeat)
+        results.append(result)
+
+        print(f"n_samples: {n_samples:>8}  leaves: {result['n_leaves']:>8}  "
+              f"tree fit: {result['tree_fit_s']:8.3f} s  fit: {result['fit_s']:8.3f} s  "
+              f"predict: {result['predict_quantile_s']:8.3f} s  "
+              f"masked: {result.get('masked_quantiles_s', float('nan')):8.3f} s")
+
+    if args.out_filename:
+        with open(args.out_filename, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-samples", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--n-features", type=int, default=10)
+    parser.add_argument("--min-samples-leaf", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="Times of each measurement (the best is reported)")
+    parser.add_argument("--masked-max-samples", type=int, default=20000,
+                        help="Largest number of samples to time the per-leaf masking approach with")
+    parser.add_argument("--out-filename", help="JSON file where to write the results")
+    main(parser.parse_args())
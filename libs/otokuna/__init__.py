@@ -1,4 +1,17 @@
+import importlib
+import pkgutil
 from pathlib import Path
 
 DATA_DIR = (Path(__file__).parent / "data").resolve()
 SUUMO_URL = "https://suumo.jp"
+
+# Submodules are imported lazily (on first attribute access) because some
+# of them pull heavy dependencies (e.g. pandas) that light consumers of
+# the package, such as the small Lambda functions, do not need.
+_SUBMODULES = tuple(sorted(info.name for info in pkgutil.iter_modules(__path__) if not info.name.startswith("_")))
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
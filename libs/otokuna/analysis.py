@@ -1,7 +1,9 @@
+import json
 import random
 import re
-from typing import List, Tuple, Union
+from typing import List, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from kanjize import int2kanji
 
@@ -112,6 +114,63 @@ def df2Xy(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
     return df[indep_vars], df.y
 
 
+# Quantiles predicted by the multi-quantile models (e.g. trained with
+# CatBoost's MultiQuantile loss), in the order of the model outputs.
+PREDICTION_QUANTILES = (0.1, 0.5, 0.9)
+
+
+def prediction_columns(n_outputs: int) -> List[str]:
+    """Names of the prediction columns of a model with the given number of
+    outputs: the point estimate (y_pred) for a single output model, or the
+    quantiles (y_q10, y_q50, ...) for a multi-quantile model.
+    """
+    if n_outputs == 1:
+        return ["y_pred"]
+    if n_outputs == len(PREDICTION_QUANTILES):
+        return [f"y_q{round(q * 100):02d}" for q in PREDICTION_QUANTILES]
+    raise ValueError(f"Unexpected number of model outputs: {n_outputs}")
+
+
+def predictions_dataframe(predictions, index: pd.Index) -> pd.DataFrame:
+    """Make a dataframe of the predictions of a model (an array of shape
+    (n_samples, n_outputs)). The predictions of a multi-quantile model also
+    get the median as y_pred.
+    """
+    predictions = np.asarray(predictions).reshape(len(index), -1)
+    df = pd.DataFrame(predictions, index=index, columns=prediction_columns(predictions.shape[1]))
+    if "y_pred" not in df:
+        df["y_pred"] = df[df.columns[len(df.columns) // 2]]  # the median
+    return df
+
+
+def interpolate_cdf(y, y_quantiles, quantiles: Sequence[float] = PREDICTION_QUANTILES) -> np.ndarray:
+    """Estimate the CDF at y of each sample from its predicted quantiles.
+
+    The CDF is interpolated linearly between the quantiles (extrapolated from
+    the first and last segments beyond them) and clipped to [0, 1]. The
+    quantiles of each sample are sorted first, since the quantiles of
+    independently boosted outputs may cross.
+
+    :param y: array of shape (n_samples,)
+    :param y_quantiles: array of shape (n_samples, n_quantiles)
+    :param quantiles: the quantiles (in increasing order) of the columns of y_quantiles
+    :return: array of shape (n_samples,), NaN where y or any quantile is NaN
+    """
+    y = np.asarray(y, dtype=np.float64)
+    y_quantiles = np.sort(np.asarray(y_quantiles, dtype=np.float64), axis=1)
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+    # segment of each sample: the number of inner quantiles below y
+    segment = (y_quantiles[:, 1:-1] < y[:, None]).sum(axis=1)
+    rows = np.arange(len(y))
+    x0, x1 = y_quantiles[rows, segment], y_quantiles[rows, segment + 1]
+    p0, p1 = quantiles[segment], quantiles[segment + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cdf = np.where(x1 > x0, p0 + (p1 - p0) * (y - x0) / (x1 - x0), np.where(y < x0, p0, p1))
+    cdf = np.clip(cdf, 0, 1)
+    cdf[np.isnan(y) | np.isnan(y_quantiles).any(axis=1)] = np.nan
+    return cdf
+
+
 def train_val_test_split(
         arrays: List[Union[pd.DataFrame, pd.Series]],
         val_ratio: float,
@@ -147,3 +206,74 @@ def train_val_test_split(
             arr.iloc[idxs[:n_test]]  # test
         ))
     return split
+
+
+def _compact_dtypes(df: pd.DataFrame, max_category_ratio=0.5) -> pd.DataFrame:
+    """Downcast the integer columns and make categories of the string columns
+    with few distinct values (e.g. ward, layout). The float columns are kept
+    as is so the displayed values do not change.
+    """
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_integer_dtype(series.dtype):
+            df[column] = pd.to_numeric(series, downcast="integer")
+        elif series.dtype == object and series.map(lambda v: isinstance(v, str)).all() \
+                and series.nunique() <= max_category_ratio * len(series):
+            df[column] = series.astype("category")
+    return df
+
+
+def make_results_dataframe(scraped_df: pd.DataFrame, prediction_df: pd.DataFrame) -> pd.DataFrame:
+    """Make the dataframe with the results shown to the users: the predictions
+    and the scraped data joined, scored, sorted by score (best deals first),
+    with display column names and compact dtypes.
+
+    For the predictions of a multi-quantile model it also adds the
+    otokuna_percentile score: the percentage of similar properties that are
+    predicted to cost more than the property (from its predicted quantiles).
+    """
+    # Add score columns
+    prediction_df = prediction_df.assign(otokuna_score=lambda df_: df_.y_pred / df_.y)
+    quantile_columns = prediction_columns(len(PREDICTION_QUANTILES))
+    if set(quantile_columns) <= set(prediction_df.columns):
+        cdf = interpolate_cdf(prediction_df.y, prediction_df[quantile_columns])
+        prediction_df["otokuna_percentile"] = 100 * (1 - cdf)
+    # Join data
+    df = prediction_df.join(scraped_df)
+    df.sort_values(by="otokuna_score", ascending=False, inplace=True)
+    # Rename columns to more readable names
+    df.rename(
+        inplace=True,
+        columns={"y": "monthly_cost", "y_pred": "monthly_cost_predicted",
+                 **{column: column.replace("y_", "monthly_cost_", 1) for column in quantile_columns}}
+    )
+    return _compact_dtypes(df)
+
+
+TOP_DEALS_COLUMNS = (
+    "otokuna_score", "monthly_cost", "monthly_cost_predicted", "building_title", "ward", "district",
+    "layout", "n_rooms", "area", "building_age", "walk_time_station_min", "url",
+)
+
+
+def make_top_deals(results_df: pd.DataFrame, n=10, group_by=("ward", "n_rooms"),
+                   columns=TOP_DEALS_COLUMNS) -> dict:
+    """Make compact tables of the n best deals (by otokuna_score) of each group
+    of each of the given columns (e.g. of each ward). The tables are plain
+    (JSON serializable) lists of rows, with the values in the order of columns:
+
+    {"n": 10, "columns": ["jnc_id", "otokuna_score", ...],
+     "groups": {"ward": {"中央区": [["100", 1.3, ...], ...], ...}, "n_rooms": {"1": [...], ...}}}
+    """
+    df = results_df[results_df.otokuna_score.notna()]
+    df = df.sort_values(by="otokuna_score", ascending=False, kind="mergesort")  # stable
+    df = df[list(columns)].reset_index()  # with the jnc_id
+    top_deals = {"n": n, "columns": list(df.columns), "groups": {}}
+    for column in group_by:
+        top_df = df.groupby(column, observed=True).head(n)  # keeps the order of df
+        top_deals["groups"][column] = {
+            str(key): json.loads(group.to_json(orient="values", force_ascii=False))
+            for key, group in top_df.groupby(column, observed=True, sort=True)
+        }
+    return top_deals
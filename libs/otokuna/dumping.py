@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import argparse
-import datetime
 import logging
 import time
 from pathlib import Path
@@ -12,7 +11,9 @@ import bs4
 import requests
 
 from otokuna import SUUMO_URL
-from otokuna.logging import setup_logger, LOCAL_TIMEZONE
+from otokuna.logging import setup_logger
+from otokuna.profiling import profile_cli
+from otokuna.timeutils import now_local
 
 TOKYO_SPECIAL_WARDS = (
     "千代田区", "中央区", "港区", "新宿区", "文京区", "台東区", "墨田区", "江東区",
@@ -25,11 +26,6 @@ SUUMO_TOKYO_SEARCH_URL = f"{SUUMO_URL}/chintai/tokyo/city/"
 #   See: https://www.soumu.go.jp/denshijiti/code.html
 
 
-def now_local():
-    """Returns the current datetime in the local timezone"""
-    return datetime.datetime.now(tz=LOCAL_TIMEZONE)
-
-
 def _get_condition_codes_by_value(soup, cond_id):
     codes_by_value = {}
     for checkbox in soup.find_all("input", attrs=dict(type="checkbox", name=cond_id)):
@@ -99,6 +95,17 @@ def add_results_per_page_param(url):
     return add_params(url, {"pc": ["50"]})
 
 
+def normalize_search_url(url):
+    """Canonical form of a search url, to identify identical searches.
+    The page and results per page parameters are removed (they do not change
+    the search results) and the parameters (and their values) are sorted.
+    """
+    u = urlparse(remove_params(url, ["page", "pc"]))
+    query = parse_qs(u.query, keep_blank_values=True)
+    u = u._replace(scheme=u.scheme.lower(), netloc=u.netloc.lower(), query="", fragment="")
+    return add_params(urlunparse(u), {param: sorted(query[param]) for param in sorted(query)})
+
+
 def build_search_url(*, building_categories: Sequence[str], wards: Sequence[str], only_today=True):
     """Build search url for properties in Tokyo (東京)
     TODO: support arbitrary cities
@@ -151,20 +158,34 @@ def scrape_number_of_pages(search_results_soup: bs4.BeautifulSoup) -> int:
     return last_page_number
 
 
+def scrape_number_of_results(search_results_soup: bs4.BeautifulSoup) -> Optional[int]:
+    """Scrape the total number of results (件) from a results page.
+    Returns None if the page does not show it (e.g. after a layout change).
+    """
+    hit = search_results_soup.find("div", class_="paginate_set-hit")
+    if hit is None:
+        return None
+    return int(next(hit.stripped_strings).replace(",", ""))
+
+
 def scrape_next_page_url(search_results_soup: bs4.BeautifulSoup) -> Optional[str]:
     next_elem = search_results_soup.find("div", class_="pagination pagination_set-nav").find(string="次へ")
     return f"{SUUMO_URL}{next_elem.parent['href']}" if next_elem else None
 
 
-def scrape_search_conditions(search_results_soup: bs4.BeautifulSoup) -> str:
-    """Scrape the (human readable) search conditions from a results page."""
+def scrape_search_conditions(search_results_soup: bs4.BeautifulSoup) -> Optional[str]:
+    """Scrape the (human readable) search conditions from a results page.
+    Returns None if the page does not show them (e.g. after a layout change).
+    """
     p = (
         # long case: text is partially and is fully shown via a toggle button
         search_results_soup.find("p", class_="conditionbox-info-txt conditionbox-info-txt--all")
         # short case: text is fully visible
         or search_results_soup.find("p", class_="conditionbox-info-txt")
     )
-    return list(p.stripped_strings)[0]
+    if p is None:
+        return None
+    return next(p.stripped_strings, None)
 
 
 def iter_search_results(search_url: str, sleep_time: float,
@@ -226,6 +247,7 @@ def dump_properties(dump_dir: str, building_categories: Sequence[str], wards: Se
             f.write(response.text)
 
 
+@profile_cli("dump-properties")
 def _main():
     parser = argparse.ArgumentParser(description="Search and dump property data of "
                                                  "Tokyo special wards from SUUMO.")
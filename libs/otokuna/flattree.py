@@ -0,0 +1,93 @@
+"""
+Inference of the quantile trees (see otokuna.tree) with NumPy only.
+
+A fitted DecisionTreeRegressorWithQuantiles is exported as a few flat arrays
+in a .npz file, which can be loaded and evaluated without scikit-learn (e.g.
+in the Lambdas, where it is not packaged).
+"""
+
+import numpy as np
+
+_FORMAT_VERSION = 1
+
+
+class FlatQuantileTree:
+    """A quantile tree as flat arrays, indexed by node id.
+
+    Parameters
+    ----------
+    feature : array of shape (n_nodes,)
+        The feature of the split of each node (-2 for leaves, as in sklearn).
+
+    threshold : array of shape (n_nodes,)
+        The threshold of the split of each node. The samples with
+        X[:, feature] <= threshold go to the left child.
+
+    children_left, children_right : array of shape (n_nodes,)
+        The children of each node (-1 for leaves).
+
+    node_quantiles : array of shape (n_nodes, n_quantiles)
+        The quantiles at each node (only meaningful for leaves).
+
+    quantiles : array of shape (n_quantiles,)
+        The quantiles (between 0 and 1) of the columns of node_quantiles.
+
+    n_features : int
+        The number of features of the samples.
+    """
+
+    def __init__(self, feature, threshold, children_left, children_right, node_quantiles, quantiles, n_features):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.children_left = np.asarray(children_left, dtype=np.int32)
+        self.children_right = np.asarray(children_right, dtype=np.int32)
+        self.node_quantiles = np.asarray(node_quantiles, dtype=np.float64)
+        self.quantiles = np.asarray(quantiles, dtype=np.float64)
+        self.n_features = int(n_features)
+
+    @classmethod
+    def load(cls, file):
+        """Load a tree from a .npz file (a filename or a file-like object)."""
+        with np.load(file) as arrays:
+            if int(arrays["format_version"]) != _FORMAT_VERSION:
+                raise ValueError(f"Unsupported format version: {int(arrays['format_version'])}")
+            return cls(arrays["feature"], arrays["threshold"], arrays["children_left"], arrays["children_right"],
+                       arrays["node_quantiles"], arrays["quantiles"], arrays["n_features"])
+
+    def save(self, file):
+        """Save the tree to a .npz file (a filename or a file-like object)."""
+        np.savez_compressed(
+            file, format_version=_FORMAT_VERSION, feature=self.feature, threshold=self.threshold,
+            children_left=self.children_left, children_right=self.children_right,
+            node_quantiles=self.node_quantiles, quantiles=self.quantiles, n_features=self.n_features
+        )
+
+    def apply(self, X):
+        """The leaf (node id) of each sample in X.
+
+        All the samples go down the tree at once, one level per iteration,
+        so it takes as many iterations as the depth of the tree.
+        """
+        # sklearn compares the samples as float32 against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X must be of shape (n_samples, {self.n_features}), got {X.shape}")
+        node = np.zeros(len(X), dtype=np.int32)
+        rows = np.arange(len(X))
+        while True:
+            internal = self.children_left[node[rows]] != -1
+            rows = rows[internal]
+            if len(rows) == 0:
+                return node
+            parents = node[rows]
+            go_left = X[rows, self.feature[parents]] <= self.threshold[parents]
+            node[rows] = np.where(go_left, self.children_left[parents], self.children_right[parents])
+
+    def predict_quantile(self, X):
+        """Predict the quantiles for X, as DecisionTreeRegressorWithQuantiles.predict_quantile.
+
+        Returns
+        -------
+        y : array of shape (n_samples, n_quantiles)
+        """
+        return self.node_quantiles[self.apply(X)]
@@ -0,0 +1,63 @@
+"""
+Loading of the ONNX models (and of their optimized variants) for inference.
+
+NOTE: Its dependencies (onnxruntime) are not included in the package.
+
+Besides the model (e.g. regressor.onnx), the ML pipeline may produce variants
+of it (pre-optimized graphs, ORT format, lower precision) and a manifest
+(regressor.manifest.json) that lists them, fastest first, with the results of
+their accuracy check (see ml/check_onnx.py). The paths of the variants are
+relative to the manifest.
+
+{"variants": [{"name": "ort", "filename": "regressor.ort", "optimization_level": "disable",
+               "passed": true, "max_ape": 1e-07, "session_ms": 4.1, "us_per_row": 1.9}, ...]}
+"""
+
+import json
+from pathlib import Path
+
+from onnxruntime import GraphOptimizationLevel, InferenceSession, SessionOptions
+
+OPTIMIZATION_LEVELS = {
+    "disable": GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def make_session(model_filename, optimization_level="all", threads=None) -> InferenceSession:
+    """Create an inference session of the given model. The pre-optimized
+    variants are loaded with optimization_level="disable", so their graph
+    is not optimized again on every cold start.
+    """
+    options = SessionOptions()
+    options.graph_optimization_level = OPTIMIZATION_LEVELS[optimization_level]
+    if threads is not None:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return InferenceSession(str(model_filename), options)
+
+
+def manifest_filename(model_filename) -> Path:
+    """e.g. models/regressor.onnx -> models/regressor.manifest.json"""
+    return Path(model_filename).with_suffix(".manifest.json")
+
+
+def select_variant(model_filename) -> dict:
+    """The fastest variant of the model that passed the accuracy check, as
+    listed in its manifest, with its filename resolved. Defaults to the model
+    itself (with the default optimizations) if there is no manifest or no
+    variant passed.
+    """
+    default = {"name": "default", "filename": str(model_filename), "optimization_level": "all"}
+    path = manifest_filename(model_filename)
+    if not path.exists():
+        return default
+    with open(path) as file:
+        manifest = json.load(file)
+    for variant in manifest["variants"]:
+        filename = path.parent / variant["filename"]
+        if variant["passed"] and filename.exists():
+            return {**variant, "filename": str(filename)}
+    return default
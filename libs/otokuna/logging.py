@@ -1,7 +1,15 @@
 import datetime
+import functools
+import inspect
+import json
 import logging
+import resource
+import sys
+import time
+from typing import Dict, Optional
 
 LOCAL_TIMEZONE = datetime.datetime.now(datetime.timezone.utc).astimezone().tzinfo
+METRICS_NAMESPACE = "otokuna"
 
 
 class _Iso8601Formatter(logging.Formatter):
@@ -46,3 +54,106 @@ def setup_logger(name, filename=None, include_timestamp=True, propagate=True):
 
     # TODO: figure out how to use coloredlogs with custom formatter
     return logger
+
+
+class StageMetrics:
+    """Records performance metrics of a pipeline stage.
+
+    Use it as a context manager around the body of the stage. On exit, it
+    records the duration and the peak RSS of the process, prints the metrics
+    as a single JSON line in CloudWatch Embedded Metric Format (EMF) and, if
+    an event was given, stores them in event["metrics"][stage] so that they
+    are passed along the pipeline. The metrics are also emitted if the stage
+    raises an exception.
+
+    Counters (pages, properties, bytes_read, bytes_written, retries) and
+    timings (model_load, inference) are incremented with `add`.
+
+    Note that the peak RSS is that of the process lifetime, which in AWS
+    Lambda spans all the invocations of a warm container.
+
+    Example:
+        with StageMetrics("predict", event) as metrics:
+            ...
+            metrics.add("properties", len(df))
+
+    Lambda handlers are better decorated with stage_metrics.
+    """
+    UNITS = {
+        "duration": "Seconds",
+        "peak_rss": "Bytes",
+        "pages": "Count",
+        "properties": "Count",
+        "bytes_read": "Bytes",
+        "bytes_written": "Bytes",
+        "retries": "Count",
+        "model_load": "Seconds",
+        "inference": "Seconds",
+    }
+
+    def __init__(self, stage: str, event: Optional[Dict] = None,
+                 namespace: str = METRICS_NAMESPACE, stream=None):
+        self.stage = stage
+        self.event = event
+        self.namespace = namespace
+        self.stream = stream
+        self.values = {name: 0 for name in self.UNITS}
+        self._start = None
+
+    def add(self, name: str, value=1):
+        """Increment the given counter."""
+        if name not in self.UNITS:
+            raise ValueError(f"Unknown metric: {name}")
+        self.values[name] += value
+
+    def to_emf(self) -> Dict:
+        """Metrics as a CloudWatch Embedded Metric Format object."""
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [["stage"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, unit in self.UNITS.items()],
+                }],
+            },
+            "stage": self.stage,
+            **self.values,
+        }
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.values["duration"] = time.perf_counter() - self._start
+        # ru_maxrss is in kilobytes in Linux
+        self.values["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        # Printed instead of logged because EMF requires the line to be just the JSON object
+        print(json.dumps(self.to_emf()), file=self.stream or sys.stdout, flush=True)
+        if self.event is not None:
+            self.event.setdefault("metrics", {})[self.stage] = dict(self.values)
+
+
+def stage_metrics(stage: str):
+    """Decorator to record the StageMetrics of a Lambda handler with signature
+    (event, context). If the handler also takes a `metrics` argument, the
+    StageMetrics is passed in it (e.g. to increment the counters).
+
+    Example:
+        @stage_metrics("predict")
+        def main(event, context, metrics):
+            ...
+            metrics.add("properties", len(df))
+    """
+    def decorator(handler):
+        takes_metrics = "metrics" in inspect.signature(handler).parameters
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            with StageMetrics(stage, event) as metrics:
+                if takes_metrics:
+                    return handler(event, context, metrics=metrics)
+                return handler(event, context)
+        return wrapper
+    return decorator
@@ -0,0 +1,144 @@
+"""
+Opt-in profiling of the pipeline handlers and command-line entry points.
+
+Profiling is enabled by setting the OTOKUNA_PROFILE environment variable:
+- OTOKUNA_PROFILE=cpu: profiles with cProfile and writes a pstats file (.prof).
+- OTOKUNA_PROFILE=mem: traces allocations with tracemalloc and writes a text
+  report (.txt) with the peak traced memory and the top allocations by line.
+
+The profiles are written to the folder given by OTOKUNA_PROFILE_DIR (the
+temporary folder by default, which is /tmp in AWS Lambda). If
+OTOKUNA_PROFILE_BUCKET is set, handler profiles are also uploaded to that
+bucket under the "profiles" folder of the root_key of the job.
+
+When OTOKUNA_PROFILE is not set, the wrapped function is called directly (the
+profilers are not even imported).
+"""
+import contextlib
+import datetime
+import functools
+import logging
+import os
+import posixpath
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+PROFILE_ENV_VAR = "OTOKUNA_PROFILE"
+PROFILE_DIR_ENV_VAR = "OTOKUNA_PROFILE_DIR"
+PROFILE_BUCKET_ENV_VAR = "OTOKUNA_PROFILE_BUCKET"
+MODES = ("cpu", "mem")
+N_TOP_ALLOCATIONS = 50
+
+logger = logging.getLogger(__name__)
+
+
+def _profile_mode() -> Optional[str]:
+    mode = os.environ.get(PROFILE_ENV_VAR)
+    if mode and mode not in MODES:
+        raise ValueError(f"Invalid {PROFILE_ENV_VAR}: {mode} (must be one of {MODES})")
+    return mode or None
+
+
+def _write_memory_report(snapshot, peak: int, filename: Path):
+    with open(filename, "w") as file:
+        file.write(f"Peak traced memory: {peak / 2 ** 20:.1f} MiB\n")
+        file.write(f"Top {N_TOP_ALLOCATIONS} allocations by line:\n")
+        for stat in snapshot.statistics("lineno")[:N_TOP_ALLOCATIONS]:
+            file.write(f"{stat}\n")
+
+
+def _upload(filename: Path, bucket: str, key: str):
+    import boto3  # only needed when uploading, and not a dependency of the library
+    boto3.client("s3").upload_file(Filename=str(filename), Bucket=bucket, Key=key)
+
+
+@contextlib.contextmanager
+def profile(name: str):
+    """Profile the enclosed block if OTOKUNA_PROFILE is set.
+
+    It yields None if profiling is off, or a dict that will hold the
+    "filename" of the written profile once the block exits.
+    """
+    mode = _profile_mode()
+    if mode is None:
+        yield None
+        return
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    profile_dir = Path(os.environ.get(PROFILE_DIR_ENV_VAR) or tempfile.gettempdir())
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    result = {}
+    if mode == "cpu":
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            filename = profile_dir / f"{name}-{timestamp}.prof"
+            pstats.Stats(profiler).dump_stats(filename)
+            result["filename"] = filename
+    else:  # mode == "mem"
+        import tracemalloc
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        try:
+            yield result
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if not was_tracing:
+                tracemalloc.stop()
+            filename = profile_dir / f"{name}-{timestamp}.txt"
+            _write_memory_report(snapshot, peak, filename)
+            result["filename"] = filename
+    logger.info(f"Wrote {mode} profile of {name} to {result['filename']}")
+
+
+def profile_handler(name: str):
+    """Decorator to profile a Lambda handler with signature (event, context).
+
+    If OTOKUNA_PROFILE_BUCKET is set, the profile is also uploaded to
+    "[root_key]/profiles/[filename]" where root_key is taken from the output
+    event (or from the input event if the handler failed). If the event has
+    no root_key (e.g. the branches of the daily dump) the parent folder of the
+    base_path is used instead, since the base_path is the folder of the dumped
+    pages (which is zipped and scraped as a whole by the later stages).
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if _profile_mode() is None:
+                return handler(event, context)
+
+            output, result = None, {}
+            try:
+                with profile(name) as result:
+                    output = handler(event, context)
+            finally:
+                # Uploaded also if the handler failed (the exception is re-raised)
+                bucket = os.environ.get(PROFILE_BUCKET_ENV_VAR)
+                event_ = output if isinstance(output, dict) else event
+                prefix = event_.get("root_key") or posixpath.dirname(event_.get("base_path", ""))
+                if bucket and prefix and "filename" in result:
+                    key = f"{prefix}/profiles/{result['filename'].name}"
+                    _upload(result["filename"], bucket, key)
+                    logger.info(f"Uploaded profile of {name} to s3://{bucket}/{key}")
+            return output
+        return wrapper
+    return decorator
+
+
+def profile_cli(name: str):
+    """Decorator to profile a command-line entry point."""
+    def decorator(main):
+        @functools.wraps(main)
+        def wrapper(*args, **kwargs):
+            with profile(name):
+                return main(*args, **kwargs)
+        return wrapper
+    return decorator
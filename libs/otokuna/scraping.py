@@ -14,10 +14,10 @@ import attr
 import bs4
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
 
 from otokuna import SUUMO_URL
 from otokuna.logging import setup_logger
+from otokuna.profiling import profile_cli
 
 _FileLike = Union[str, PathLike, IO[bytes]]
 
@@ -307,9 +307,15 @@ def scrape_properties_from_files(
     n_jobs=-1 to use all CPU cores (defaults to 1 core). It returns a flattened
     list with the properties scraped from all files.
     """
-    lists = Parallel(n_jobs=n_jobs)(
-        delayed(scrape_properties_from_file)(filename, zip_filename, logger) for filename in filenames
-    )
+    if n_jobs == 1:
+        lists = [scrape_properties_from_file(filename, zip_filename, logger) for filename in filenames]
+    else:
+        # joblib is imported only when needed to keep the import time low
+        # in environments that cannot run in parallel anyway (e.g. AWS Lambda)
+        from joblib import Parallel, delayed
+        lists = Parallel(n_jobs=n_jobs)(
+            delayed(scrape_properties_from_file)(filename, zip_filename, logger) for filename in filenames
+        )
     return [p for sublist in lists for p in sublist]  # flatten
 
 
@@ -363,6 +369,7 @@ def make_properties_dataframe(
     return df
 
 
+@profile_cli("scrape-properties")
 def _main():
     logger = setup_logger("scrape-properties")
 
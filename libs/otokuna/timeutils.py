@@ -0,0 +1,8 @@
+import datetime
+
+from otokuna.logging import LOCAL_TIMEZONE
+
+
+def now_local():
+    """Returns the current datetime in the local timezone"""
+    return datetime.datetime.now(tz=LOCAL_TIMEZONE)
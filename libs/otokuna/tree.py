@@ -4,7 +4,13 @@ Its dependencies are not included in the package.
 """
 
 import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, RegressorMixin
 from sklearn.tree import DecisionTreeRegressor
+from sklearn.utils import check_random_state
+from sklearn.utils.validation import check_array, check_is_fitted, check_X_y
+
+from otokuna.flattree import FlatQuantileTree
 
 
 class DecisionTreeRegressorWithQuantiles(DecisionTreeRegressor):
@@ -28,7 +34,12 @@ class DecisionTreeRegressorWithQuantiles(DecisionTreeRegressor):
 
     Attributes
     ----------
-    quantiles_by_leaf_ : dict[int, list[float]]
+    node_quantiles_ : ndarray of shape (n_nodes, n_quantiles)
+        The quantiles at each node of the learned tree, indexed by node id
+        (as returned by `apply`). Only the rows of the leaf nodes are set, the
+        other rows are NaN.
+
+    quantiles_by_leaf_idx_ : dict[int, list[float]]
         The quantiles at each leaf node of the learned tree.
 
     Other attributes are the same as DecisionTreeRegressor.
@@ -51,22 +62,27 @@ class DecisionTreeRegressorWithQuantiles(DecisionTreeRegressor):
     def fit(self, X, y, sample_weight=None, check_input=True, X_idx_sorted="deprecated"):
         """Refer to `DecisionTreeRegressor.fit`"""
         super().fit(X, y, sample_weight, check_input, X_idx_sorted)
-        try:
-            quantiles = list(self.quantiles)
-        except TypeError:
-            quantiles = list([self.quantiles])
+        quantiles = np.atleast_1d(np.asarray(self.quantiles, dtype=np.float64))
+        y = np.asarray(y, dtype=np.float64).reshape(-1)
 
-        leaf_idx_pred = self.apply(X)
+        # Sort the samples by leaf once and compute the quantiles of all the leaves at once
         leaf_idxs, *_ = np.where(self.tree_.children_left == -1)
+        y_sorted, offsets = _sort_by_leaf(self.apply(X), y, self.tree_.node_count)
+        starts, counts = offsets[leaf_idxs], np.diff(offsets)[leaf_idxs]
 
         # Sanity check
-        assert np.all(np.sort(leaf_idxs) == np.unique(leaf_idx_pred))
+        assert np.all(counts > 0) and counts.sum() == len(y)
 
-        self.quantiles_by_leaf_idx_ = {}
-        for leaf in leaf_idxs:
-            self.quantiles_by_leaf_idx_[leaf] = list(np.quantile(y[leaf_idx_pred == leaf], quantiles))
+        self.node_quantiles_ = np.full((self.tree_.node_count, len(quantiles)), np.nan)
+        self.node_quantiles_[leaf_idxs] = _segment_quantiles(y_sorted, starts, counts, quantiles)
         return self
 
+    @property
+    def quantiles_by_leaf_idx_(self):
+        """dict[int, list[float]]: The quantiles at each leaf node of the learned tree."""
+        leaf_idxs, *_ = np.where(self.tree_.children_left == -1)
+        return {leaf: list(self.node_quantiles_[leaf]) for leaf in leaf_idxs}
+
     def predict_quantile(self, X, check_input=True):
         """Predict quantile values for X.
 
@@ -90,5 +106,298 @@ class DecisionTreeRegressorWithQuantiles(DecisionTreeRegressor):
         y : array-like of shape (n_samples, n_quantiles)
             The predicted quantiles.
         """
-        leaf_idx_pred = self.apply(X, check_input)
-        return np.stack([np.asarray(self.quantiles_by_leaf_idx_[li]) for li in leaf_idx_pred])
+        return self.node_quantiles_[self.apply(X, check_input)]
+
+    def to_flat(self) -> FlatQuantileTree:
+        """The fitted tree as flat arrays, for inference without sklearn."""
+        check_is_fitted(self)
+        return FlatQuantileTree(
+            feature=self.tree_.feature, threshold=self.tree_.threshold,
+            children_left=self.tree_.children_left, children_right=self.tree_.children_right,
+            node_quantiles=self.node_quantiles_, quantiles=np.atleast_1d(self.quantiles),
+            n_features=self.n_features_in_
+        )
+
+    def export_npz(self, file):
+        """Export the fitted tree to a .npz file, which can be loaded with
+        `otokuna.flattree.FlatQuantileTree.load` without sklearn.
+        """
+        self.to_flat().save(file)
+
+
+class QuantileRegressionForest(RegressorMixin, BaseEstimator):
+    """Quantile Regression Forest (Meinshausen, 2006).
+
+    A forest of trees fitted on bootstrap samples (as a random forest) that
+    estimates the conditional distribution of the target instead of only its
+    mean. The distribution for a given sample is that of the training targets
+    that fall in the same leaves as the sample, where each target is weighted
+    by 1 / (n_estimators * size of its leaf) for each tree.
+
+    The trees are fitted in parallel processes. The training targets of each
+    tree are kept compactly as a single array sorted by leaf plus the offsets
+    of the leaves, and the quantiles are computed at predict time for batches
+    of samples at once.
+
+    Parameters
+    ----------
+    quantiles : float or array-like, default=(0.1, 0.5, 0.9)
+        Quantile or sequence of quantiles to compute by default in
+        `predict_quantile`, which must be between 0 and 1 inclusive.
+
+    n_estimators : int, default=100
+        The number of trees in the forest.
+
+    min_samples_leaf : int, default=5
+        The minimum number of samples required to be at a leaf node.
+        Larger leaves give smoother (but less local) distributions.
+
+    max_depth, max_features, max_leaf_nodes
+        Same as in DecisionTreeRegressor.
+
+    bootstrap : bool, default=True
+        Whether to fit each tree on a bootstrap sample of the training data.
+
+    n_jobs : int, default=None
+        The number of processes to fit the trees with (as in joblib, None
+        means 1 and -1 means all the CPUs).
+
+    batch_size : int, default=1000
+        The number of samples whose quantiles are computed at once, which
+        bounds the memory used at predict time.
+
+    random_state : int, RandomState instance or None, default=None
+        Controls the bootstrap samples and the randomness of the trees.
+
+    Attributes
+    ----------
+    estimators_ : list of DecisionTreeRegressor
+        The fitted trees.
+
+    y_sorted_ : list of ndarray of shape (n_samples,)
+        The training (bootstrap) targets of each tree, sorted by leaf and by
+        value within each leaf.
+
+    offsets_ : list of ndarray of shape (n_nodes + 1,)
+        The targets of node i of each tree are y_sorted_[offsets_[i]:offsets_[i + 1]].
+    """
+
+    def __init__(
+            self, *, quantiles=(0.1, 0.5, 0.9), n_estimators=100, min_samples_leaf=5,
+            max_depth=None, max_features=None, max_leaf_nodes=None, bootstrap=True,
+            n_jobs=None, batch_size=1000, random_state=None
+    ):
+        self.quantiles = quantiles
+        self.n_estimators = n_estimators
+        self.min_samples_leaf = min_samples_leaf
+        self.max_depth = max_depth
+        self.max_features = max_features
+        self.max_leaf_nodes = max_leaf_nodes
+        self.bootstrap = bootstrap
+        self.n_jobs = n_jobs
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        """Build the forest of trees from the training set (X, y).
+
+        Parameters
+        ----------
+        X : array-like of shape (n_samples, n_features)
+            The training input samples.
+
+        y : array-like of shape (n_samples,)
+            The target values.
+
+        Returns
+        -------
+        self : QuantileRegressionForest
+        """
+        X, y = check_X_y(X, y, dtype=np.float32, y_numeric=True)
+        y = y.astype(np.float64)
+        seeds = check_random_state(self.random_state).randint(np.iinfo(np.int32).max, size=self.n_estimators)
+        trees = [
+            DecisionTreeRegressor(min_samples_leaf=self.min_samples_leaf, max_depth=self.max_depth,
+                                  max_features=self.max_features, max_leaf_nodes=self.max_leaf_nodes,
+                                  random_state=seed)
+            for seed in seeds
+        ]
+        fitted = Parallel(n_jobs=self.n_jobs, prefer="processes")(
+            delayed(_fit_tree)(tree, X, y, self.bootstrap, seed) for tree, seed in zip(trees, seeds)
+        )
+        self.estimators_, self.y_sorted_, self.offsets_ = map(list, zip(*fitted))
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def predict(self, X):
+        """Predict the (conditional mean) target for X, as the average of the trees predictions."""
+        X = self._check_X(X)
+        return np.mean([tree.predict(X, check_input=False) for tree in self.estimators_], axis=0)
+
+    def predict_quantile(self, X, quantiles=None):
+        """Predict the quantiles of the target for X.
+
+        The quantiles are those of the weighted training targets in the leaves
+        of each sample (the smallest target whose cumulative weight reaches the
+        quantile, without interpolation).
+
+        Parameters
+        ----------
+        X : array-like of shape (n_samples, n_features)
+            The input samples.
+
+        quantiles : float or array-like, default=None
+            The quantiles to compute. Defaults to the `quantiles` parameter.
+
+        Returns
+        -------
+        y : ndarray of shape (n_samples, n_quantiles)
+            The predicted quantiles.
+        """
+        quantiles = np.atleast_1d(np.asarray(self.quantiles if quantiles is None else quantiles, dtype=np.float64))
+        X = self._check_X(X)
+        result = np.empty((len(X), len(quantiles)))
+        for start in range(0, len(X), self.batch_size):
+            values, _, cum_weights, bounds = self._leaf_targets(X[start:start + self.batch_size])
+            n_batch = len(bounds) - 1
+            # The segments of the samples are sorted, and the cumulative weights
+            # increase within each segment up to 1, so the sample id plus the
+            # cumulative weight is sorted over all the batch and one search
+            # finds the quantiles of all the samples.
+            keys = np.repeat(np.arange(n_batch), np.diff(bounds)) + cum_weights
+            positions = np.searchsorted(keys, np.arange(n_batch)[:, None] + quantiles[None, :] - _WEIGHT_EPS)
+            positions = np.clip(positions, bounds[:-1, None], bounds[1:, None] - 1)
+            result[start:start + n_batch] = values[positions]
+        return result
+
+    def predict_cdf(self, X, y):
+        """Predict the cumulative distribution of the target at y for X.
+
+        That is the percentile (as a fraction between 0 and 1) of each given
+        target within its predicted distribution, e.g. a monthly cost at the
+        0.05 percentile is cheaper than 95% of the similar properties.
+
+        Parameters
+        ----------
+        X : array-like of shape (n_samples, n_features)
+            The input samples.
+
+        y : array-like of shape (n_samples,)
+            The target values to evaluate the distributions at.
+
+        Returns
+        -------
+        cdf : ndarray of shape (n_samples,)
+        """
+        X = self._check_X(X)
+        y = np.asarray(y, dtype=np.float64).reshape(-1)
+        result = np.empty(len(X))
+        for start in range(0, len(X), self.batch_size):
+            values, weights, _, bounds = self._leaf_targets(X[start:start + self.batch_size])
+            y_batch = np.repeat(y[start:start + self.batch_size], np.diff(bounds))
+            result[start:start + len(bounds) - 1] = np.add.reduceat(weights * (values <= y_batch), bounds[:-1])
+        return np.minimum(result, 1.0)
+
+    def _check_X(self, X):
+        check_is_fitted(self)
+        X = check_array(X, dtype=np.float32)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but the forest was fitted with {self.n_features_in_}")
+        return X
+
+    def _leaf_targets(self, X):
+        """The weighted training targets in the leaves of each sample.
+
+        Returns
+        -------
+        values : ndarray
+            The targets, sorted by sample and by value within each sample, such
+            that the targets of sample i are values[bounds[i]:bounds[i + 1]].
+
+        weights : ndarray
+            The weights of the targets (which add up to 1 for each sample).
+
+        cum_weights : ndarray
+            The cumulative weights of the targets within each sample.
+
+        bounds : ndarray of shape (n_samples + 1,)
+        """
+        sample_ids, values, weights = [], [], []
+        for tree, y_sorted, offsets in zip(self.estimators_, self.y_sorted_, self.offsets_):
+            leaves = tree.apply(X, check_input=False)
+            starts, counts = offsets[leaves], offsets[leaves + 1] - offsets[leaves]
+            sample_ids.append(np.repeat(np.arange(len(X)), counts))
+            values.append(y_sorted[_concat_ranges(starts, counts)])
+            weights.append(np.repeat(1 / counts, counts))
+        sample_ids, values, weights = map(np.concatenate, (sample_ids, values, weights))
+
+        order = np.lexsort((values, sample_ids))
+        values, weights = values[order], weights[order] / len(self.estimators_)
+        bounds = np.zeros(len(X) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(sample_ids, minlength=len(X)), out=bounds[1:])
+        cum_weights = np.cumsum(weights)
+        cum_weights -= np.repeat(np.concatenate([[0.0], cum_weights])[bounds[:-1]], np.diff(bounds))
+        return values, weights, cum_weights, bounds
+
+
+# Tolerance of the comparisons of the cumulative weights, which are sums of
+# many (inexact) fractions, to the quantiles
+_WEIGHT_EPS = 1e-9
+
+
+def _fit_tree(tree, X, y, bootstrap, seed):
+    """Fit a tree of the forest and sort its training targets by leaf."""
+    if bootstrap:
+        # Each sample weighted by the number of times it is drawn, as in
+        # sklearn's forests, instead of copying X
+        counts = np.bincount(np.random.RandomState(seed).randint(len(y), size=len(y)), minlength=len(y))
+        tree.fit(X, y, sample_weight=counts.astype(np.float64), check_input=False)
+    else:
+        counts = np.ones(len(y), dtype=np.intp)
+        tree.fit(X, y, check_input=False)
+    in_bag = counts > 0
+    leaf_idx = np.repeat(tree.apply(X[in_bag], check_input=False), counts[in_bag])
+    y_sorted, offsets = _sort_by_leaf(leaf_idx, np.repeat(y[in_bag], counts[in_bag]), tree.tree_.node_count)
+    return tree, y_sorted, offsets
+
+
+def _concat_ranges(starts, counts):
+    """The concatenation of the ranges np.arange(start, start + count)."""
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends - counts), counts)
+
+
+def _sort_by_leaf(leaf_idx, y, n_nodes):
+    """Sort the targets by leaf (and by value within each leaf).
+
+    Returns
+    -------
+    y_sorted : array of shape (n_samples,)
+        The targets, such that the targets of node i are the (sorted) segment
+        y_sorted[offsets[i]:offsets[i + 1]] (empty for the non-leaf nodes).
+
+    offsets : array of shape (n_nodes + 1,)
+    """
+    order = np.lexsort((y, leaf_idx))
+    offsets = np.zeros(n_nodes + 1, dtype=np.intp)
+    np.cumsum(np.bincount(leaf_idx, minlength=n_nodes), out=offsets[1:])
+    return y[order], offsets
+
+
+def _segment_quantiles(y_sorted, starts, counts, quantiles):
+    """Quantiles of each of the sorted segments y_sorted[start:start + count].
+
+    Same as `np.quantile` (with the default linear interpolation) on each
+    segment, computed for all the segments and quantiles at once.
+
+    Returns
+    -------
+    array of shape (n_segments, n_quantiles)
+    """
+    positions = (counts[:, None] - 1) * quantiles[None, :]
+    below = np.floor(positions).astype(np.intp)
+    above = np.minimum(below + 1, counts[:, None] - 1)
+    fraction = positions - below
+    y_below = y_sorted[starts[:, None] + below]
+    y_above = y_sorted[starts[:, None] + above]
+    return y_below + (y_above - y_below) * fraction
@@ -1,8 +1,13 @@
+import json
+
 import numpy as np
 import pandas as pd
 import pytest
 
-from otokuna.analysis import _build_address_kanji, add_address_coords, train_val_test_split
+from otokuna.analysis import (
+    _build_address_kanji, add_address_coords, interpolate_cdf, make_results_dataframe, make_top_deals,
+    predictions_dataframe, train_val_test_split
+)
 
 
 @pytest.mark.parametrize("address,expected", [
@@ -61,3 +66,91 @@ def test_train_val_test_split(array):
     assert not set(train.index) & set(val.index)
     assert not set(train.index) & set(test.index)
     assert not set(val.index) & set(test.index)
+
+
+def test_make_results_dataframe():
+    index = pd.Index(["a", "b", "c", "d"], name="jnc_id")
+    scraped_df = pd.DataFrame(
+        {
+            "rent": [100000, 80000, 120000, 90000],
+            "area": [20.35, 25.1, 30.0, 18.5],
+            "ward": ["港区", "港区", "港区", "渋谷区"],
+            "building_title": ["A", "B", "C", "D"],
+        },
+        index=index,
+    )
+    prediction_df = pd.DataFrame(
+        {"y": [100000, 80000, 120000, 90000], "y_pred": [110000.0, 72000.0, 150000.0, np.nan]},
+        index=index,
+    )
+
+    df = make_results_dataframe(scraped_df, prediction_df)
+
+    assert list(df.columns) == ["monthly_cost", "monthly_cost_predicted", "otokuna_score",
+                                "rent", "area", "ward", "building_title"]
+    assert list(df.index) == ["c", "a", "b", "d"]  # best deals first, NaN last
+    np.testing.assert_allclose(df.otokuna_score[:3], [1.25, 1.1, 0.9])
+    assert df.rent.dtype == np.int32
+    assert df.ward.dtype == "category"
+    assert df.building_title.dtype == object  # not repeated enough to be a category
+    assert df.area.tolist() == scraped_df.loc[df.index, "area"].tolist()
+
+
+def test_make_results_dataframe_quantiles():
+    index = pd.Index(["a", "b"], name="jnc_id")
+    scraped_df = pd.DataFrame({"rent": [100000, 80000]}, index=index)
+    prediction_df = pd.DataFrame({"y": [100000, 80000]}, index=index).join(
+        predictions_dataframe([[90000, 110000, 130000], [70000, 80000, 90000]], index))
+
+    df = make_results_dataframe(scraped_df, prediction_df)
+
+    assert list(df.columns) == ["monthly_cost", "monthly_cost_q10", "monthly_cost_q50", "monthly_cost_q90",
+                                "monthly_cost_predicted", "otokuna_score", "otokuna_percentile", "rent"]
+    assert list(df.index) == ["a", "b"]
+    np.testing.assert_allclose(df.monthly_cost_predicted, [110000, 80000])
+    np.testing.assert_allclose(df.otokuna_percentile, [70, 50])
+
+
+def test_predictions_dataframe():
+    index = pd.Index(["a", "b"], name="jnc_id")
+    pd.testing.assert_frame_equal(predictions_dataframe(np.array([[1.0], [2.0]]), index),
+                                  pd.DataFrame({"y_pred": [1.0, 2.0]}, index=index))
+    df = predictions_dataframe(np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]), index)
+    assert list(df.columns) == ["y_q10", "y_q50", "y_q90", "y_pred"]
+    assert df.y_pred.tolist() == [2.0, 5.0]
+    with pytest.raises(ValueError):
+        predictions_dataframe(np.ones((2, 2)), index)
+
+
+def test_interpolate_cdf():
+    y_quantiles = [[10, 20, 30]] * 7 + [[30, 20, 10], [10, 10, 30], [10, np.nan, 30]]
+    y = [10, 15, 20, 25, 30, 0, 100, 15, 10, 20]
+    np.testing.assert_allclose(interpolate_cdf(y, y_quantiles),
+                               [0.1, 0.3, 0.5, 0.7, 0.9, 0, 1, 0.3, 0.5, np.nan])
+
+
+def test_make_top_deals():
+    results_df = pd.DataFrame(
+        {
+            "otokuna_score": [1.3, 1.2, 1.1, 1.0, 0.9, np.nan],
+            "rent": [95000, 150000, 85000, 130000, 75000, 65000],
+            "ward": pd.Categorical(["港区", "港区", "渋谷区", "港区", "渋谷区", "港区"]),
+            "n_rooms": np.array([1, 2, 1, 1, 1, 1], dtype=np.int8),
+        },
+        index=pd.Index(list("abcdef"), name="jnc_id"),
+    )
+
+    top_deals = make_top_deals(results_df, n=2, columns=("otokuna_score", "rent", "ward", "n_rooms"))
+
+    assert top_deals["columns"] == ["jnc_id", "otokuna_score", "rent", "ward", "n_rooms"]
+    assert top_deals["groups"] == {
+        "ward": {
+            "渋谷区": [["c", 1.1, 85000, "渋谷区", 1], ["e", 0.9, 75000, "渋谷区", 1]],
+            "港区": [["a", 1.3, 95000, "港区", 1], ["b", 1.2, 150000, "港区", 2]],
+        },
+        "n_rooms": {
+            "1": [["a", 1.3, 95000, "港区", 1], ["c", 1.1, 85000, "渋谷区", 1]],
+            "2": [["b", 1.2, 150000, "港区", 2]],
+        },
+    }
+    assert json.loads(json.dumps(top_deals)) == top_deals
@@ -8,9 +8,9 @@ import pytest
 from otokuna.dumping import (
     _get_condition_codes_by_value, _build_condition_codes,
     build_search_url, iter_search_results,
-    scrape_number_of_pages, scrape_next_page_url, scrape_search_conditions,
+    scrape_number_of_pages, scrape_number_of_results, scrape_next_page_url, scrape_search_conditions,
     add_params, remove_params,
-    add_results_per_page_param, remove_page_param,
+    add_results_per_page_param, remove_page_param, normalize_search_url,
     SUUMO_TOKYO_SEARCH_URL
 )
 from otokuna.testing import build_mock_requests_get
@@ -83,6 +83,18 @@ def test_add_results_per_page_param(url):
     assert add_results_per_page_param(url) == expected
 
 
+@pytest.mark.parametrize("url", [
+    "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030&bs=040&sc=13107&sc=13102&ta=13",
+    "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ta=13&sc=13102&sc=13107&bs=040&ar=030",
+    "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030&bs=040&ta=13&sc=13107&sc=13102&pc=50&page=3",
+    "HTTPS://SUUMO.JP/jj/chintai/ichiran/FR301FC001/?pc=30&ar=030&bs=040&ta=13&sc=13102&sc=13107#top",
+])
+def test_normalize_search_url(url):
+    expected = "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030&bs=040&sc=13102&sc=13107&ta=13"
+    assert normalize_search_url(url) == expected
+    assert normalize_search_url(expected) == expected
+
+
 def test_build_search_url(monkeypatch):
     html_files_by_url = {SUUMO_TOKYO_SEARCH_URL: DATA_DIR / "chintai_tokyo_search_page.html"}
     monkeypatch.setattr("otokuna.dumping.requests.get", build_mock_requests_get(html_files_by_url))
@@ -108,6 +120,24 @@ def test_scrape_number_of_pages(html_file, expected):
     assert scrape_number_of_pages(search_results_soup) == expected
 
 
+@pytest.mark.parametrize("html_file,expected", [
+    ("results_first_page.html", 792351),
+    ("results_first_page_single.html", 16),
+    ("results_last_page.html", 792351),  # with thousands separator
+])
+def test_scrape_number_of_results(html_file, expected):
+    with open(DATA_DIR / html_file) as f:
+        search_results_soup = bs4.BeautifulSoup(f, "html.parser")
+    assert scrape_number_of_results(search_results_soup) == expected
+
+
+def test_scrape_number_of_results_missing():
+    with open(DATA_DIR / "results_first_page_single.html") as f:
+        search_results_soup = bs4.BeautifulSoup(f, "html.parser")
+    search_results_soup.find("div", class_="paginate_set-hit").decompose()
+    assert scrape_number_of_results(search_results_soup) is None
+
+
 @pytest.mark.parametrize("page_filename,expected", [
     ("results_first_page.html", "https://suumo.jp/jj/chintai/ichiran/FR301FC001/"
                                 "?ts=1&sc=13115&sc=13107&sc=13118&sc=13110&sc=13120"
@@ -134,6 +164,14 @@ def test_scrape_search_conditions(page_filename, expected):
     assert scrape_search_conditions(search_results_soup) == expected
 
 
+def test_scrape_search_conditions_missing():
+    with open(DATA_DIR / "results_page_short_conditions.html") as f:
+        search_results_soup = bs4.BeautifulSoup(f, "html.parser")
+    for p in search_results_soup.find_all("p", class_="conditionbox-info-txt"):
+        p.decompose()
+    assert scrape_search_conditions(search_results_soup) is None
+
+
 def test_iter_search_results(monkeypatch):
     html_files_by_url = {
         "dummyurl?page=1": DATA_DIR / "results_first_page.html",
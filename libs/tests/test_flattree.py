@@ -0,0 +1,62 @@
+import io
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from otokuna.flattree import FlatQuantileTree
+
+SKLEARN_NOT_FOUND = False
+try:
+    from otokuna.tree import DecisionTreeRegressorWithQuantiles
+except ImportError:
+    SKLEARN_NOT_FOUND = True
+
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(1000, 4))
+    y = 10 * X[:, 0] + 5 * X[:, 1] + rng.normal(size=1000)
+    yield X, y
+
+
+@pytest.mark.skipif(SKLEARN_NOT_FOUND, reason="sklearn not found")
+@pytest.mark.parametrize("min_samples_leaf", [1, 20])
+def test_export_npz(data, min_samples_leaf):
+    X, y = data
+    model = DecisionTreeRegressorWithQuantiles(min_samples_leaf=min_samples_leaf, random_state=123,
+                                               quantiles=[0.1, 0.5, 0.9])
+    model.fit(X, y)
+    with io.BytesIO() as stream:
+        model.export_npz(stream)
+        stream.seek(0)
+        tree = FlatQuantileTree.load(stream)
+
+    np.testing.assert_equal(tree.quantiles, [0.1, 0.5, 0.9])
+    # on other samples than the training ones, including those at the thresholds
+    X_test = np.concatenate([np.random.RandomState(1).uniform(size=(1000, 4)),
+                             np.tile(model.tree_.threshold[model.tree_.feature >= 0, None], (1, 4))])
+    np.testing.assert_equal(tree.apply(X_test), model.apply(X_test.astype(np.float32)))
+    np.testing.assert_equal(tree.predict_quantile(X_test), model.predict_quantile(X_test))
+
+
+def test_predict_quantile():
+    # x0 <= 0.5 -> node 1, else x1 <= 2 -> node 3, else node 4
+    tree = FlatQuantileTree(
+        feature=[0, -2, 1, -2, -2], threshold=[0.5, -2, 2, -2, -2],
+        children_left=[1, -1, 3, -1, -1], children_right=[2, -1, 4, -1, -1],
+        node_quantiles=[[np.nan], [10], [np.nan], [20], [30]], quantiles=[0.5], n_features=2
+    )
+    X = [[0.5, 9], [0.6, 2], [1, 3], [0, 0]]
+    np.testing.assert_equal(tree.apply(X), [1, 3, 4, 1])
+    np.testing.assert_equal(tree.predict_quantile(X), [[10], [20], [30], [10]])
+    np.testing.assert_equal(tree.predict_quantile(np.empty((0, 2))), np.empty((0, 1)))
+    with pytest.raises(ValueError):
+        tree.predict_quantile([[1, 2, 3]])
+
+
+def test_no_sklearn_import():
+    code = "import sys, otokuna.flattree; assert 'sklearn' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+ONNXRUNTIME_NOT_FOUND = False
+try:
+    from otokuna.inference import manifest_filename, select_variant
+except ImportError:
+    ONNXRUNTIME_NOT_FOUND = True
+
+
+@pytest.mark.skipif(ONNXRUNTIME_NOT_FOUND, reason="onnxruntime not found")
+def test_select_variant(tmp_path):
+    model_filename = tmp_path / "regressor.onnx"
+    default = {"name": "default", "filename": str(model_filename), "optimization_level": "all"}
+    assert manifest_filename(model_filename) == tmp_path / "regressor.manifest.json"
+    assert select_variant(model_filename) == default
+
+    variants = [
+        {"name": "int8", "filename": "regressor.int8.onnx", "optimization_level": "all", "passed": False},
+        {"name": "ort", "filename": "regressor.ort", "optimization_level": "disable", "passed": True},
+        {"name": "opt", "filename": "regressor.opt.onnx", "optimization_level": "disable", "passed": True},
+    ]
+    manifest_filename(model_filename).write_text(json.dumps({"variants": variants}))
+    for variant in variants:
+        (tmp_path / variant["filename"]).touch()
+    assert select_variant(model_filename) == {**variants[1], "filename": str(tmp_path / "regressor.ort")}
+
+    # missing files are skipped
+    (tmp_path / "regressor.ort").unlink()
+    assert select_variant(model_filename)["name"] == "opt"
+    (tmp_path / "regressor.opt.onnx").unlink()
+    assert select_variant(model_filename) == default
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import otokuna
+
+
+def test_submodules():
+    package_dir = Path(otokuna.__file__).parent
+    assert set(otokuna._SUBMODULES) == {path.stem for path in package_dir.glob("*.py")
+                                        if not path.name.startswith("_")}
+
+
+def test_submodules_imported_lazily():
+    code = "import sys, otokuna; assert 'otokuna.analysis' not in sys.modules; print(otokuna.flattree.__name__)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "otokuna.flattree"
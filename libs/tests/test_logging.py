@@ -0,0 +1,59 @@
+import io
+import json
+
+import pytest
+
+from otokuna.logging import StageMetrics, stage_metrics
+
+
+def test_stage_metrics():
+    event = {}
+    stream = io.StringIO()
+    with StageMetrics("some-stage", event, stream=stream) as metrics:
+        metrics.add("pages", 3)
+        metrics.add("bytes_read", 1024)
+        metrics.add("retries")
+
+    emf = json.loads(stream.getvalue())
+    cloudwatch_metrics, = emf["_aws"]["CloudWatchMetrics"]
+    assert cloudwatch_metrics["Namespace"] == "otokuna"
+    assert cloudwatch_metrics["Dimensions"] == [["stage"]]
+    assert {m["Name"] for m in cloudwatch_metrics["Metrics"]} == set(StageMetrics.UNITS)
+    assert emf["stage"] == "some-stage"
+    assert (emf["pages"], emf["bytes_read"], emf["retries"]) == (3, 1024, 1)
+    assert emf["duration"] >= 0
+    assert emf["peak_rss"] > 0
+
+    assert event["metrics"]["some-stage"] == {key: emf[key] for key in StageMetrics.UNITS}
+
+
+def test_stage_metrics_emitted_on_error():
+    event = {}
+    stream = io.StringIO()
+    with pytest.raises(RuntimeError):
+        with StageMetrics("some-stage", event, stream=stream) as metrics:
+            metrics.add("pages")
+            raise RuntimeError
+    assert json.loads(stream.getvalue())["pages"] == 1
+    assert event["metrics"]["some-stage"]["pages"] == 1
+
+
+def test_stage_metrics_unknown_metric():
+    with pytest.raises(ValueError, match="Unknown metric: foo"):
+        StageMetrics("some-stage").add("foo")
+
+
+def test_stage_metrics_decorator(capsys):
+    @stage_metrics("some-stage")
+    def main(event, context, metrics):
+        metrics.add("pages", 2)
+        return event
+
+    @stage_metrics("other-stage")
+    def main_without_metrics(event, context):
+        return event
+
+    event = main_without_metrics(main({}, None), None)
+    assert event["metrics"]["some-stage"]["pages"] == 2
+    assert event["metrics"]["other-stage"]["pages"] == 0
+    assert [json.loads(line)["stage"] for line in capsys.readouterr().out.splitlines()] == ["some-stage", "other-stage"]
@@ -0,0 +1,101 @@
+import pstats
+
+import pytest
+
+from otokuna import profiling
+from otokuna.profiling import profile, profile_cli, profile_handler
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_DIR_ENV_VAR, str(tmp_path))
+    yield tmp_path
+
+
+def test_profile_off(profile_dir, monkeypatch):
+    monkeypatch.delenv(profiling.PROFILE_ENV_VAR, raising=False)
+    with profile("foo") as result:
+        pass
+    assert result is None
+    assert not list(profile_dir.iterdir())
+
+
+def test_profile_cpu(profile_dir, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_ENV_VAR, "cpu")
+
+    @profile_cli("some-cli")
+    def main():
+        return sorted(range(1000), reverse=True)
+
+    assert main()[0] == 999
+    filename, = profile_dir.glob("some-cli-*.prof")
+    stats = pstats.Stats(str(filename))
+    assert any(func_name == "main" for _, _, func_name in stats.stats)
+
+
+def test_profile_mem(profile_dir, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_ENV_VAR, "mem")
+    with profile("foo") as result:
+        data = [bytes(1024) for _ in range(1000)]
+    assert len(data) == 1000
+    assert result["filename"].parent == profile_dir
+    assert result["filename"].read_text().startswith("Peak traced memory: ")
+
+
+def test_profile_invalid_mode(monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_ENV_VAR, "gpu")
+    with pytest.raises(ValueError):
+        with profile("foo"):
+            pass
+
+
+def test_profile_handler_upload(profile_dir, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_ENV_VAR, "cpu")
+    monkeypatch.setenv(profiling.PROFILE_BUCKET_ENV_VAR, "somebucket")
+    uploads = []
+    monkeypatch.setattr(profiling, "_upload", lambda *args: uploads.append(args))
+
+    @profile_handler("some-handler")
+    def main(event, context):
+        event["root_key"] = "jobs/somejob"
+        return event
+
+    assert main({}, None) == {"root_key": "jobs/somejob"}
+    filename, = profile_dir.glob("some-handler-*.prof")
+    assert uploads == [(filename, "somebucket", f"jobs/somejob/profiles/{filename.name}")]
+
+
+def test_profile_handler_upload_on_error(profile_dir, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_ENV_VAR, "cpu")
+    monkeypatch.setenv(profiling.PROFILE_BUCKET_ENV_VAR, "somebucket")
+    uploads = []
+    monkeypatch.setattr(profiling, "_upload", lambda *args: uploads.append(args))
+
+    @profile_handler("some-handler")
+    def main(event, context):
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError, match="failed"):
+        main({"root_key": "jobs/somejob"}, None)
+    filename, = profile_dir.glob("some-handler-*.prof")
+    assert uploads == [(filename, "somebucket", f"jobs/somejob/profiles/{filename.name}")]
+
+
+def test_profile_handler_upload_daily_dump(profile_dir, monkeypatch):
+    # The branches of the daily dump (DumpMap) have no root_key, and
+    # nothing but the dumped pages must be written under their base_path
+    monkeypatch.setenv(profiling.PROFILE_ENV_VAR, "cpu")
+    monkeypatch.setenv(profiling.PROFILE_BUCKET_ENV_VAR, "somebucket")
+    uploads = []
+    monkeypatch.setattr(profiling, "_upload", lambda *args: uploads.append(args))
+
+    @profile_handler("dump-property-data")
+    def main(event, context):
+        event["search_url"] = "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030"
+        return event
+
+    base_path = "dumped_data/daily/2021-01-20T23:53:35+09:00/東京都"
+    main({"batch_name": "千代田区", "base_path": base_path}, None)
+    (filename, bucket, key), = uploads
+    assert key == f"dumped_data/daily/2021-01-20T23:53:35+09:00/profiles/{filename.name}"
+    assert not key.startswith(base_path)
@@ -3,7 +3,7 @@ import pytest
 
 SKLEARN_NOT_FOUND = False
 try:
-    from otokuna.tree import DecisionTreeRegressorWithQuantiles
+    from otokuna.tree import DecisionTreeRegressorWithQuantiles, QuantileRegressionForest
 except ImportError:
     SKLEARN_NOT_FOUND = True
 
@@ -34,3 +34,86 @@ class TestDecisionTreeRegressorWithQuantiles:
             np.concatenate([50 * np.ones(101), 1050 * np.ones(101)]),
         ])
         np.testing.assert_equal(model.predict_quantile(X), expected)
+
+    @pytest.mark.parametrize("min_samples_leaf", [1, 5])
+    def test_fit_matches_np_quantile(self, min_samples_leaf):
+        rng = np.random.RandomState(0)
+        X = rng.uniform(size=(500, 3))
+        y = 10 * X[:, 0] + rng.normal(size=500)
+        quantiles = [0.0, 0.1, 0.5, 0.9, 1.0]
+        model = DecisionTreeRegressorWithQuantiles(max_depth=6, min_samples_leaf=min_samples_leaf,
+                                                   random_state=123, quantiles=quantiles)
+        model.fit(X, y)
+        assert model.node_quantiles_.shape == (model.tree_.node_count, len(quantiles))
+
+        leaf_idx = model.apply(X)
+        for leaf, leaf_quantiles in model.quantiles_by_leaf_idx_.items():
+            np.testing.assert_allclose(leaf_quantiles, np.quantile(y[leaf_idx == leaf], quantiles))
+        assert np.isnan(model.node_quantiles_[model.tree_.children_left != -1]).all()
+
+    def test_scalar_quantile(self, dummy_data):
+        X, y = dummy_data
+        model = DecisionTreeRegressorWithQuantiles(max_depth=1, random_state=123, quantiles=0.5)
+        model.fit(X, y)
+        np.testing.assert_equal(model.predict_quantile(X[[0, -1]]), [[50], [1050]])
+
+
+@pytest.fixture
+def noisy_data():
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(300, 2))
+    y = 10 * X[:, 0] + rng.normal(size=300)
+    yield X, y
+
+
+def naive_quantiles(forest, x, quantiles):
+    """The weighted quantiles of a single sample, computed target by target."""
+    weights = {}
+    for tree, y_sorted, offsets in zip(forest.estimators_, forest.y_sorted_, forest.offsets_):
+        leaf = tree.apply(x.reshape(1, -1).astype(np.float32))[0]
+        leaf_values = y_sorted[offsets[leaf]:offsets[leaf + 1]]
+        for value in leaf_values:
+            weights[value] = weights.get(value, 0) + 1 / len(leaf_values) / len(forest.estimators_)
+    values = sorted(weights)
+    cum_weights = np.cumsum([weights[value] for value in values])
+    return [values[min(np.searchsorted(cum_weights, q - 1e-9), len(values) - 1)] for q in quantiles]
+
+
+@pytest.mark.skipif(SKLEARN_NOT_FOUND, reason="sklearn not found")
+class TestQuantileRegressionForest:
+    def test_predict_quantile(self, noisy_data):
+        X, y = noisy_data
+        quantiles = [0.0, 0.1, 0.5, 0.9, 1.0]
+        forest = QuantileRegressionForest(n_estimators=10, batch_size=7, random_state=123).fit(X, y)
+        X_test = X[:20]
+        predicted = forest.predict_quantile(X_test, quantiles)
+        assert predicted.shape == (20, len(quantiles))
+        expected = [naive_quantiles(forest, x, quantiles) for x in X_test]
+        np.testing.assert_allclose(predicted, expected)
+        assert np.all(np.diff(predicted, axis=1) >= 0)
+
+    def test_leaf_sorted_targets(self, noisy_data):
+        X, y = noisy_data
+        forest = QuantileRegressionForest(n_estimators=3, random_state=123).fit(X, y)
+        for tree, y_sorted, offsets in zip(forest.estimators_, forest.y_sorted_, forest.offsets_):
+            assert len(y_sorted) == len(y) and offsets[-1] == len(y)
+            counts = np.diff(offsets)
+            assert np.all((counts > 0) == (tree.tree_.children_left == -1))
+            for leaf in np.where(counts > 0)[0]:
+                assert np.all(np.diff(y_sorted[offsets[leaf]:offsets[leaf + 1]]) >= 0)
+
+    def test_n_jobs(self, noisy_data):
+        X, y = noisy_data
+        forest = QuantileRegressionForest(n_estimators=4, random_state=123).fit(X, y)
+        forest_parallel = QuantileRegressionForest(n_estimators=4, n_jobs=2, random_state=123).fit(X, y)
+        np.testing.assert_equal(forest.predict_quantile(X), forest_parallel.predict_quantile(X))
+
+    def test_predict_cdf(self, noisy_data):
+        X, y = noisy_data
+        forest = QuantileRegressionForest(n_estimators=10, batch_size=50, random_state=123).fit(X, y)
+        q10, q50, q90 = forest.predict_quantile(X).T
+        np.testing.assert_array_less(0.1 - 1e-9, forest.predict_cdf(X, q10))
+        np.testing.assert_array_less(forest.predict_cdf(X, q10 - 1e-6), 0.1)
+        np.testing.assert_array_less(forest.predict_cdf(X, q90 - 1e-6), 0.9)
+        np.testing.assert_allclose(forest.predict_cdf(X, np.full(len(X), 1e6)), 1)
+        np.testing.assert_equal(forest.predict_cdf(X, np.full(len(X), -1e6)), 0)
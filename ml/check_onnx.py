@@ -1,40 +1,184 @@
 #!/usr/bin/env python3
-"""Check that predictions are similar between the native format and ONNX"""
+"""
+Check that predictions are similar between the native format and ONNX.
+
+Optionally (with --benchmark-filename), it also benchmarks the latency and
+throughput of the predictions of both formats on the same features, for
+several batch sizes, numbers of threads and (for ONNX) graph optimization
+levels. The results are written as JSON, to be tracked as DVC metrics.
+
+The variants of the ONNX model made by optimize_onnx.py (--variants) are
+checked against an accuracy gate (--max-ape) and timed (session creation
+and per row latency), and listed fastest first in the manifest read by
+otokuna.inference.select_variant (e.g. models/regressor.manifest.json).
+"""
 import argparse
+import itertools
 import json
+import os
+import time
+from pathlib import Path
 
 import numpy as np
-import pandas as pd
+import onnxruntime
 from catboost import CatBoostRegressor
-from onnxruntime import InferenceSession
 
-from otokuna.analysis import (
-    add_address_coords, add_target_variable, df2Xy
-)
+from feature_store import DEFAULT_STORE_DIR, load_features
+from otokuna.analysis import prediction_columns
+from otokuna.inference import OPTIMIZATION_LEVELS, make_session, manifest_filename
+
+# Variants (by suffix, see optimize_onnx.py) whose graph is already optimized
+PREOPTIMIZED_SUFFIXES = (".opt.onnx", ".ort")
+
+
+def max_ape_by_output(y_pred_cbm, sess, X, rtol=None) -> dict:
+    """The maxAPE of the ONNX predictions against the native ones, for each
+    output (e.g. each quantile of a multi-quantile model). If rtol is given,
+    check that they are close.
+    """
+    onnx_out = sess.run(["predictions"], {"features": X.values.astype(np.float32)})
+    y_pred_onnx = onnx_out[0].reshape(len(X), -1)
+    assert y_pred_onnx.shape == y_pred_cbm.shape, f"{y_pred_onnx.shape} != {y_pred_cbm.shape}"
+
+    metrics = {}
+    for column, y_cbm, y_onnx in zip(prediction_columns(y_pred_cbm.shape[1]), y_pred_cbm.T, y_pred_onnx.T):
+        if rtol is not None:
+            np.testing.assert_allclose(y_onnx, y_cbm, rtol=rtol, err_msg=f"output: {column}")
+        metrics[f"maxAPE_cbm_onnx_{column}"] = float(np.max(np.abs((y_cbm - y_onnx) / y_cbm)))
+    metrics["maxAPE_cbm_onnx"] = max(metrics.values())
+    return metrics
+
+
+def variant_name(filename: Path, model_filename: Path) -> str:
+    """e.g. models/regressor.opt.onnx -> opt, models/regressor.ort -> ort, models/regressor.onnx -> default"""
+    suffixes = filename.name[len(model_filename.stem):]
+    return "default" if suffixes == model_filename.suffix else suffixes[1:].replace(".onnx", "")
+
+
+def check_variant(y_pred_cbm, filename, name, X, max_ape, repeat) -> dict:
+    """Check the accuracy of a variant of the model and time its session
+    creation and its per row latency (on all the rows of X at once).
+    """
+    level = "disable" if any(filename.name.endswith(suffix) for suffix in PREOPTIMIZED_SUFFIXES) else "all"
+    variant = {"name": name, "filename": str(filename), "optimization_level": level}
+    try:
+        session_times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            sess = make_session(filename, level)
+            session_times.append((time.perf_counter() - start) * 1000)
+        variant["max_ape"] = max_ape_by_output(y_pred_cbm, sess, X)["maxAPE_cbm_onnx"]
+    except Exception as e:  # e.g. an operator not supported in float16
+        return {**variant, "passed": False, "error": str(e)}
+    features = X.values.astype(np.float32)
+    timings = time_calls(lambda: sess.run(["predictions"], {"features": features}), repeat)
+    variant.update(passed=variant["max_ape"] <= max_ape, session_ms=float(np.median(session_times)),
+                   us_per_row=timings["p50_ms"] * 1000 / len(X))
+    return variant
+
+
+def write_manifest(variants, filename, expected_rows):
+    """Write the manifest of the variants, with the ones that passed first,
+    fastest first (by the time of a cold start: creating the session and
+    predicting expected_rows rows), and their filenames relative to the manifest.
+    """
+    for variant in variants:
+        if variant["passed"]:
+            variant["cold_start_ms"] = variant["session_ms"] + variant["us_per_row"] * expected_rows / 1000
+    variants = sorted(variants, key=lambda v: (not v["passed"], v.get("cold_start_ms", float("inf"))))
+    for variant in variants:
+        variant["filename"] = os.path.relpath(variant["filename"], Path(filename).parent)
+    with open(filename, "w") as file:
+        json.dump({"variants": variants}, file, indent=2)
+
+
+def time_calls(func, repeat, warmup=2) -> dict:
+    """Latency (in milliseconds) percentiles of `repeat` calls of func."""
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(times, 50)), "p90_ms": float(np.percentile(times, 90))}
+
+
+def make_batch(X: np.ndarray, batch_size) -> np.ndarray:
+    """The first batch_size rows of X (repeated if X has fewer rows)."""
+    return np.resize(X, (batch_size, X.shape[1]))
+
+
+def benchmark(model, model_onnx_filename, X, batch_sizes, threads_list, optimization_levels, repeat) -> dict:
+    """Latency and throughput of the native and ONNX predictions, nested as
+    {"onnx": {level: {"threads_N": {"batch_N": {...}}}}, "catboost": {"threads_N": {"batch_N": {...}}}}
+    """
+    X = X.values.astype(np.float32)
+    results = {
+        "versions": {"onnxruntime": onnxruntime.__version__},
+        "onnx": {level: {} for level in optimization_levels},
+        "catboost": {},
+    }
+
+    def add(result, batch_size, timings):
+        timings["rows_per_s"] = batch_size / timings["p50_ms"] * 1000
+        result[f"batch_{batch_size}"] = timings
+
+    for level, threads in itertools.product(optimization_levels, threads_list):
+        sess = make_session(model_onnx_filename, level, threads)
+        result = results["onnx"][level][f"threads_{threads}"] = {}
+        for batch_size in batch_sizes:
+            X_batch = make_batch(X, batch_size)
+            timings = time_calls(lambda: sess.run(["predictions"], {"features": X_batch}), repeat)
+            add(result, batch_size, timings)
+            print(f"onnx      {level:<8} threads: {threads:>2}  batch: {batch_size:>6}  "
+                  f"p50: {timings['p50_ms']:9.3f} ms  rows/s: {timings['rows_per_s']:12.0f}")
+
+    for threads in threads_list:
+        result = results["catboost"][f"threads_{threads}"] = {}
+        for batch_size in batch_sizes:
+            X_batch = make_batch(X, batch_size)
+            timings = time_calls(lambda: model.predict(X_batch, thread_count=threads), repeat)
+            add(result, batch_size, timings)
+            print(f"catboost  {'':<8} threads: {threads:>2}  batch: {batch_size:>6}  "
+                  f"p50: {timings['p50_ms']:9.3f} ms  rows/s: {timings['rows_per_s']:12.0f}")
+    return results
 
 
 def main(args):
-    # Read and preprocess data
-    df = pd.read_pickle(args.data_filename)
-    df = df.sample(frac=0.1, random_state=123)
-    df = add_address_coords(df)
-    df.dropna(inplace=True)
-    df = add_target_variable(df)
-    X, y = df2Xy(df)
+    # Read preprocessed data (see feature_store.py)
+    X, _ = load_features(args.data_filename, "raw", args.feature_store_dir)
+    X = X.sample(frac=args.sample_frac, random_state=123)
 
     # Check
     model = CatBoostRegressor()
     model.load_model(args.model_cbm_filename)
-    y_pred_cbm = model.predict(X)
+    y_pred_cbm = model.predict(X).reshape(len(X), -1)
+    sess = make_session(args.model_onnx_filename)
+    metrics = max_ape_by_output(y_pred_cbm, sess, X, rtol=1e-5)
+    with open(args.out_filename, "w") as file:
+        json.dump(metrics, file)
 
-    sess = InferenceSession(args.model_onnx_filename)
-    onnx_out = sess.run(["predictions"], {"features": X.values.astype(np.float32)})
-    y_pred_onnx = onnx_out[0].squeeze()
+    # Check and time the variants
+    if args.variants:
+        variants = []
+        for filename in [args.model_onnx_filename, *args.variants]:
+            name = variant_name(Path(filename), Path(args.model_onnx_filename))
+            variant = check_variant(y_pred_cbm, Path(filename), name, X, args.max_ape, args.repeat)
+            variants.append(variant)
+            print(f"variant {variant['name']:<10} passed: {variant['passed']!s:<5} "
+                  f"maxAPE: {variant.get('max_ape', float('nan')):.2e}  "
+                  f"session: {variant.get('session_ms', float('nan')):8.2f} ms  "
+                  f"latency: {variant.get('us_per_row', float('nan')):8.3f} us/row")
+        write_manifest(variants, args.manifest_filename or manifest_filename(args.model_onnx_filename),
+                       args.expected_rows)
 
-    np.testing.assert_allclose(y_pred_onnx, y_pred_cbm, rtol=1e-5)
-    max_ape = np.max(np.abs((y_pred_cbm - y_pred_onnx) / y_pred_cbm))
-    with open(args.out_filename, "w") as file:
-        json.dump({"maxAPE_cbm_onnx": max_ape}, file)
+    # Benchmark
+    if args.benchmark_filename:
+        results = benchmark(model, args.model_onnx_filename, X, args.batch_sizes, args.threads,
+                            args.optimization_levels, args.repeat)
+        with open(args.benchmark_filename, "w") as file:
+            json.dump(results, file, indent=2)
 
 
 if __name__ == "__main__":
@@ -44,4 +188,24 @@ if __name__ == "__main__":
     parser.add_argument("model_onnx_filename", help="Model filename in onnx format")
     parser.add_argument("model_cbm_filename", help="Model filename in cbm format")
     parser.add_argument("--out-filename", default="check_onnx.json", help="Output filename")
+    parser.add_argument("--feature-store-dir", default=DEFAULT_STORE_DIR,
+                        help="Directory of the store of preprocessed features")
+    parser.add_argument("--sample-frac", type=float, default=0.1, help="Fraction of the data to check with")
+    parser.add_argument("--variants", nargs="*", default=[],
+                        help="Filenames of the variants of the model to check (see optimize_onnx.py)")
+    parser.add_argument("--max-ape", type=float, default=1e-3,
+                        help="Accuracy gate of the variants: the maximum absolute percentage error "
+                             "(as a fraction) of any prediction against the cbm model")
+    parser.add_argument("--expected-rows", type=int, default=5000,
+                        help="Rows per prediction to rank the variants by (e.g. those of a daily prediction)")
+    parser.add_argument("--manifest-filename",
+                        help="Output filename of the manifest of the variants "
+                             "(default: next to the model, e.g. models/regressor.manifest.json)")
+    parser.add_argument("--benchmark-filename", help="Output filename of the benchmark (skipped if not given)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 64, 1024, 8192],
+                        help="Batch sizes to benchmark")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4], help="Numbers of threads to benchmark")
+    parser.add_argument("--optimization-levels", nargs="+", choices=OPTIMIZATION_LEVELS,
+                        default=list(OPTIMIZATION_LEVELS), help="ONNX graph optimization levels to benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls for each benchmark")
     main(parser.parse_args())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Store of the preprocessed features (X) and targets (y) of the raw data, so the
+training and evaluation scripts (and hyperparameter sweeps) skip the
+preprocessing when the data and the preprocessing code did not change.
+
+The entries are keyed by a hash of the raw data file, of the preprocessing
+code (otokuna.analysis and this module, and the location reference data) and
+of the pipeline, and are stored as .npy files that are loaded memory-mapped:
+
+  <store_dir>/<key>/X.npy      float32 array of shape (n_samples, n_features)
+  <store_dir>/<key>/y.npy      float32 array of shape (n_samples,)
+  <store_dir>/<key>/index.npy  the jnc_id of each sample
+  <store_dir>/<key>/meta.json  the columns of X, the source data and the pipeline
+
+There are two pipelines:
+  * clean: the cleaned data used for training (see otokuna.analysis.clean_df).
+  * raw: all the samples with complete features (e.g. as in the predict stage).
+
+Example (build the features ahead of the training):
+./feature_store.py data/2021-07-04T11:52:04+09:00/東京都.pickle --pipeline clean
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+import otokuna.analysis
+from otokuna import DATA_DIR
+from otokuna.analysis import add_address_coords, add_target_variable, clean_df, df2Xy
+
+DEFAULT_STORE_DIR = "features"
+PIPELINES = ("clean", "raw")
+
+
+def preprocess(df: pd.DataFrame, pipeline="clean") -> Tuple[pd.DataFrame, pd.Series]:
+    """Preprocess the raw data into features and targets."""
+    df = add_address_coords(df)
+    if pipeline == "clean":
+        df = add_target_variable(df)
+        df = clean_df(df)
+    elif pipeline == "raw":
+        df.dropna(inplace=True)
+        df = add_target_variable(df)
+    else:
+        raise ValueError(f"Unknown pipeline: {pipeline}")
+    return df2Xy(df)
+
+
+def _hash_file(hasher, filename, chunk_size=1 << 20):
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            hasher.update(chunk)
+
+
+def feature_key(data_filename, pipeline="clean") -> str:
+    """Hash of the raw data, the preprocessing code and the pipeline."""
+    hasher = hashlib.sha256()
+    hasher.update(pipeline.encode())
+    for filename in (data_filename, otokuna.analysis.__file__, __file__,
+                     DATA_DIR / "location_reference_tokyo" / "13_2019.csv"):
+        _hash_file(hasher, filename)
+    return hasher.hexdigest()[:16]
+
+
+def build_features(data_filename, pipeline="clean", store_dir=DEFAULT_STORE_DIR) -> Path:
+    """Preprocess the raw data and store the result, unless it is already
+    stored. Returns the directory of the entry.
+    """
+    path = Path(store_dir) / feature_key(data_filename, pipeline)
+    if path.exists():
+        return path
+
+    X, y = preprocess(pd.read_pickle(data_filename), pipeline)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written to a temporary directory first, so an entry is never seen half written
+    tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+    np.save(tmp_path / "X.npy", X.to_numpy(dtype=np.float32))
+    np.save(tmp_path / "y.npy", y.to_numpy(dtype=np.float32))
+    np.save(tmp_path / "index.npy", X.index.to_numpy(dtype=str))
+    meta = {"columns": list(X.columns), "index_name": X.index.name,
+            "data_filename": str(data_filename), "pipeline": pipeline}
+    with open(tmp_path / "meta.json", "w") as file:
+        json.dump(meta, file, ensure_ascii=False)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:  # built by another process in the meantime
+        for child in tmp_path.iterdir():
+            child.unlink()
+        tmp_path.rmdir()
+    return path
+
+
+def load_features(data_filename, pipeline="clean", store_dir=DEFAULT_STORE_DIR) -> Tuple[pd.DataFrame, pd.Series]:
+    """Load the features and targets of the raw data (as with df2Xy), from
+    the store if possible (memory-mapped), otherwise preprocessing the raw
+    data and storing the result first.
+    """
+    path = build_features(data_filename, pipeline, store_dir)
+    with open(path / "meta.json") as file:
+        meta = json.load(file)
+    index = pd.Index(np.load(path / "index.npy"), name=meta["index_name"])
+    X = pd.DataFrame(np.load(path / "X.npy", mmap_mode="r"), index=index, columns=meta["columns"], copy=False)
+    y = pd.Series(np.load(path / "y.npy", mmap_mode="r"), index=index, name="y", copy=False)
+    return X, y
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_filename", help="Input data filename (pickle format)")
+    parser.add_argument("--pipeline", choices=PIPELINES, default="clean", help="Preprocessing pipeline")
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR, help="Directory of the feature store")
+    args = parser.parse_args()
+    print(build_features(args.data_filename, args.pipeline, args.store_dir))
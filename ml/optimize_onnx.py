@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Make optimized variants of the ONNX model, to be loaded faster on cold starts.
+
+The variants are written next to the model (e.g. for models/regressor.onnx):
+  * regressor.opt.onnx: the graph optimized offline (up to the extended level,
+    i.e. without hardware specific optimizations).
+  * regressor.ort: the same, in ORT format.
+  * regressor.fp16.onnx (--float16): with float16 weights. Requires onnxconverter-common.
+  * regressor.int8.onnx (--int8): with weights dynamically quantized to int8.
+    Requires onnx.
+
+The lower precision variants only pay off for models with large dense weights,
+and some operators (e.g. the tree ensembles) do not support them, so they are
+optional and must pass the accuracy check of check_onnx.py to be used.
+"""
+import argparse
+from pathlib import Path
+
+from onnxruntime import GraphOptimizationLevel, InferenceSession, SessionOptions
+
+
+def variant_filename(model_filename, suffix) -> Path:
+    """e.g. (models/regressor.onnx, .ort) -> models/regressor.ort"""
+    return Path(model_filename).with_suffix(suffix)
+
+
+def save_optimized(model_filename, out_filename, ort_format=False):
+    options = SessionOptions()
+    options.graph_optimization_level = GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = str(out_filename)
+    if ort_format:
+        options.add_session_config_entry("session.save_model_format", "ORT")
+    InferenceSession(str(model_filename), options)
+
+
+def save_float16(model_filename, out_filename):
+    import onnx
+    from onnxconverter_common import float16
+
+    model = float16.convert_float_to_float16(onnx.load(str(model_filename)), keep_io_types=True)
+    onnx.save(model, str(out_filename))
+
+
+def save_int8(model_filename, out_filename):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(model_filename), str(out_filename), weight_type=QuantType.QInt8)
+
+
+def main(args):
+    variants = [(".opt.onnx", lambda model, out: save_optimized(model, out)),
+                (".ort", lambda model, out: save_optimized(model, out, ort_format=True))]
+    if args.float16:
+        variants.append((".fp16.onnx", save_float16))
+    if args.int8:
+        variants.append((".int8.onnx", save_int8))
+
+    for suffix, save in variants:
+        out_filename = variant_filename(args.model_filename, suffix)
+        save(args.model_filename, out_filename)
+        print(f"Saved: {out_filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model_filename", help="Model filename in onnx format")
+    parser.add_argument("--float16", action="store_true", help="Also make a float16 variant")
+    parser.add_argument("--int8", action="store_true", help="Also make an int8 (dynamically quantized) variant")
+    main(parser.parse_args())
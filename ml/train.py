@@ -2,19 +2,19 @@
 """
 Train regression model to predict median average price of properties.
 TODO: Move parameters to a params.yaml file.
+TODO: Train a multi-quantile model (loss_function="MultiQuantile:alpha=...",
+  see otokuna.analysis.PREDICTION_QUANTILES) once catboost is bumped (>=1.1)
+  and its ONNX export of multi-quantile models can be loaded by onnxruntime.
 """
 import argparse
 import json
 from collections import defaultdict
 
 import numpy as np
-import pandas as pd
 from catboost import CatBoostRegressor
 
-from otokuna.analysis import (
-    add_address_coords, add_target_variable, clean_df,
-    train_val_test_split, df2Xy
-)
+from feature_store import DEFAULT_STORE_DIR, load_features
+from otokuna.analysis import train_val_test_split
 
 
 def mae(y_true, y_pred):
@@ -24,19 +24,13 @@ def mae(y_true, y_pred):
 
 
 def main(args):
-    # Read and preprocess data
-    df = pd.read_pickle(args.data_filename)
-    df = add_address_coords(df)
-    df = add_target_variable(df)
-    df = clean_df(df)
+    # Read preprocessed data (see feature_store.py)
+    X, y = load_features(args.data_filename, "clean", args.feature_store_dir)
 
     # Split datasets
-    (df_train, df_val, df_test), *_ = train_val_test_split(
-        [df], val_ratio=0.1875, test_ratio=0.25, seed=123
+    (X_train, X_val, X_test), (y_train, y_val, y_test) = train_val_test_split(
+        [X, y], val_ratio=0.1875, test_ratio=0.25, seed=123
     )
-    X_train, y_train = df2Xy(df_train)
-    X_val, y_val = df2Xy(df_val)
-    X_test, y_test = df2Xy(df_test)
 
     # Train model
     model = CatBoostRegressor(
@@ -78,4 +72,6 @@ if __name__ == "__main__":
     parser.add_argument("data_filename", help="Input data filename (pickle format)")
     parser.add_argument("model_filename", help="Output model filename (extension will be added automatically)")
     parser.add_argument("--metrics-filename", default="metrics.json", help="Output metrics filename")
+    parser.add_argument("--feature-store-dir", default=DEFAULT_STORE_DIR,
+                        help="Directory of the store of preprocessed features")
     main(parser.parse_args())
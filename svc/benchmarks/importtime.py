@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark the import time (i.e. the cold-start overhead) of each handler module.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+and the cumulative import time of the module is taken from its report. The
+median over several runs is reported for each handler module.
+
+Pass a baseline file (a previous output of this script) to check for
+regressions. The script exits with an error if the import time of any
+module exceeds that of the baseline by more than the given tolerance.
+
+Example (from the svc folder):
+./benchmarks/importtime.py --out-filename importtime.json
+./benchmarks/importtime.py --baseline importtime.json --tolerance 1.5
+"""
+import argparse
+import json
+import statistics
+import sys
+from pathlib import Path
+
+import yaml
+
+SVC_DIR = Path(__file__).parent.parent.resolve()
+
+# The timing helpers are shared with the benchmarks of the libs
+sys.path.insert(0, str(SVC_DIR.parent / "libs" / "benchmarks"))
+from _timing import measure_import_time  # noqa: E402
+
+
+def handler_modules(serverless_filename):
+    with open(serverless_filename) as file:
+        functions = yaml.safe_load(file)["functions"]
+    return sorted({spec["handler"].rsplit(".", 1)[0] for spec in functions.values()})
+
+
+def main(args):
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {}
+    for module in args.modules or handler_modules(args.serverless_file):
+        times = [measure_import_time(module, cwd=SVC_DIR) for _ in range(args.repeat)]
+        results[module] = {"median_ms": statistics.median(times), "min_ms": min(times)}
+        print(f"{module:<25} median: {results[module]['median_ms']:8.1f} ms  "
+              f"min: {results[module]['min_ms']:8.1f} ms")
+
+    if args.out_filename:
+        with open(args.out_filename, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if baseline:
+        regressions = {module: (baseline[module]["median_ms"], result["median_ms"])
+                       for module, result in results.items()
+                       if module in baseline
+                       and result["median_ms"] > baseline[module]["median_ms"] * args.tolerance}
+        for module, (before, after) in regressions.items():
+            print(f"REGRESSION {module}: {before:.1f} ms -> {after:.1f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the handler modules")
+    parser.add_argument("modules", nargs="*", help="Modules to benchmark (default: all handler modules)")
+    parser.add_argument("--serverless-file", default=SVC_DIR / "serverless.yml", help="serverless.yml filename")
+    parser.add_argument("--repeat", default=5, type=int, help="Number of runs per module")
+    parser.add_argument("--out-filename", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file with previous results to check for regressions")
+    parser.add_argument("--tolerance", default=1.5, type=float,
+                        help="Max allowed ratio of the import time with respect to the baseline")
+    main(parser.parse_args())
@@ -1,6 +1,10 @@
 from otokuna.dumping import build_search_url
+from otokuna.logging import stage_metrics
+from otokuna.profiling import profile_handler
 
 
+@profile_handler("build-search-url")
+@stage_metrics("build-search-url")
 def main(event, context):
     ward = event["batch_name"]
     event["search_url"] = build_search_url(building_categories=("マンション",),
@@ -0,0 +1,3 @@
+# This conftest.py lives at the root of the svc folder so pytest adds the
+# folder to sys.path and the tests can import the modules that are not
+# handlers (e.g. local_runner).
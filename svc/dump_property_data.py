@@ -7,20 +7,26 @@ import boto3
 import bs4
 import trio
 
-from otokuna.dumping import add_results_per_page_param, scrape_number_of_pages, add_params
-from otokuna.logging import setup_logger
+from otokuna.dumping import (
+    add_results_per_page_param, add_params,
+    scrape_number_of_pages, scrape_number_of_results, scrape_search_conditions
+)
+from otokuna.logging import setup_logger, stage_metrics
+from otokuna.profiling import profile_handler
 
 
 # Sometimes Suumo takes several seconds to respond, but, instead
 # of setting a timeout for asks.get we instead try for as long as
 # possible, until the hard timeout of Lambda expires.
-async def get_page(search_url, page):
+async def get_page(search_url, page, metrics=None):
     search_page_url = add_params(search_url, {"page": [str(page)]})
     for attempt in range(3):
         try:
             response = await asks.get(search_page_url)
         except Exception:
             # TODO: catch specific exceptions
+            if metrics is not None:
+                metrics.add("retries")
             await trio.sleep(10)
         else:
             break
@@ -29,13 +35,21 @@ async def get_page(search_url, page):
     return response
 
 
-async def get_number_of_pages(search_url):
-    response = await get_page(search_url, page=1)
+async def get_search_summary(search_url, metrics=None):
+    """Scrape the number of pages, the number of results and the search
+    conditions from the first results page. These are passed forward in
+    the event so that later stages need not fetch the page again.
+    """
+    response = await get_page(search_url, page=1, metrics=metrics)
     search_results_soup = bs4.BeautifulSoup(response.text, "html.parser")
-    return scrape_number_of_pages(search_results_soup)
+    return {
+        "n_pages": scrape_number_of_pages(search_results_soup),
+        "n_results": scrape_number_of_results(search_results_soup),
+        "search_conditions": scrape_search_conditions(search_results_soup),
+    }
 
 
-async def main_async(event, context):
+async def main_async(event, context, metrics):
     logger = setup_logger("dump-svc", include_timestamp=False, propagate=False)
 
     output_bucket = os.environ["OUTPUT_BUCKET"]
@@ -49,8 +63,14 @@ async def main_async(event, context):
 
     max_simultaneous_workers = 5
     limiter = trio.CapacityLimiter(max_simultaneous_workers)
-    n_pages = await get_number_of_pages(search_url)
-    logger.info(f"Total result pages: {n_pages}")
+    search_summary = await get_search_summary(search_url, metrics)
+    n_pages = search_summary["n_pages"]
+    if search_summary["n_results"] is not None:
+        logger.info(f"Total result pages: {n_pages} ({search_summary['n_results']} results)")
+    else:
+        logger.warning(f"Total result pages: {n_pages} (could not scrape the number of results)")
+    if search_summary["search_conditions"] is None:
+        logger.warning("Could not scrape the search conditions")
     pages = list(range(n_pages, 0, -1))  # pages are 1-indexed
 
     async def save_page_content(content, bucket, key):
@@ -61,18 +81,23 @@ async def main_async(event, context):
         while pages:
             page = pages.pop()
             async with limiter:
-                response = await get_page(search_url, page)
+                response = await get_page(search_url, page, metrics)
                 logger.info(f"Got page {page} (worker {wid}): {response.url}")
                 key = str(dump_path / f"page_{page:06d}.html")
                 await save_page_content(response.content, output_bucket, key)
+                metrics.add("pages")
+                metrics.add("bytes_written", len(response.content))
                 logger.info(f"Saved to s3 page {page} (worker {wid}): {key}")
 
     async with trio.open_nursery() as nursery:
         for i in range(max_simultaneous_workers):
             nursery.start_soon(worker, i)
 
+    event.update(search_summary)
     return event
 
 
-def main(event, context):
-    return trio.run(main_async, event, context)
+@profile_handler("dump-property-data")
+@stage_metrics("dump-property-data")
+def main(event, context, metrics):
+    return trio.run(main_async, event, context, metrics)
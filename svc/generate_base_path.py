@@ -1,9 +1,18 @@
+import re
 import uuid
 from pathlib import Path
 
-from otokuna.dumping import now_local
+from otokuna.logging import stage_metrics
+from otokuna.profiling import profile_handler
+from otokuna.timeutils import now_local
 
+# The job_id is used in the S3 keys of the job, so only the (lowercase,
+# hyphenated) UUIDs made by the web app are accepted
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
 
+
+@profile_handler("generate-base-path-daily")
+@stage_metrics("generate-base-path-daily")
 def main_daily(event, context):
     now = now_local()
     datetime_str = now.isoformat(timespec="seconds")
@@ -19,8 +28,15 @@ def main_daily(event, context):
     return event
 
 
+@profile_handler("generate-base-path-user-requested")
+@stage_metrics("generate-base-path-user-requested")
 def main_user_requested(event, context):
-    job_id = str(uuid.uuid4())
+    # The web app passes the job_id, so it can find the job before it is finished
+    job_id = event.get("job_id")
+    if job_id is None:
+        job_id = str(uuid.uuid4())
+    elif not isinstance(job_id, str) or not JOB_ID_PATTERN.fullmatch(job_id):
+        raise ValueError(f"Invalid job_id: {job_id!r}")
     root_key = Path("jobs") / job_id
     # 'property_data' (like '東京' in the daily case) will at first be the folder
     # where the html files are dumped, but then becomes the filename of the zip file
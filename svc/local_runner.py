@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Run the state machines defined in serverless.yml locally and in-process.
+
+The handlers are called directly (no Lambda, no Step Functions) against a
+local filesystem stand-in for S3 and a mock of Suumo that serves canned
+result pages. For each stage it reports the wall time, the peak RSS and
+the bytes moved, so the end-to-end throughput of the pipeline can be
+benchmarked without deploying it.
+
+Stage outputs can be cached by a hash of the stage input, the handler
+source code and the otokuna package files so that reruns skip the stages
+that did not change.
+
+Example:
+./local_runner.py PredictUserRequestedMachine \
+    --input '{"user_id": "johndoe", "search_url": "https://suumo.jp/jj/chintai/ichiran/FR301FC001/"}' \
+    --suumo-pages ../ml/data/2021-07-04T11:52:04+09:00/東京都.zip \
+    --storage-dir /tmp/otokuna-local
+"""
+import argparse
+import contextlib
+import datetime
+import functools
+import hashlib
+import importlib
+import inspect
+import io
+import json
+import os
+import re
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from zipfile import ZipFile, is_zipfile
+
+import yaml
+
+HERE = Path(__file__).parent.resolve()
+SUUMO_SEARCH_PAGE = HERE.parent / "libs" / "tests" / "data" / "chintai_tokyo_search_page.html"
+
+
+class LocalS3:
+    """Minimal stand-in of the boto3 S3 client (and resource) backed by a local folder.
+
+    Only the methods used by the handlers are implemented. Each object is
+    stored as a file named after its key plus a suffix, so that keys like
+    "a/b" and "a/b/c" can coexist. It keeps count of the bytes read and
+    written, which is thread-safe.
+    """
+    _SUFFIX = ".s3object"
+
+    def __init__(self, root_dir):
+        self.root_dir = Path(root_dir)
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def _path(self, bucket, key):
+        return self.root_dir / bucket / f"{key}{self._SUFFIX}"
+
+    def _count(self, read=0, written=0):
+        with self._lock:
+            self.bytes_read += read
+            self.bytes_written += written
+
+    def _write(self, bucket, key, data: bytes):
+        path = self._path(bucket, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        self._count(written=len(data))
+
+    def _read(self, bucket, key) -> bytes:
+        data = self._path(bucket, key).read_bytes()
+        self._count(read=len(data))
+        return data
+
+    # ---- client API
+    def create_bucket(self, Bucket, **kwargs):
+        (self.root_dir / Bucket).mkdir(parents=True, exist_ok=True)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self._write(Bucket, Key, Fileobj.read())
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self._write(Bucket, Key, Path(Filename).read_bytes())
+
+    def download_fileobj(self, Bucket, Key, Fileobj, **kwargs):
+        Fileobj.write(self._read(Bucket, Key))
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._write(Bucket, Key, Body if isinstance(Body, bytes) else Body.read())
+
+    def get_object(self, Bucket, Key, **kwargs):
+        return {"Body": io.BytesIO(self._read(Bucket, Key))}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._path(Bucket, Key).unlink(missing_ok=True)
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        bucket_dir = self.root_dir / Bucket
+        contents = []
+        for path in bucket_dir.rglob(f"*{self._SUFFIX}"):
+            key = str(path.relative_to(bucket_dir))[:-len(self._SUFFIX)]
+            if not key.startswith(Prefix):
+                continue
+            stat = path.stat()
+            last_modified = datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc)
+            contents.append({"Key": key, "LastModified": last_modified, "Size": stat.st_size})
+        response = {"KeyCount": len(contents)}
+        if contents:
+            response["Contents"] = sorted(contents, key=lambda obj: obj["Key"])
+        return response
+
+    # ---- resource API
+    def Object(self, bucket_name, key):
+        s3 = self
+
+        class _Object:
+            def put(self, Body, **kwargs):
+                s3.put_object(Bucket=bucket_name, Key=key, Body=Body)
+
+            def get(self):
+                return s3.get_object(Bucket=bucket_name, Key=key)
+
+        return _Object()
+
+
+class MockResponse:
+    def __init__(self, url, content: bytes):
+        self.url = url
+        self.status_code = 200
+        self.content = content
+        self.text = content.decode()
+
+
+class MockSuumo:
+    """Serves canned Suumo pages in place of the real site.
+
+    The results pages are taken, in filename order, from a folder or a zip
+    file of html files (e.g. the raw data dumped by a previous run). The page
+    number is taken from the "page" query parameter of the requested URL
+    (page 1 if missing). Pages beyond the number of available files are served
+    cyclically, so the number of pages written in the html determines how many
+    pages a dump fetches. Any URL other than a search results URL is served the
+    Tokyo search page used to build search URLs.
+    """
+    _RESULTS_PATH = "/jj/chintai/ichiran/"
+
+    def __init__(self, pages_source, search_page_filename=SUUMO_SEARCH_PAGE):
+        self.pages = self._load_pages(Path(pages_source))
+        self.search_page_filename = Path(search_page_filename)
+        self.bytes_fetched = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_pages(pages_source: Path) -> List[bytes]:
+        if is_zipfile(pages_source):
+            with ZipFile(pages_source) as zfile:
+                names = sorted(zi.filename for zi in zfile.infolist()
+                               if not zi.is_dir() and zi.filename.endswith(".html"))
+                return [zfile.read(name) for name in names]
+        return [p.read_bytes() for p in sorted(pages_source.glob("*.html"))]
+
+    def get(self, url, *args, **kwargs) -> MockResponse:
+        u = urlparse(url)
+        if u.path.startswith(self._RESULTS_PATH):
+            page = int(parse_qs(u.query).get("page", ["1"])[-1])
+            content = self.pages[(page - 1) % len(self.pages)]
+        else:
+            content = self.search_page_filename.read_bytes()
+        with self._lock:
+            self.bytes_fetched += len(content)
+        return MockResponse(url, content)
+
+    async def get_async(self, url, *args, **kwargs) -> MockResponse:
+        return self.get(url)
+
+
+class _RssSampler:
+    """Samples the resident set size of the process in a background thread
+    and keeps the peak. Falls back to the (process lifetime) max RSS where
+    /proc is not available.
+    """
+    _STATM = Path("/proc/self/statm")
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @classmethod
+    def current_rss(cls) -> int:
+        try:
+            return int(cls._STATM.read_text().split()[1]) * resource.getpagesize()
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_rss())
+
+
+@functools.lru_cache(maxsize=None)
+def _otokuna_hash() -> str:
+    """Hash of the files (sources and data) of the otokuna package used by the handlers."""
+    import otokuna
+    package_dir = Path(otokuna.__file__).parent
+    hasher = hashlib.sha256()
+    for path in sorted(package_dir.rglob("*")):
+        if path.is_file() and "__pycache__" not in path.parts:
+            hasher.update(str(path.relative_to(package_dir)).encode())
+            hasher.update(path.read_bytes())
+    return hasher.hexdigest()
+
+
+class StageCache:
+    """Caches the output events of stages in a folder, keyed by a hash of the
+    stage name, the input event, the handler source code and the otokuna
+    package files (so the cached stages are invalidated by changes to the
+    library too).
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(stage: str, event: Dict, handler: Callable) -> str:
+        try:
+            source = inspect.getsource(inspect.getmodule(handler))
+        except (OSError, TypeError):
+            source = handler.__qualname__
+        payload = json.dumps([stage, event, source, _otokuna_hash()], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key) -> Optional[Dict]:
+        path = self.cache_dir / f"{key}.json"
+        return json.loads(path.read_text()) if path.exists() else None
+
+    def put(self, key, output: Dict):
+        (self.cache_dir / f"{key}.json").write_text(json.dumps(output, ensure_ascii=False))
+
+
+def _get_path(data, path: str, context: Optional[Dict] = None):
+    """Resolve a (simple) JSONPath like "$", "$.a.b" or "$$.Map.Item.Value"."""
+    if path.startswith("$$"):
+        data, path = context, path[1:]
+    if path == "$":
+        return data
+    for part in path[2:].split("."):
+        data = data[part]
+    return data
+
+
+def _set_path(data: Dict, path: str, value) -> Dict:
+    if path == "$":
+        return value
+    target = data
+    *parents, last = path[2:].split(".")
+    for part in parents:
+        target = target.setdefault(part, {})
+    target[last] = value
+    return data
+
+
+def _apply_parameters(parameters: Dict, data, context: Dict) -> Dict:
+    return {
+        (key[:-2] if key.endswith(".$") else key): (_get_path(data, value, context) if key.endswith(".$") else value)
+        for key, value in parameters.items()
+    }
+
+
+class StateMachineRunner:
+    """Executes a Step Functions definition (Task and Map states) in-process.
+
+    :param handlers: A dict mapping function names (as referenced by the
+        Resource of each Task) to handler callables with signature (event, context).
+    :param s3: Optional LocalS3 whose bytes counters are reported per stage.
+    :param suumo: Optional MockSuumo whose bytes counter is reported per stage.
+    :param cache: Optional StageCache to skip stages whose output is cached.
+    :param max_workers: Maximum number of parallel branches of Map states.
+        If None, the MaxConcurrency of the state is used (unlimited if 0).
+    """
+
+    def __init__(self, handlers: Dict[str, Callable], s3: Optional[LocalS3] = None,
+                 suumo: Optional[MockSuumo] = None, cache: Optional[StageCache] = None,
+                 max_workers: Optional[int] = None):
+        self.handlers = handlers
+        self.s3 = s3
+        self.suumo = suumo
+        self.cache = cache
+        self.max_workers = max_workers
+        self.stats = []
+        self._stats_lock = threading.Lock()
+
+    def _counters(self):
+        return (
+            self.s3.bytes_read if self.s3 else 0,
+            self.s3.bytes_written if self.s3 else 0,
+            self.suumo.bytes_fetched if self.suumo else 0,
+        )
+
+    def _record(self, **stats):
+        with self._stats_lock:
+            self.stats.append(stats)
+
+    def run(self, definition: Dict, event: Dict, prefix: str = "") -> Dict:
+        states = definition["States"]
+        name = definition["StartAt"]
+        while True:
+            state = states[name]
+            stage = f"{prefix}{name}"
+            start = time.perf_counter()
+            counters_before = self._counters()
+            with _RssSampler() as rss:
+                if state["Type"] == "Task":
+                    event, cached = self._run_task(state, event, stage)
+                elif state["Type"] == "Map":
+                    event, cached = self._run_map(state, event, stage), False
+                else:
+                    raise NotImplementedError(f"Unsupported state type: {state['Type']}")
+            # Inner stages of Map states run in parallel, so their bytes
+            # counters overlap and are only reported on the Map state.
+            bytes_read, bytes_written, bytes_fetched = (
+                after - before for after, before in zip(self._counters(), counters_before)
+            ) if not prefix else (None, None, None)
+            self._record(stage=stage, type=state["Type"], cached=cached,
+                         wall_time_s=time.perf_counter() - start, peak_rss_bytes=rss.peak,
+                         bytes_read=bytes_read, bytes_written=bytes_written,
+                         bytes_fetched=bytes_fetched)
+            if state.get("End"):
+                return event
+            name = state["Next"]
+
+    def _run_task(self, state, event, stage):
+        function_name = state["Resource"]["Fn::GetAtt"][0]
+        handler = self.handlers[function_name]
+        key = None
+        if self.cache is not None:
+            key = StageCache.make_key(stage, event, handler)
+            output = self.cache.get(key)
+            if output is not None:
+                return output, True
+        output = handler(event, None)
+        if self.cache is not None:
+            self.cache.put(key, output)
+        return output, False
+
+    def _run_map(self, state, event, stage):
+        items = _get_path(event, state.get("ItemsPath", "$"))
+        parameters = state.get("Parameters")
+
+        def run_item(index_item):
+            index, item = index_item
+            context = {"Map": {"Item": {"Index": index, "Value": item}}}
+            item_input = _apply_parameters(parameters, event, context) if parameters else item
+            return self.run(state["Iterator"], item_input, prefix=f"{stage}[{index}]/")
+
+        max_workers = self.max_workers or state.get("MaxConcurrency") or len(items) or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(run_item, enumerate(items)))
+        return _set_path(event, state.get("ResultPath", "$"), results)
+
+
+def _resolve_self_refs(value, document):
+    """Resolves ${self:a.b} references of a serverless.yml string value."""
+    def replace(match):
+        return str(_get_path(document, f"$.{match.group(1)}"))
+    return re.sub(r"\$\{self:([\w.]+)\}", replace, value) if isinstance(value, str) else value
+
+
+def load_serverless(filename=HERE / "serverless.yml"):
+    """Loads the state machines definitions, the handlers and the
+    environment variables of the functions from a serverless.yml.
+    """
+    with open(filename) as file:
+        document = yaml.safe_load(file)
+
+    def import_handler(handler):
+        module_name, function_name = handler.rsplit(".", 1)
+        return getattr(importlib.import_module(module_name), function_name)
+
+    handlers = {name: import_handler(spec["handler"]) for name, spec in document["functions"].items()}
+    environment = {}
+    for spec in document["functions"].values():
+        environment.update({key: _resolve_self_refs(value, document)
+                            for key, value in spec.get("environment", {}).items()})
+    definitions = {name: spec["definition"]
+                   for name, spec in document["stepFunctions"]["stateMachines"].items()}
+    return definitions, handlers, environment
+
+
+@contextlib.contextmanager
+def patched_services(s3: LocalS3, suumo: Optional[MockSuumo]):
+    """Patches boto3 (S3 only) and the HTTP clients used by the handlers."""
+    def client(service_name, *args, **kwargs):
+        if service_name != "s3":
+            raise NotImplementedError(f"Service not available locally: {service_name}")
+        return s3
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch("boto3.client", client))
+        stack.enter_context(mock.patch("boto3.resource", client))
+        if suumo is not None:
+            stack.enter_context(mock.patch("requests.get", suumo.get))
+            stack.enter_context(mock.patch("asks.get", suumo.get_async))
+        yield
+
+
+def format_report(stats: List[Dict]) -> str:
+    def fmt_bytes(n):
+        if n is None:
+            return "-"
+        return f"{n / 2 ** 20:.1f} MiB" if n >= 2 ** 20 else f"{n / 2 ** 10:.1f} KiB"
+
+    lines = [f"{'stage':<40} {'cached':>6} {'wall time':>10} {'peak RSS':>12} "
+             f"{'S3 read':>12} {'S3 written':>12} {'fetched':>12}"]
+    for s in stats:
+        lines.append(f"{s['stage']:<40} {'yes' if s['cached'] else 'no':>6} {s['wall_time_s']:>9.2f}s "
+                     f"{fmt_bytes(s['peak_rss_bytes']):>12} {fmt_bytes(s['bytes_read']):>12} "
+                     f"{fmt_bytes(s['bytes_written']):>12} {fmt_bytes(s['bytes_fetched']):>12}")
+    return "\n".join(lines)
+
+
+def main(args):
+    definitions, handlers, environment = load_serverless(args.serverless_file)
+    storage_dir = Path(args.storage_dir)
+    s3 = LocalS3(storage_dir / "s3")
+    s3.create_bucket(Bucket=args.bucket)
+    suumo = MockSuumo(args.suumo_pages, args.suumo_search_page) if args.suumo_pages else None
+    cache = None if args.no_cache else StageCache(storage_dir / "stage_cache")
+
+    # Variables already set take precedence (e.g. to point MODEL_PATH elsewhere)
+    for key, value in environment.items():
+        os.environ.setdefault(key, value)
+    os.environ["OUTPUT_BUCKET"] = args.bucket
+    event = json.loads(args.input)
+    runner = StateMachineRunner(handlers, s3=s3, suumo=suumo, cache=cache, max_workers=args.max_workers)
+    with patched_services(s3, suumo):
+        output = runner.run(definitions[args.state_machine], event)
+
+    print(format_report(runner.stats))
+    if args.report_filename:
+        with open(args.report_filename, "w") as file:
+            json.dump({"output": output, "stages": runner.stats}, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a state machine of serverless.yml locally")
+    parser.add_argument("state_machine", help="State machine name (e.g. PredictDailyMachine)")
+    parser.add_argument("--input", default="{}", help="Input event (JSON string)")
+    parser.add_argument("--serverless-file", default=HERE / "serverless.yml", help="serverless.yml filename")
+    parser.add_argument("--storage-dir", default="local_run", help="Folder of the S3 stand-in and stage cache")
+    parser.add_argument("--bucket", default="local-bucket", help="Name of the output bucket")
+    parser.add_argument("--suumo-pages", help="Folder or zip with the html result pages served "
+                                              "by the Suumo mock. If not given, Suumo is not mocked.")
+    parser.add_argument("--suumo-search-page", default=SUUMO_SEARCH_PAGE,
+                        help="html of the Tokyo search page served by the Suumo mock")
+    parser.add_argument("--max-workers", type=int, help="Max parallel branches of Map states")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use cached stage outputs")
+    parser.add_argument("--report-filename", help="Write the per-stage report to this JSON file")
+    main(parser.parse_args())
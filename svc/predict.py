@@ -1,24 +1,42 @@
 import io
+import json
 import os
+import time
 from pathlib import Path
 
 import boto3
 import numpy as np
 import pandas as pd
-from onnxruntime import InferenceSession
 
-from otokuna.analysis import add_address_coords, add_target_variable, df2Xy
-from otokuna.logging import setup_logger
+from otokuna.analysis import (
+    add_address_coords, add_target_variable, df2Xy, make_results_dataframe, make_top_deals, predictions_dataframe
+)
+from otokuna.inference import make_session, select_variant
+from otokuna.logging import setup_logger, stage_metrics
+from otokuna.profiling import profile_handler
 
 
-def main(event, context):
-    """Makes predictions from scraped data and stores the results in the bucket."""
+@profile_handler("predict")
+@stage_metrics("predict")
+def main(event, context, metrics):
+    """Makes predictions from scraped data and stores the results in the bucket.
+    Besides the predictions, it stores the results dataframe shown to the users
+    (the predictions joined with the scraped data, scored and sorted), and the
+    tables of the top deals by ward and by number of rooms (as JSON).
+
+    The model may be a single output model (y_pred) or a multi-quantile model,
+    whose quantiles (y_q10, y_q50, y_q90) are all predicted in the same pass.
+    If the model comes with a manifest of (optimized) variants, the fastest
+    variant that passed the accuracy check is used instead.
+    """
     logger = setup_logger("predict", include_timestamp=False, propagate=False)
 
     output_bucket = os.environ["OUTPUT_BUCKET"]
     root_key = event["root_key"]
     scraped_data_key = event["scraped_data_key"]
     prediction_data_key = str(Path(root_key) / "prediction.pickle")
+    results_data_key = str(Path(root_key) / "results.pickle")
+    top_deals_data_key = str(Path(root_key) / "top_deals.json")
     model_filename = os.environ["MODEL_PATH"]
 
     s3_client = boto3.client("s3")
@@ -26,29 +44,53 @@ def main(event, context):
     logger.info(f"Getting scraped data from: {scraped_data_key}")
     with io.BytesIO() as stream:
         s3_client.download_fileobj(Bucket=output_bucket, Key=scraped_data_key, Fileobj=stream)
+        metrics.add("bytes_read", stream.getbuffer().nbytes)
         stream.seek(0)
-        df = pd.read_pickle(stream)
+        scraped_df = pd.read_pickle(stream)
 
     # Preprocess dataframe
     logger.info(f"Preprocessing dataframe")
-    df = add_address_coords(df)
+    df = add_address_coords(scraped_df)
     df = add_target_variable(df)
     X, y = df2Xy(df.dropna())
+    metrics.add("properties", len(X))
 
     # Predict
     logger.info(f"Predicting")
-    sess = InferenceSession(model_filename)
-    onnx_out = sess.run(["predictions"], {"features": X.values.astype(np.float32)})
-    y_pred = pd.Series(onnx_out[0].squeeze(), index=y.index).rename("y_pred")
+    variant = select_variant(model_filename)
+    logger.info(f"Loading model variant {variant['name']}: {variant['filename']}")
+    start = time.perf_counter()
+    sess = make_session(variant["filename"], variant["optimization_level"])
+    model_load = time.perf_counter() - start
+    metrics.add("model_load", model_load)
+
+    features = X.values.astype(np.float32)
+    start = time.perf_counter()
+    onnx_out = sess.run(["predictions"], {"features": features})
+    inference = time.perf_counter() - start
+    metrics.add("inference", inference)
+    logger.info(f"Session created in {model_load * 1000:.1f} ms, "
+                f"predicted at {inference / max(len(X), 1) * 1e6:.2f} us/row")
     # Make dataframe with predictions and target from df **prior** to dropna
-    prediction_df = df[["y"]].join(y_pred, how="left")
+    prediction_df = df[["y"]].join(predictions_dataframe(onnx_out[0], y.index), how="left")
 
-    # Upload result to bucket
-    logger.info(f"Uploading results to: {prediction_data_key}")
-    with io.BytesIO() as stream:
-        prediction_df.to_pickle(stream, compression=None, protocol=5)
-        stream.seek(0)
-        s3_client.upload_fileobj(Fileobj=stream, Bucket=output_bucket, Key=prediction_data_key)
+    results_df = make_results_dataframe(scraped_df, prediction_df)
+
+    # Upload results to bucket
+    for key, df_ in ((prediction_data_key, prediction_df), (results_data_key, results_df)):
+        logger.info(f"Uploading results to: {key}")
+        with io.BytesIO() as stream:
+            df_.to_pickle(stream, compression=None, protocol=5)
+            stream.seek(0)
+            metrics.add("bytes_written", stream.getbuffer().nbytes)
+            s3_client.upload_fileobj(Fileobj=stream, Bucket=output_bucket, Key=key)
+
+    logger.info(f"Uploading top deals to: {top_deals_data_key}")
+    body = json.dumps(make_top_deals(results_df), ensure_ascii=False).encode("UTF-8")
+    metrics.add("bytes_written", len(body))
+    s3_client.put_object(Body=body, Bucket=output_bucket, Key=top_deals_data_key)
 
     event["prediction_data_key"] = prediction_data_key
+    event["results_data_key"] = results_data_key
+    event["top_deals_data_key"] = top_deals_data_key
     return event
@@ -4,33 +4,33 @@ import json
 import os
 
 import boto3
-import bs4
-import requests
-from otokuna.dumping import scrape_search_conditions
+from otokuna.logging import stage_metrics
+from otokuna.profiling import profile_handler
 
 
-def get_search_conditions(search_url):
-    response = requests.get(search_url)
-    soup = bs4.BeautifulSoup(response.text, "html.parser")
-    return scrape_search_conditions(soup)
-
-
-def main(event, context):
+@profile_handler("save-job-info")
+@stage_metrics("save-job-info")
+def main(event, context, metrics):
     output_bucket = os.environ["OUTPUT_BUCKET"]
     root_key = event["root_key"]
 
+    # search_conditions is scraped by the dump stage from the first results
+    # page, so no request to Suumo is necessary here.
     items_to_save = (
         "job_id", "timestamp",
-        "user_id", "search_url",
+        "user_id", "search_url", "search_conditions",
         "raw_data_key", "scraped_data_key", "prediction_data_key"
     )
     job_info = {item: event[item] for item in items_to_save}
-    job_info["search_conditions"] = get_search_conditions(event["search_url"])
+    # Optional items (e.g. added in later versions of the pipeline)
+    job_info.update({item: event[item] for item in ("results_data_key", "top_deals_data_key") if item in event})
     job_info_key = str(Path(root_key) / "job_info.json")
 
+    body = json.dumps(job_info).encode('UTF-8')
     s3 = boto3.resource('s3')
     s3_obj = s3.Object(output_bucket, job_info_key)
-    s3_obj.put(Body=(bytes(json.dumps(job_info).encode('UTF-8'))))
+    s3_obj.put(Body=body)
+    metrics.add("bytes_written", len(body))
 
     event["job_info_key"] = job_info_key
     return event
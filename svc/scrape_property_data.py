@@ -4,11 +4,14 @@ import os
 import zipfile
 
 import boto3
-from otokuna.logging import setup_logger
+from otokuna.logging import setup_logger, stage_metrics
+from otokuna.profiling import profile_handler
 from otokuna.scraping import scrape_properties_from_files, make_properties_dataframe
 
 
-def main(event, context):
+@profile_handler("scrape-property-data")
+@stage_metrics("scrape-property-data")
+def main(event, context, metrics):
     """Scrapes the property data from the zipped html data into a dataframe
     and uploads it as a pickle to the same bucket.
     """
@@ -23,18 +26,22 @@ def main(event, context):
 
     with io.BytesIO() as stream:
         s3_client.download_fileobj(Bucket=output_bucket, Key=raw_data_key, Fileobj=stream)
+        metrics.add("bytes_read", stream.getbuffer().nbytes)
         with zipfile.ZipFile(stream) as zfile:
             filenames = sorted((zi for zi in zfile.infolist()), key=lambda zi: zi.filename)
         # TODO: joblib runs in sequential even for n_jobs > 1 due to limitations
         #   of multiprocessing module in AWS Lambda
         properties = scrape_properties_from_files(filenames, stream,
                                                   logger=logger, n_jobs=1)
+        metrics.add("pages", len(filenames))
 
     df = make_properties_dataframe(properties, html_file_fetched_at, logger)
+    metrics.add("properties", len(df))
 
     with io.BytesIO() as stream:
         df.to_pickle(stream, compression=None, protocol=5)
         stream.seek(0)
+        metrics.add("bytes_written", stream.getbuffer().nbytes)
         s3_client.upload_fileobj(Fileobj=stream, Bucket=output_bucket, Key=scraped_data_key)
 
     event["scraped_data_key"] = scraped_data_key
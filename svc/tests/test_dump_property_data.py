@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 
 import boto3
 import pytest
@@ -7,16 +8,42 @@ from moto import mock_s3
 from trio.testing import trio_test
 
 import dump_property_data
+from otokuna.logging import StageMetrics
+
+DATA_DIR = Path(__file__).parent / "data"
 
 NUMBER_OF_PAGES = 22
-# Minimum content necessary to scrape the number of pages
+NUMBER_OF_RESULTS = 1085
+SEARCH_CONDITIONS = "東京都／千代田区"
+# Minimum content necessary to scrape the number of pages,
+# the number of results and the search conditions
 SEARCH_PAGE_CONTENT = f"""
+<div class="paginate_set-hit">1,085<span>件</span></div>
 <ol class="pagination-parts">
 <li><a>{NUMBER_OF_PAGES}</a></li>
 </ol>
+<p class="conditionbox-info-txt">{SEARCH_CONDITIONS}</p>
 """
 
 
+@trio_test
+async def test_get_search_summary(monkeypatch):
+    class MockResponse:
+        text = (DATA_DIR / "results_page_long_conditions.html").read_text()
+
+    async def mock_get(url, timeout=None, retries=1):
+        await trio.sleep(0)
+        return MockResponse()
+
+    monkeypatch.setattr("dump_property_data.asks.get", mock_get)
+    expected = {
+        "n_pages": 2,
+        "n_results": 391,
+        "search_conditions": "東京メトロ銀座線／虎ノ門 東京メトロ丸ノ内線／銀座 1LDK 30m2以上 オートロック",
+    }
+    assert await dump_property_data.get_search_summary("dummyurl") == expected
+
+
 # Cannot use pytest.mark.trio with moto_s3
 # See related issue: https://github.com/python-trio/pytest-trio/issues/42
 @mock_s3
@@ -56,9 +83,14 @@ async def test_main_async(batch_name, set_environ, monkeypatch):
     else:
         expected_dump_path = base_path
 
-    event_out = await dump_property_data.main_async(event, None)
+    metrics = StageMetrics("dump-property-data")
+    event_out = await dump_property_data.main_async(event, None, metrics)
     assert event_out is event
     assert event_out == event
+    assert event_out["n_pages"] == NUMBER_OF_PAGES
+    assert event_out["n_results"] == NUMBER_OF_RESULTS
+    assert event_out["search_conditions"] == SEARCH_CONDITIONS
+    assert metrics.values["pages"] == NUMBER_OF_PAGES
 
     objects = s3_client.list_objects_v2(Bucket=output_bucket)["Contents"]
     keys = []
@@ -1,3 +1,4 @@
+import pytest
 from freezegun import freeze_time
 
 import generate_base_path
@@ -23,3 +24,17 @@ def test_main_user_requested(monkeypatch):
     assert event_out["base_path"] == "jobs/someuuid/property_data"
     assert event_out["root_key"] == "jobs/someuuid"
     assert event_out["timestamp"] == 1611154415.0
+
+
+def test_main_user_requested_given_job_id():
+    job_id = "8f6d3cda-5f9f-4b8e-9c1e-2d7f0c0b5a41"
+    event = {"job_id": job_id}
+    event_out = generate_base_path.main_user_requested(event, None)
+    assert event_out["job_id"] == job_id
+    assert event_out["root_key"] == f"jobs/{job_id}"
+
+
+@pytest.mark.parametrize("job_id", ["givenuuid", "../predictions/daily", "8F6D3CDA-5F9F-4B8E-9C1E-2D7F0C0B5A41", 123])
+def test_main_user_requested_invalid_job_id(job_id):
+    with pytest.raises(ValueError, match="Invalid job_id"):
+        generate_base_path.main_user_requested({"job_id": job_id}, None)
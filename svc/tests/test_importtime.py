@@ -0,0 +1,27 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SVC_DIR = Path(__file__).parent.parent
+
+HEAVY_MODULES = {"pandas", "numpy", "onnxruntime", "joblib", "boto3", "bs4", "requests"}
+
+
+def imported_modules(module):
+    """Top-level modules imported (in a fresh interpreter) by the given module."""
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SVC_DIR,
+                            capture_output=True, text=True, check=True)
+    return {name.split(".")[0] for name in result.stdout.splitlines()}
+
+
+# The handlers of the 128 MB functions should only import what they use
+@pytest.mark.parametrize("module,allowed", [
+    ("generate_base_path", set()),
+    ("build_search_url", {"bs4", "requests"}),
+    ("save_job_info", {"boto3"}),
+])
+def test_light_handlers_imports(module, allowed):
+    assert imported_modules(module) & HEAVY_MODULES <= allowed
@@ -0,0 +1,144 @@
+import io
+
+import pytest
+
+from local_runner import LocalS3, MockSuumo, StageCache, StateMachineRunner
+
+DEFINITION = {
+    "StartAt": "First",
+    "States": {
+        "First": {
+            "Type": "Task",
+            "Resource": {"Fn::GetAtt": ["first", "Arn"]},
+            "Next": "SomeMap",
+        },
+        "SomeMap": {
+            "Type": "Map",
+            "ItemsPath": "$.items",
+            "ResultPath": "$.map_result",
+            "Parameters": {
+                "item.$": "$$.Map.Item.Value",
+                "base.$": "$.base",
+            },
+            "Iterator": {
+                "StartAt": "inner_step",
+                "States": {
+                    "inner_step": {
+                        "Type": "Task",
+                        "Resource": {"Fn::GetAtt": ["inner", "Arn"]},
+                        "End": True,
+                    },
+                },
+            },
+            "Next": "Last",
+        },
+        "Last": {
+            "Type": "Task",
+            "Resource": {"Fn::GetAtt": ["last", "Arn"]},
+            "End": True,
+        },
+    },
+}
+
+
+@pytest.fixture
+def handlers():
+    calls = []
+
+    def first(event, context):
+        calls.append("first")
+        event["base"] = "foo"
+        return event
+
+    def inner(event, context):
+        calls.append("inner")
+        event["key"] = f"{event['base']}/{event['item']}"
+        return event
+
+    def last(event, context):
+        calls.append("last")
+        event["keys"] = [result["key"] for result in event["map_result"]]
+        return event
+
+    yield {"first": first, "inner": inner, "last": last}, calls
+
+
+def test_local_s3(tmp_path):
+    s3 = LocalS3(tmp_path)
+    s3.create_bucket(Bucket="somebucket")
+    for key in ("a/b", "a/b/c", "x/y"):
+        s3.upload_fileobj(io.BytesIO(key.encode()), "somebucket", key)
+
+    contents = s3.list_objects_v2(Bucket="somebucket", Prefix="a/")["Contents"]
+    assert [obj["Key"] for obj in contents] == ["a/b", "a/b/c"]
+
+    with io.BytesIO() as stream:
+        s3.download_fileobj(Bucket="somebucket", Key="a/b/c", Fileobj=stream)
+        assert stream.getvalue() == b"a/b/c"
+    s3.Object("somebucket", "z").put(Body=b"zzz")
+    assert s3.get_object(Bucket="somebucket", Key="z")["Body"].read() == b"zzz"
+
+    s3.delete_object(Bucket="somebucket", Key="a/b")
+    assert "Contents" not in s3.list_objects_v2(Bucket="somebucket", Prefix="a/b/c/")
+    assert s3.bytes_written == 3 + 5 + 3 + 3
+    assert s3.bytes_read == 5 + 3
+
+
+def test_mock_suumo(tmp_path):
+    for page in (1, 2):
+        (tmp_path / f"page_{page:06d}.html").write_text(f"page {page}")
+    search_page = tmp_path / "search.txt"
+    search_page.write_text("search page")
+    suumo = MockSuumo(tmp_path, search_page)
+
+    url = "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030&pc=50"
+    assert suumo.get(url).text == "page 1"
+    assert suumo.get(f"{url}&page=2").text == "page 2"
+    assert suumo.get(f"{url}&page=3").text == "page 1"
+    assert suumo.get("https://suumo.jp/chintai/tokyo/city/").text == "search page"
+    assert suumo.bytes_fetched == 6 * 3 + 11
+
+
+def test_run(handlers):
+    handlers, calls = handlers
+    runner = StateMachineRunner(handlers)
+    event_out = runner.run(DEFINITION, {"items": ["a", "b", "c"]})
+
+    assert event_out["keys"] == ["foo/a", "foo/b", "foo/c"]
+    assert sorted(calls) == ["first", "inner", "inner", "inner", "last"]
+    stages = [s["stage"] for s in runner.stats]
+    assert {"First", "SomeMap", "Last", "SomeMap[0]/inner_step"} <= set(stages)
+    assert all(s["wall_time_s"] >= 0 and s["peak_rss_bytes"] > 0 for s in runner.stats)
+
+
+def test_run_cached(handlers, tmp_path):
+    handlers, calls = handlers
+    event = {"items": ["a", "b"]}
+
+    runner = StateMachineRunner(handlers, cache=StageCache(tmp_path))
+    event_out = runner.run(DEFINITION, dict(event))
+    assert len(calls) == 4
+    assert not any(s["cached"] for s in runner.stats)
+
+    # A rerun with the same input skips all the tasks
+    runner = StateMachineRunner(handlers, cache=StageCache(tmp_path))
+    assert runner.run(DEFINITION, dict(event)) == event_out
+    assert len(calls) == 4
+    assert all(s["cached"] for s in runner.stats if s["type"] == "Task")
+
+    # A different input is not taken from the cache
+    runner = StateMachineRunner(handlers, cache=StageCache(tmp_path))
+    runner.run(DEFINITION, {"items": ["a", "b", "c"]})
+    # only the new item of the map is not cached
+    assert sorted(calls[4:]) == ["first", "inner", "last"]
+
+
+def test_cache_key_depends_on_otokuna(monkeypatch):
+    def handler(event, context):
+        return event
+
+    key = StageCache.make_key("First", {"items": ["a"]}, handler)
+    assert StageCache.make_key("First", {"items": ["a"]}, handler) == key
+    # e.g. after an edit of otokuna.scraping
+    monkeypatch.setattr("local_runner._otokuna_hash", lambda: "edited")
+    assert StageCache.make_key("First", {"items": ["a"]}, handler) != key
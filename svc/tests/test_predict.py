@@ -1,11 +1,15 @@
 import io
+import json
 import os
 from pathlib import Path
 
 import boto3
+import numpy as np
 import pandas as pd
 from moto import mock_s3
 
+from otokuna.inference import make_session
+
 import predict
 
 DATA_DIR = Path(__file__).parent / "data"
@@ -20,6 +24,8 @@ def test_main(set_environ):
     os.environ["MODEL_PATH"] = model_filename
 
     expected_prediction_data_key = f"{root_key}/prediction.pickle"
+    expected_results_data_key = f"{root_key}/results.pickle"
+    expected_top_deals_data_key = f"{root_key}/top_deals.json"
 
     # Upload pickle file with scraped property data
     s3_client = boto3.client("s3")
@@ -35,13 +41,112 @@ def test_main(set_environ):
     event_out = predict.main(event, None)
     assert event_out is event
     assert event_out["prediction_data_key"] == expected_prediction_data_key
+    assert event_out["results_data_key"] == expected_results_data_key
+    assert event_out["top_deals_data_key"] == expected_top_deals_data_key
 
-    # Download predicted data pickle
-    with io.BytesIO() as stream:
-        s3_client.download_fileobj(Bucket=output_bucket, Key=expected_prediction_data_key, Fileobj=stream)
-        stream.seek(0)
-        prediction_df = pd.read_pickle(stream)
+    # Download predicted data and results pickles
+    def download_dataframe(key):
+        with io.BytesIO() as stream:
+            s3_client.download_fileobj(Bucket=output_bucket, Key=key, Fileobj=stream)
+            stream.seek(0)
+            return pd.read_pickle(stream)
 
+    prediction_df = download_dataframe(expected_prediction_data_key)
     assert tuple(prediction_df.columns) == ("y", "y_pred")
     scraped_df = pd.read_pickle(DATA_DIR / "scraped_data.pickle")
     pd.testing.assert_index_equal(prediction_df.index, scraped_df.index)
+
+    results_df = download_dataframe(expected_results_data_key)
+    assert tuple(results_df.columns[:3]) == ("monthly_cost", "monthly_cost_predicted", "otokuna_score")
+    assert set(results_df.columns[3:]) == set(scraped_df.columns)
+    assert results_df.otokuna_score.dropna().is_monotonic_decreasing
+    assert sorted(results_df.index) == sorted(scraped_df.index)
+
+    top_deals = json.loads(s3_client.get_object(Bucket=output_bucket, Key=expected_top_deals_data_key)["Body"].read())
+    assert set(top_deals["groups"]["ward"]) == set(results_df.ward.dropna().astype(str))
+    score_idx = top_deals["columns"].index("otokuna_score")
+    for rows in top_deals["groups"]["ward"].values():
+        assert 0 < len(rows) <= top_deals["n"]
+        scores = [row[score_idx] for row in rows]
+        assert scores == sorted(scores, reverse=True)
+
+
+class MultiQuantileSession:
+    """Stand-in for the session of a multi-quantile model, with the predictions
+    of the single output model scaled as the quantiles."""
+    def __init__(self, model_filename, optimization_level="all"):
+        self.sess = make_session(model_filename, optimization_level)
+
+    def run(self, output_names, input_feed):
+        predictions, = self.sess.run(output_names, input_feed)
+        return [predictions.reshape(-1, 1) * np.array([[0.8, 1.0, 1.2]], dtype=np.float32)]
+
+
+@mock_s3
+def test_main_quantiles(set_environ, monkeypatch):
+    output_bucket = os.environ["OUTPUT_BUCKET"]
+    root_key = "predictions/daily/2021-01-25T14:59:25+00:00"
+    scraped_data_key = "dumped_data/daily/2021-01-25T14:59:25+00:00/東京都.pickle"
+    os.environ["MODEL_PATH"] = "../ml/models/regressor.onnx"
+    monkeypatch.setattr("predict.make_session", MultiQuantileSession)
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(Bucket=output_bucket)
+    s3_client.upload_file(Bucket=output_bucket, Key=scraped_data_key, Filename=str(DATA_DIR / "scraped_data.pickle"))
+
+    predict.main({"root_key": root_key, "scraped_data_key": scraped_data_key}, None)
+
+    with io.BytesIO() as stream:
+        s3_client.download_fileobj(Bucket=output_bucket, Key=f"{root_key}/prediction.pickle", Fileobj=stream)
+        stream.seek(0)
+        prediction_df = pd.read_pickle(stream)
+    assert tuple(prediction_df.columns) == ("y", "y_q10", "y_q50", "y_q90", "y_pred")
+    pd.testing.assert_series_equal(prediction_df.y_pred, prediction_df.y_q50, check_names=False)
+
+    with io.BytesIO() as stream:
+        s3_client.download_fileobj(Bucket=output_bucket, Key=f"{root_key}/results.pickle", Fileobj=stream)
+        stream.seek(0)
+        results_df = pd.read_pickle(stream)
+    percentile = results_df.otokuna_percentile.dropna()
+    assert len(percentile) == results_df.monthly_cost_predicted.notna().sum()
+    assert percentile.between(0, 100).all()
+    # the more expensive than predicted, the lower the percentile
+    cheaper = results_df.monthly_cost < results_df.monthly_cost_q50
+    assert (results_df.otokuna_percentile[cheaper] > 50).all()
+    assert (results_df.otokuna_percentile[~cheaper & percentile.reindex(results_df.index).notna()] <= 50).all()
+
+
+@mock_s3
+def test_main_variant(set_environ, tmp_path, monkeypatch):
+    output_bucket = os.environ["OUTPUT_BUCKET"]
+    root_key = "predictions/daily/2021-01-25T14:59:25+00:00"
+    scraped_data_key = "dumped_data/daily/2021-01-25T14:59:25+00:00/東京都.pickle"
+    # a copy of the model as its fastest variant, after one that did not pass
+    model_bytes = Path("../ml/models/regressor.onnx").read_bytes()
+    (tmp_path / "regressor.onnx").write_bytes(model_bytes)
+    (tmp_path / "regressor.opt.onnx").write_bytes(model_bytes)
+    manifest = {"variants": [
+        {"name": "int8", "filename": "regressor.int8.onnx", "optimization_level": "all", "passed": False},
+        {"name": "opt", "filename": "regressor.opt.onnx", "optimization_level": "disable", "passed": True},
+        {"name": "default", "filename": "regressor.onnx", "optimization_level": "all", "passed": True},
+    ]}
+    (tmp_path / "regressor.manifest.json").write_text(json.dumps(manifest))
+    os.environ["MODEL_PATH"] = str(tmp_path / "regressor.onnx")
+
+    loaded = []
+
+    def make_session_(filename, optimization_level="all"):
+        loaded.append((filename, optimization_level))
+        return make_session(filename, optimization_level)
+
+    monkeypatch.setattr("predict.make_session", make_session_)
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(Bucket=output_bucket)
+    s3_client.upload_file(Bucket=output_bucket, Key=scraped_data_key, Filename=str(DATA_DIR / "scraped_data.pickle"))
+
+    event = predict.main({"root_key": root_key, "scraped_data_key": scraped_data_key}, None)
+
+    assert loaded == [(str(tmp_path / "regressor.opt.onnx"), "disable")]
+    assert event["metrics"]["predict"]["model_load"] > 0
+    assert event["metrics"]["predict"]["inference"] > 0
@@ -1,18 +1,14 @@
 import json
 import os
-from pathlib import Path
 
 import boto3
 from moto import mock_s3
-from otokuna.testing import build_mock_requests_get
 
 import save_job_info
 
-DATA_DIR = Path(__file__).parent / "data"
-
 
 @mock_s3
-def test_main(set_environ, monkeypatch):
+def test_main(set_environ):
     output_bucket = os.environ["OUTPUT_BUCKET"]
 
     job_id = "someuuid"
@@ -23,13 +19,10 @@ def test_main(set_environ, monkeypatch):
     raw_data_key = f"jobs/{job_id}/property_data.zip"
     scraped_data_key = f"jobs/{job_id}/property_data.pickle"
     prediction_data_key = f"jobs/{job_id}/prediction.pickle"
+    results_data_key = f"jobs/{job_id}/results.pickle"
+    top_deals_data_key = f"jobs/{job_id}/top_deals.json"
 
-    expected_search_conditions = "東京メトロ銀座線／虎ノ門 東京メトロ丸ノ内線／銀座 1LDK 30m2以上 オートロック"
-
-    html_files_by_url = {
-        search_url: DATA_DIR / "results_page_long_conditions.html"
-    }
-    monkeypatch.setattr("save_job_info.requests.get", build_mock_requests_get(html_files_by_url))
+    search_conditions = "東京メトロ銀座線／虎ノ門 東京メトロ丸ノ内線／銀座 1LDK 30m2以上 オートロック"
 
     event = {
         "root_key": root_key,
@@ -37,9 +30,12 @@ def test_main(set_environ, monkeypatch):
         "timestamp": timestamp,
         "user_id": user_id,
         "search_url": search_url,
+        "search_conditions": search_conditions,
         "raw_data_key": raw_data_key,
         "scraped_data_key": scraped_data_key,
         "prediction_data_key": prediction_data_key,
+        "results_data_key": results_data_key,
+        "top_deals_data_key": top_deals_data_key,
     }
 
     s3_client = boto3.client('s3')
@@ -52,10 +48,12 @@ def test_main(set_environ, monkeypatch):
         "timestamp": timestamp,
         "user_id": user_id,
         "search_url": search_url,
-        "search_conditions": expected_search_conditions,
+        "search_conditions": search_conditions,
         "raw_data_key": raw_data_key,
         "scraped_data_key": scraped_data_key,
         "prediction_data_key": prediction_data_key,
+        "results_data_key": results_data_key,
+        "top_deals_data_key": top_deals_data_key,
     }
 
     expected_job_info_key = f"jobs/{job_id}/job_info.json"
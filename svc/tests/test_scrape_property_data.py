@@ -31,6 +31,10 @@ def test_main(set_environ):
     event_out = scrape_property_data.main(event, None)
     assert event_out is event
     assert event_out["scraped_data_key"] == scraped_data_key
+    metrics = event_out["metrics"]["scrape-property-data"]
+    assert metrics["pages"] == 2
+    assert metrics["properties"] == 202
+    assert metrics["bytes_read"] == (DATA_DIR / "raw_data.zip").stat().st_size
 
     # Download pickle and compare
     expected_df = pd.read_pickle(DATA_DIR / "scraped_data.pickle")
@@ -4,7 +4,8 @@ import zipfile
 
 import boto3
 
-from otokuna.logging import setup_logger
+from otokuna.logging import setup_logger, stage_metrics
+from otokuna.profiling import profile_handler
 
 
 def remove_prefix(s, prefix):
@@ -31,7 +32,9 @@ def build_zipinfo(zfile, filename, date_time):
     return zinfo
 
 
-def main(event, context):
+@profile_handler("zip-property-data")
+@stage_metrics("zip-property-data")
+def main(event, context, metrics):
     """Download objects from the base_path "folder" and upload them as a zip file.
 
     Objects with a key equal to the "folder" (with and without ending in "/"),
@@ -86,8 +89,11 @@ def main(event, context):
                 zinfo = build_zipinfo(zfile, filename, date_time)
                 with zfile.open(zinfo, "w") as zarc:
                     s3_client.download_fileobj(Bucket=output_bucket, Key=key, Fileobj=zarc)
+                metrics.add("pages")
+                metrics.add("bytes_read", obj["Size"])
 
         stream.seek(0)
+        metrics.add("bytes_written", stream.getbuffer().nbytes)
         logger.info(f"Uploading {raw_data_key}")
         s3_client.upload_fileobj(Fileobj=stream, Bucket=output_bucket, Key=raw_data_key)
 